@@ -0,0 +1,238 @@
+'''
+microbenchmarks for the hot paths in lib/
+
+run from the repository root:
+python -m benchmarks.bench_lib # print results as json
+python benchmarks/bench_lib.py # the same
+python -m benchmarks.bench_lib --save benchmarks/baseline.json
+python -m benchmarks.bench_lib --compare benchmarks/baseline.json
+python -m benchmarks.bench_lib -k scale # only benchmarks matching 'scale'
+
+per benchmark it reports
+ops_per_sec: best of --repeat timed runs
+peak_kib: most traced memory held at once during a run with the garbage
+          collector off, above what was held before; temporaries count
+          here, so code churning through arrays shows up even when it
+          frees everything
+cycle_blocks_per_op: blocks a run leaves allocated with the collector off,
+                     per op: leaks and garbage only the collector frees
+cpython has no count of allocations made and freed again, see peak_kib
+--compare exits with status 1 when any ops_per_sec drops by more than
+--threshold (a fraction) against the baseline
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+if not __package__: # run as a script, lib is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from lib.notes import (Note, Interval, Scale, Chord, NOTES, SCALE_PATTERNS,
+                       get_scale)
+from lib.fret import get_fret
+
+NAMES = ['C', 'C#', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'Gb', 'G', 'Ab', 'A',
+         'Bb', 'B', 'Cb', 'E#', 'Bbb']
+CHORDS = [['C', 'E', 'G'], ['A', 'C', 'E'], ['B', 'D', 'F'],
+          ['E', 'G', 'C'], ['G', 'B', 'D', 'F'], ['D', 'F', 'A', 'C'],
+          ['C', 'F', 'G'], ['F#', 'C', 'E', 'G']]
+
+################## benchmarks ##################
+'''
+each benchmark returns (function, ops per call)
+setup is done outside the returned function
+'''
+def bench_note_from_name():
+    names = NAMES
+    def run():
+        for n in names:
+            Note(n)
+    return run, len(names)
+
+def bench_note_from_int():
+    reps = list(range(-24, 24))
+    def run():
+        for n in reps:
+            Note(n)
+    return run, len(reps)
+
+def bench_note_add_interval():
+    notes = [Note(n) for n in NOTES]
+    intervals = [Interval(i) for i in range(12)]
+    def run():
+        for n in notes:
+            for i in intervals:
+                n + i
+    return run, len(notes) * len(intervals)
+
+def bench_note_sub():
+    notes = [Note(n) for n in NOTES]
+    def run():
+        for a in notes:
+            for b in notes:
+                a - b
+    return run, len(notes) ** 2
+
+def bench_interval_add():
+    intervals = [Interval(i) for i in range(-12, 13)]
+    def run():
+        for a in intervals:
+            for b in intervals:
+                a + b
+    return run, len(intervals) ** 2
+
+def bench_scale_construct():
+    modes = list(SCALE_PATTERNS)
+    def run():
+        for root in NOTES:
+            for mode in modes:
+                Scale(root, mode=mode)
+    return run, len(NOTES) * len(modes)
+
+def bench_get_scale():
+    modes = list(SCALE_PATTERNS)
+    get_scale('C')
+    def run():
+        for root in NOTES:
+            for mode in modes:
+                get_scale(root, mode=mode)
+    return run, len(NOTES) * len(modes)
+
+def bench_scale_chord():
+    scales = [get_scale(root, mode=mode)
+              for root in NOTES for mode in SCALE_PATTERNS]
+    def run():
+        for scale in scales:
+            for degree in range(1, 8):
+                scale.chord(degree)
+    return run, len(scales) * 7
+
+def bench_chord_identify():
+    chords = [[Note(n) for n in c] for c in CHORDS]
+    def run():
+        for notes in chords:
+            Chord(notes)
+    return run, len(chords)
+
+def bench_get_fret():
+    chords = [Chord(c) for c in CHORDS]
+    get_fret(chords[0]) # build or load the voicing index
+    def run():
+        for chord in chords:
+            get_fret(chord)
+    return run, len(chords)
+
+BENCHMARKS = dict((name[len('bench_'):], f)
+                  for name, f in sorted(globals().items())
+                  if name.startswith('bench_'))
+
+################## measurement ##################
+def measure(make, min_time=0.2, repeat=5):
+    run, ops = make()
+    # calibrate the number of calls per timed run
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10:
+            break
+        calls *= 2
+    calls = max(1, int(calls * min_time / max(elapsed * 10, 1e-9)))
+
+    best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(calls):
+                run()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        blocks = sys.getallocatedblocks()
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+
+    return {'ops_per_sec': calls * ops / best,
+            'ns_per_op': best / (calls * ops) * 1e9,
+            'peak_kib': (peak - start) / 1024,
+            'cycle_blocks_per_op': blocks / ops}
+
+def run_benchmarks(pattern=None, min_time=0.2, repeat=5):
+    results = {}
+    for name, make in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(make, min_time, repeat)
+    return {'meta': {'python': sys.version.split()[0],
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+def compare(current, baseline, threshold=0.1):
+    '''
+    print current against baseline, returns names that got slower
+    by more than threshold
+    '''
+    regressions = []
+    print('{:<20} {:>14} {:>14} {:>8}'.format(
+        'benchmark', 'baseline op/s', 'current op/s', 'ratio'))
+    for name, res in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print('{:<20} {:>14} {:>14.0f} {:>8}'.format(
+                name, '-', res['ops_per_sec'], 'new'))
+            continue
+        ratio = res['ops_per_sec'] / base['ops_per_sec']
+        flag = ''
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = ' SLOWER'
+        print('{:<20} {:>14.0f} {:>14.0f} {:>8.2f}{}'.format(
+            name, base['ops_per_sec'], res['ops_per_sec'], ratio, flag))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="lib/ microbenchmarks")
+    parser.add_argument('-k', type=str, default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', type=str, default=None,
+                        help='write results to this json file')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='baseline json file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.k, args.min_time, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(current, baseline, args.threshold) else 0)
+    if not args.save:
+        print(json.dumps(current, indent=2))
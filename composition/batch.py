@@ -0,0 +1,263 @@
+'''
+render many scores at once in a pool of worker processes
+
+every job gets its own scratch directory, so concurrent renders never
+touch each other's files; artifacts land in out_dir as <job name>.<ext>
+
+renderers turn LilyPond source into artifacts inside a scratch dir:
+LilyRenderer: lilypond (ps2pdf, timidity), through render_cache.py
+NativeRenderer: midi.py and synth.py, no external tools
+StubRenderer: writes placeholder files, for testing the engine
+
+example usage:
+jobs = song_jobs() + practice_jobs(100)
+results = render_batch(jobs, 'output/batch', LilyRenderer(), workers=4)
+
+from the command line:
+python batch.py output/batch --songs --practice 100 --renderer native
+'''
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import simple
+from lily import parse_score
+from midi import write_midi
+from synth import write_wav
+from render_cache import RenderCache, CACHE_DIR, run_tools
+
+class Job:
+    '''a named score, source is the LilyPond text'''
+    def __init__(self, name, source, artifacts=('pdf', 'midi')):
+        self.name = name
+        self.source = source
+        self.artifacts = tuple(artifacts)
+
+class JobTimeout(Exception):
+    pass
+
+def capture_score(fn, *args, **kwargs):
+    '''LilyPond source that fn prints through simple.main'''
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        fn(*args, **kwargs)
+    return buf.getvalue()
+
+def score_job(name, fn, *args, **kwargs):
+    return Job(name, capture_score(fn, *args, **kwargs))
+
+def song_jobs():
+    '''variation_idea0 over every song in simple.py'''
+    songs = [simple.pagnini24, simple.shengmusong, simple.changtingwai,
+             simple.suoluohe]
+    return [score_job(song.__name__, simple.variation_idea0, **song())
+            for song in songs]
+
+def practice_source(seed, index):
+    '''LilyPond source of practice sheet index in the batch from seed'''
+    return capture_score(simple.practice0, rng=simple.sheet_rng(seed, index))
+
+def _practice_chunk(seed, start, stop):
+    return [practice_source(seed, i) for i in range(start, stop)]
+
+def practice_jobs(n, seed=0, workers=None, chunk=500):
+    '''
+    n practice0 sheets; sheet i only depends on (seed, i), see
+    simple.sheet_rng, so it is the same whatever workers is
+    workers: processes generating chunk sheets at a time, os.cpu_count()
+             if None
+    '''
+    bounds = [(seed, a, min(a + chunk, n)) for a in range(0, n, chunk)]
+    workers = min(workers or os.cpu_count(), len(bounds))
+    if workers <= 1:
+        chunks = [_practice_chunk(*b) for b in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_practice_chunk, *zip(*bounds)))
+    return [Job('practice{:04d}'.format(i), source)
+            for i, source in enumerate(itertools.chain(*chunks))]
+
+################## renderers ##################
+class LilyRenderer:
+    '''
+    lilypond for pdf and midi, timidity for wav
+    cache_dir: share renders through a RenderCache, None to always run
+    '''
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def __call__(self, source, work_dir, artifacts, timeout=None):
+        if self.cache_dir is None:
+            return run_tools(source, work_dir, artifacts, timeout)
+        cache = RenderCache(self.cache_dir)
+        return cache.render(source, work_dir, 'render', artifacts, timeout)
+
+class NativeRenderer:
+    '''midi.py for midi and synth.py for wav, pdf is not supported'''
+    def __call__(self, source, work_dir, artifacts, timeout=None):
+        staffs, meta = parse_score(source)
+        paths = {}
+        for ext in artifacts:
+            path = os.path.join(work_dir, 'render.' + ext)
+            if ext == 'midi':
+                write_midi(path, staffs, **meta)
+            elif ext == 'wav':
+                write_wav(path, staffs, meta.get('tempo', '4=140'))
+            else:
+                raise ValueError("native renderer can not write " + ext)
+            paths[ext] = path
+        return paths
+
+class StubRenderer:
+    '''
+    stands in for lilypond: writes the source into every artifact
+    delay: seconds each render takes, fail: job sources containing this
+    string raise, to exercise error handling
+    '''
+    def __init__(self, delay=0, fail=None):
+        self.delay = delay
+        self.fail = fail
+
+    def __call__(self, source, work_dir, artifacts, timeout=None):
+        time.sleep(self.delay)
+        if self.fail is not None and self.fail in source:
+            raise RuntimeError("stub failure")
+        paths = {}
+        for ext in artifacts:
+            paths[ext] = os.path.join(work_dir, 'render.' + ext)
+            with open(paths[ext], 'w') as f:
+                f.write(source)
+        return paths
+
+################## engine ##################
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+def run_job(job, out_dir, renderer, timeout=None, scratch_root=None):
+    '''
+    render one job in a fresh scratch dir, move the artifacts to out_dir
+    returns a result dict: name, ok, seconds, paths, error
+    '''
+    start = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix=job.name + '.', dir=scratch_root)
+    result = {'name': job.name, 'ok': False, 'paths': {}, 'error': None}
+    if timeout:
+        handler = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        files = renderer(job.source, work_dir, job.artifacts, timeout)
+        for ext, path in files.items():
+            dest = os.path.join(out_dir, '{}.{}'.format(job.name, ext))
+            shutil.move(path, dest)
+            result['paths'][ext] = dest
+        result['ok'] = True
+    except JobTimeout:
+        result['error'] = 'timeout after {}s'.format(timeout)
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def _progress(done, total, result, start, stream):
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0
+    eta = (total - done) / rate if rate else 0
+    stream.write('[{}/{}] {} {} {:.2f}s | {:.1f} jobs/s, eta {:.0f}s\n'.format(
+        done, total, result['name'], 'ok' if result['ok'] else
+        'FAILED ' + result['error'], result['seconds'], rate, eta))
+
+def report(results, wall):
+    '''summary of a batch: counts, throughput and job times'''
+    seconds = [r['seconds'] for r in results]
+    failed = [r for r in results if not r['ok']]
+    return {'jobs': len(results), 'ok': len(results) - len(failed),
+            'failed': len(failed),
+            'timeouts': sum(r['error'].startswith('timeout') for r in failed),
+            'wall_seconds': wall,
+            'jobs_per_second': len(results) / wall if wall else 0,
+            'mean_job_seconds': float(np.mean(seconds)) if seconds else 0,
+            'max_job_seconds': max(seconds) if seconds else 0}
+
+def render_batch(jobs, out_dir, renderer=None, workers=None, timeout=60,
+                 progress=sys.stderr, scratch_root=None):
+    '''
+    render jobs with at most workers processes (os.cpu_count() if None,
+    1 renders in this process), each job limited to timeout seconds
+    returns (results in job order, report)
+    progress: stream for one line per finished job, None for quiet
+    '''
+    renderer = LilyRenderer() if renderer is None else renderer
+    names = [job.name for job in jobs]
+    assert len(set(names)) == len(names), "job names must be unique"
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+
+    start = time.perf_counter()
+    results = {}
+    def finish(result):
+        results[result['name']] = result
+        if progress is not None:
+            _progress(len(results), len(jobs), result, start, progress)
+
+    if workers == 1:
+        for job in jobs:
+            finish(run_job(job, out_dir, renderer, timeout, scratch_root))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_job, job, out_dir, renderer, timeout,
+                                   scratch_root) for job in jobs]
+            for future in as_completed(futures):
+                finish(future.result())
+    results = [results[name] for name in names]
+    return results, report(results, time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="batch score renderer")
+    parser.add_argument('out_dir', type=str)
+    parser.add_argument('--songs', action='store_true',
+                        help='variation_idea0 of every song')
+    parser.add_argument('--practice', type=int, default=0,
+                        help='number of practice0 sheets')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='practice sheet i is generated from (seed, i)')
+    parser.add_argument('--renderer', choices=['lily', 'native', 'stub'],
+                        default='lily')
+    parser.add_argument('--artifacts', type=str, default=None,
+                        help='comma separated, eg. pdf,midi,wav')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse renders through render_cache.py')
+    args = parser.parse_args()
+
+    jobs = (song_jobs() if args.songs else []) +\
+        practice_jobs(args.practice, args.seed, args.workers)
+    if args.renderer == 'native':
+        renderer, artifacts = NativeRenderer(), ('midi', 'wav')
+    elif args.renderer == 'stub':
+        renderer, artifacts = StubRenderer(), ('pdf', 'midi')
+    else:
+        renderer = LilyRenderer(CACHE_DIR if args.cache else None)
+        artifacts = ('pdf', 'midi')
+    if args.artifacts:
+        artifacts = tuple(args.artifacts.split(','))
+    for job in jobs:
+        job.artifacts = artifacts
+
+    results, summary = render_batch(jobs, args.out_dir, renderer,
+                                    args.workers, args.timeout)
+    for k, v in summary.items():
+        print('{}: {}'.format(k, round(v, 3) if type(v) is float else v))
@@ -0,0 +1,134 @@
+'''
+LilyPond chordmode symbols -> the pitches they sound
+
+root[octave marks][:modifiers][^removals][/bass or /+bass], eg.
+"c", "cis':m7", "f,:6^5", "e,:m6-^5", "g:7.9-", "d:m/a", "c:maj7/+b"
+
+modifiers: an optional quality (m, min, maj, dim, aug, sus) directly
+followed by an extension (5, 6, 7, 9, 11, 13, 2, 4), then more steps
+after '.'; a step can be altered with + or -, like 5- or 9+
+removals: steps after ^, eg. ^3.5
+roots sound an octave up as in chordmode: c is c'
+
+example usage:
+chord_pitches("d:m/a") # (9, 14, 17), see pitch.py for the numbers
+resolve_chord_mode("g:7") # "<g' b' d'' f''>"
+pitches, counts = chord_pitch_array(['c', 'g:7', 'a:m'])
+'''
+import re
+from functools import lru_cache
+import numpy as np
+from pitch import note2number, number2note
+from score import REST
+
+ROOT = r"[a-g](?:isis|eses|is|es|s)?[',]*"
+SYMBOL = re.compile(r"({root})(?::([^\^/]*))?(?:\^([\d.]+))?"
+                    r"(?:/(\+?)({root}))?".format(root=ROOT))
+FIRST_STEP = re.compile(r"(m|min|maj|dim|aug|sus)?(\d+)?([+-]?)(?:sus(\d)?)?")
+STEP = re.compile(r"(\d+)([+-]?)")
+
+# semitones of each chord step above the root, 7 is the minor seventh
+# as in chordmode, maj raises it
+STEPS = {1: 0, 2: 2, 3: 4, 4: 5, 5: 7, 6: 9, 7: 10, 9: 14, 11: 17, 13: 21}
+TRIAD = {1: 0, 3: 0, 5: 0} # step -> alteration
+MAX_NOTES = 8 # longest chord, for chord_pitch_array
+
+def split_chord(symbol):
+    '''"cis':m7/e" -> ("cis'", ":m7/e"), the root and everything after'''
+    m = re.match(ROOT, symbol)
+    assert m is not None, "chord symbol without a root {}".format(symbol)
+    return symbol[:m.end()], symbol[m.end():]
+
+def _alteration(sign):
+    return {'': 0, '+': 1, '-': -1}[sign]
+
+def chord_steps(modifiers, removals=''):
+    '''":m6-", "5" -> {1: 0, 3: -1, 6: -1}, step -> alteration'''
+    steps = dict(TRIAD)
+    items = modifiers.split('.') if modifiers else []
+    quality = None
+    if items:
+        m = FIRST_STEP.fullmatch(items[0])
+        assert m is not None, "have unparsed chord modifier {}".format(items[0])
+        quality, extension, sign, sus = m.groups()
+        if extension is not None:
+            n = int(extension)
+            assert n in STEPS, "unknown chord step {}".format(n)
+            if n >= 7 and n % 2: # stack thirds up to n, 13 skips the 11
+                for k in range(7, n + 1, 2):
+                    if not (n == 13 and k == 11):
+                        steps[k] = 0
+            else:
+                steps[n] = 0
+            steps[n] += _alteration(sign)
+        if sus is not None:
+            steps[int(sus)] = 0
+        if sus is not None or quality == 'sus':
+            steps.pop(3)
+        items = items[1:]
+    for item in items:
+        m = STEP.fullmatch(item)
+        assert m is not None, "have unparsed chord step {}".format(item)
+        n = int(m.group(1))
+        assert n in STEPS, "unknown chord step {}".format(n)
+        steps[n] = steps.get(n, 0) + _alteration(m.group(2))
+
+    if quality in ['m', 'min'] and 3 in steps:
+        steps[3] -= 1
+    elif quality == 'maj':
+        steps[7] = steps.get(7, 0) + 1
+    elif quality == 'dim':
+        for k, a in [(3, -1), (5, -1), (7, -1)]:
+            if k in steps:
+                steps[k] += a
+    elif quality == 'aug':
+        steps[5] += 1
+
+    for item in removals.split('.') if removals else []:
+        steps.pop(int(item), None)
+    return steps
+
+@lru_cache(maxsize=4096)
+def chord_pitches(symbol):
+    '''chord symbol -> sorted tuple of absolute numbers, bass first'''
+    m = SYMBOL.fullmatch(symbol)
+    assert m is not None, "have unparsed chord symbol {}".format(symbol)
+    root, modifiers, removals, added, bass = m.groups()
+    n = note2number(root) + 12 # chordmode octave
+    steps = chord_steps(modifiers or '', removals or '')
+    pitches = sorted(n + STEPS[k] + a for k, a in steps.items())
+    if bass:
+        b = note2number(bass)
+        if not added: # an inversion takes the tone out of the chord
+            pitches = [p for p in pitches if (p - b) % 12 != 0]
+        low = min(pitches)
+        pitches.insert(0, low - ((low - b) % 12 or 12))
+    return tuple(pitches)
+
+def resolve_chord_mode(symbol):
+    '''chord symbol -> chord note string, eg. "d:m/a" -> "<a d' f'>"'''
+    return '<' + ' '.join(number2note(p) for p in chord_pitches(symbol)) + '>'
+
+################## bulk ##################
+def chord_pitch_array(symbols):
+    '''
+    many symbols at once: (pitches, counts), pitches is an int16
+    (n, MAX_NOTES) array padded with REST after counts[i] notes
+    '''
+    chords = [chord_pitches(s) for s in symbols]
+    counts = np.array([len(c) for c in chords], dtype=np.int64)
+    assert (counts <= MAX_NOTES).all(), "chord longer than MAX_NOTES"
+    pitches = np.full((len(chords), MAX_NOTES), REST, dtype=np.int16)
+    flat = np.fromiter((p for c in chords for p in c), dtype=np.int16,
+                       count=int(counts.sum()))
+    rows = np.repeat(np.arange(len(chords)), counts)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pitches[rows, cols] = flat
+    return pitches, counts
+
+def chord_masks(symbols):
+    '''12 bit pitch class sets, bit k for pitch class k (c is 0)'''
+    pitches, counts = chord_pitch_array(symbols)
+    valid = np.arange(MAX_NOTES) < counts[:, None]
+    bits = np.where(valid, 1 << (pitches.astype(np.int64) % 12), 0)
+    return np.bitwise_or.reduce(bits, axis=1).astype(np.uint16)
@@ -0,0 +1,261 @@
+'''
+shrink a time series to a number of notes while keeping its shape
+
+paa: mean of each bucket, smooth, loses spikes
+lttb: largest triangle three buckets, one real point per bucket, the one
+      making the largest triangle with the point kept before it and the
+      mean of the next bucket; keeps the visual shape
+peaks: the min and the max of each bucket, in time order; keeps every
+       extreme, two notes per bucket
+
+all of them run in linear time, lttb takes one vectorized step per bucket
+
+example usage:
+downsample(prices, 200, 'lttb') # 200 values
+for part in reduce_chunks(read_npy('minutes.npy'), 500, 'peaks'): ...
+downsample_chunks(read_npy('minutes.npy'), length, 200) # 200 values
+'''
+import numpy as np
+
+METHODS = ['paa', 'lttb', 'peaks']
+
+def bucket_starts(length, n):
+    '''start of each of n nearly equal buckets over length points'''
+    return np.linspace(0, length, n + 1).astype(int)[:-1]
+
+def _paa(x, starts):
+    return np.add.reduceat(x, starts) / np.diff(np.r_[starts, len(x)])
+
+def paa(x, n):
+    '''piecewise aggregate approximation, n bucket means'''
+    x = np.asarray(x, dtype=float)
+    if len(x) <= n:
+        return x
+    return _paa(x, bucket_starts(len(x), n))
+
+def _first_where(mask, starts, length):
+    '''index of the first True in each bucket (there is always one)'''
+    idx = np.where(mask, np.arange(length), length)
+    return np.minimum.reduceat(idx, starts)
+
+def _peaks(x, starts):
+    '''min and max of each bucket of x, in the order they occur'''
+    ids = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(x)]))
+    lows = _first_where(x == np.minimum.reduceat(x, starts)[ids], starts,
+                        len(x))
+    highs = _first_where(x == np.maximum.reduceat(x, starts)[ids], starts,
+                         len(x))
+    keep = np.sort(np.c_[lows, highs], axis=1).ravel()
+    return x[keep]
+
+def peaks(x, n):
+    '''
+    n // 2 buckets, each kept as its min and max in the order they occur;
+    the last point fills an odd n
+    '''
+    x = np.asarray(x, dtype=float)
+    if len(x) <= n:
+        return x
+    if n < 2:
+        return x[len(x) - n:]
+    if n % 2:
+        return np.r_[peaks(x[:-1], n - 1), x[-1]]
+    return _peaks(x, bucket_starts(len(x), n // 2))
+
+def _largest_triangle(a, b, t, x, c, d):
+    '''index into (t, x) of the largest triangle with (a, b) and (c, d)'''
+    return int(np.argmax(np.abs((a - c) * (x - b) - (a - t) * (d - b))))
+
+def _lttb_walk(x, edges, t0, anchor, centers, means):
+    '''
+    the point lttb keeps in each bucket edges[i]:edges[i + 1] of x, where
+    x[0] is at position t0 of the series; anchor is the (position, value)
+    kept before the first bucket, (centers[i], means[i]) the bucket after
+    bucket i; returns (indices into x, the last point kept as an anchor)
+    '''
+    keep = np.zeros(len(edges) - 1, dtype=int)
+    a, b = anchor
+    for i in range(len(keep)):
+        lo, hi = edges[i], edges[i + 1]
+        t = t0 + np.arange(lo, hi, dtype=float)
+        keep[i] = lo + _largest_triangle(a, b, t, x[lo:hi], centers[i],
+                                         means[i])
+        a, b = float(t0 + keep[i]), x[keep[i]]
+    return keep, (a, b)
+
+def lttb_edges(length, n):
+    '''
+    bucket edges of lttb: the first and last points stay, the n - 2
+    buckets split the rest
+    '''
+    return np.r_[bucket_starts(length - 2, n - 2), length - 2] + 1
+
+def lttb(x, n):
+    '''largest triangle three buckets, n points of x including both ends'''
+    x = np.asarray(x, dtype=float)
+    if len(x) <= n:
+        return x
+    if n < 3:
+        return x[[0, len(x) - 1][:n]]
+    edges = lttb_edges(len(x), n)
+    means = np.r_[_paa(x[1:-1], edges[1:-1] - 1), x[-1]]
+    centers = np.r_[(edges[1:-1] + edges[2:] - 1) / 2, len(x) - 1]
+    keep, _ = _lttb_walk(x, edges, 0, (0.0, x[0]), centers, means)
+    return x[np.r_[0, keep, len(x) - 1]]
+
+def downsample(x, n, method='lttb'):
+    '''x reduced to about n values with method, see METHODS'''
+    assert method in METHODS, "method must be in {}".format(METHODS)
+    return {'paa': paa, 'lttb': lttb, 'peaks': peaks}[method](x, n)
+
+################## streaming ##################
+def reduce_chunks(chunks, bucket, method='lttb'):
+    '''
+    reduce a streamed series bucket points at a time (2 values per bucket
+    for peaks, 1 otherwise), for series whose length is not known ahead;
+    the points of an unfinished bucket wait for the next chunk, lttb also
+    holds one bucket back as it looks at the next bucket
+    '''
+    assert method in METHODS, "method must be in {}".format(METHODS)
+    held = np.zeros(0)
+    start = 0 # position of held[0] in the series
+    anchor = None # (position, value) of the last point lttb kept
+    for x in chunks:
+        held = np.r_[held, x]
+        if method == 'lttb':
+            if anchor is None and len(held): # the first point always stays
+                anchor = (0, held[0])
+                yield held[:1]
+                held, start = held[1:], 1
+            full = max(len(held) // bucket - 1, 0) # the last is lookahead
+        else:
+            full = len(held) // bucket
+        if full == 0:
+            continue
+        done = held[:full * bucket]
+        if method == 'paa':
+            yield done.reshape(full, bucket).mean(axis=1)
+        elif method == 'peaks':
+            yield peaks(done, 2 * full)
+        else:
+            out, anchor = _lttb_buckets(done, start, anchor,
+                                        held[full * bucket:(full + 1) * bucket],
+                                        bucket)
+            yield out
+        held = held[full * bucket:]
+        start += full * bucket
+
+    if len(held) == 0:
+        return
+    if method == 'paa':
+        yield np.add.reduceat(held, np.arange(0, len(held), bucket)) / \
+            np.diff(np.r_[np.arange(0, len(held), bucket), len(held)])
+    elif method == 'peaks':
+        yield peaks(held, 2 * -(-len(held) // bucket))
+    else:
+        if len(held) > bucket: # buckets before the last one
+            full = (len(held) - 1) // bucket
+            out, anchor = _lttb_buckets(held[:full * bucket], start, anchor,
+                                        held[full * bucket:], bucket)
+            yield out
+        yield held[-1:]
+
+def _whole_buckets(chunks, edges):
+    '''
+    a stream cut at edges, increasing positions in the series: yields
+    (i, j, x) with x the points of buckets i..j-1, bucket i spanning
+    edges[i]:edges[i + 1]; the points before edges[0] come first as
+    (-1, 0, x), those after edges[-1] last as (len(edges) - 1, None, x)
+    '''
+    held = np.zeros(0)
+    pos = 0 # position of held[0] in the series
+    i = -1 # first bucket not yielded yet, -1 before edges[0]
+    for x in chunks:
+        held = np.r_[held, x]
+        if i < 0:
+            if len(held) < edges[0]:
+                continue
+            yield -1, 0, held[:edges[0]]
+            held, pos, i = held[edges[0]:], edges[0], 0
+        j = np.searchsorted(edges, pos + len(held), side='right') - 1
+        if j > i:
+            cut = edges[j] - pos
+            yield i, j, held[:cut]
+            held, pos, i = held[cut:], edges[j], j
+    yield len(edges) - 1, None, held
+
+def downsample_chunks(chunks, length, n, method='lttb'):
+    '''
+    downsample for a streamed series whose length is known ahead: yields,
+    a piece at a time, exactly what downsample(x, n, method) gives for the
+    whole series, so n values; lttb holds one bucket back as it looks at
+    the next bucket
+    '''
+    assert method in METHODS, "method must be in {}".format(METHODS)
+    assert n >= 1, "need at least one value"
+    if length <= n:
+        for x in chunks:
+            yield np.asarray(x, dtype=float)
+        return
+    if method == 'lttb':
+        yield from _lttb_chunks(chunks, length, n)
+        return
+    if method == 'paa':
+        edges, reduce = np.r_[bucket_starts(length, n), length], _paa
+    else: # an odd n keeps the last point, see peaks
+        end = length - n % 2
+        edges, reduce = np.r_[bucket_starts(end, n // 2), end], _peaks
+    for i, j, x in _whole_buckets(chunks, edges):
+        if j is None: # only an odd peaks has points after the buckets
+            if len(x):
+                yield x
+        elif i >= 0 and j > i:
+            yield reduce(x, edges[i:j] - edges[i])
+
+def _lttb_chunks(chunks, length, n):
+    edges = lttb_edges(length, n)
+    # centers of the buckets, the last point stands for one more bucket
+    centers = np.r_[(edges[:-1] + edges[1:] - 1) / 2, length - 1]
+    pending = np.zeros(0) # points of the buckets from first on
+    means = np.zeros(0) # of the buckets from first on
+    first = 0
+    anchor = None
+    for i, j, x in _whole_buckets(chunks, edges):
+        if i < 0: # the first point stays
+            anchor = (0.0, x[0])
+            yield x[:1]
+            continue
+        if j is None:
+            means = np.r_[means, x[-1]]
+            stop = i # every bucket left
+        else:
+            pending = np.r_[pending, x]
+            means = np.r_[means, _paa(x, edges[i:j] - edges[i])]
+            stop = j - 1 # the last bucket waits for the one after it
+        if stop > first:
+            local = edges[first:stop + 1] - edges[first]
+            keep, anchor = _lttb_walk(pending, local, edges[first], anchor,
+                                      centers[first + 1:stop + 1],
+                                      means[1:stop - first + 1])
+            yield pending[keep]
+            pending = pending[local[-1]:]
+            means = means[stop - first:]
+            first = stop
+        if j is None and n >= 2:
+            yield x[-1:]
+
+def _lttb_buckets(x, start, anchor, following, bucket):
+    '''lttb over whole buckets of x, following is the data after x'''
+    n = len(x) // bucket
+    blocks = x.reshape(n, bucket)
+    t = start + np.arange(len(x), dtype=float).reshape(n, bucket)
+    means = np.r_[blocks[1:].mean(axis=1), following.mean()]
+    centers = np.r_[t[1:].mean(axis=1),
+                    start + len(x) + (len(following) - 1) / 2]
+    out = np.zeros(n)
+    a, b = anchor
+    for i in range(n):
+        j = _largest_triangle(a, b, t[i], blocks[i], centers[i], means[i])
+        a, b = t[i, j], blocks[i, j]
+        out[i] = b
+    return out, (a, b)
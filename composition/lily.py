@@ -0,0 +1,276 @@
+'''
+reading LilyPond music back into note events, see score.py
+
+covers what this repo writes: absolute pitches, durations with dots and
+*n/d, ties, chords, \\tuplet, \\repeat, << >> voices, \\chordmode,
+\\drums and \\new ...Staff contexts; \\new ChordNames blocks are skipped,
+they only name chords that are played elsewhere
+
+example usage:
+events = parse_music(r"c'4 e'8 \\tuplet 3/2 { f' g' a' } <c e g>2~ q")
+staffs, meta = parse_score(open('output/tmp.ly').read())
+'''
+import re
+from fractions import Fraction
+import numpy as np
+from chords import chord_pitches
+from score import Staff, TICKS, REST, EVENT_DTYPE, note_pitches
+
+TOKEN = re.compile(r'''
+    %\{.*?%\} | %[^\n]*             # comments
+  | "(?:[^"\\]|\\.)*"               # strings
+  | << | >> | \\\\
+  | \\[A-Za-z]+                     # commands
+  | [{}|~=]
+  | <[^<>]*>[^\s{}<>~|=]*~?         # chords
+  | [^\s{}<>~|=]+~?                 # notes and command arguments
+''', re.X | re.S)
+
+# pitch or chord, duration, dots, multiplier, chordmode modifier and bass,
+# tie, articulations
+NOTE = re.compile(r"(<[^<>]*>|[a-zA-Z]+[',]*)(\d+)?(\.*)"
+                  r"(?:\*(\d+)(?:/(\d+))?)?"
+                  r"(:[\w.^+-]*)?(/\+?[a-z]+[',]*)?(~)?(?:[-_^].*)?")
+
+# contexts that start a staff of their own: anything named ...Staff
+DRUM_CONTEXTS = ['DrumStaff', 'RhythmicStaff']
+# contexts whose music is not played
+SILENT_CONTEXTS = ['ChordNames', 'Lyrics', 'FiguredBass']
+# commands followed by a block that is not music
+SKIPPED_BLOCKS = ['\\layout', '\\midi', '\\paper', '\\with']
+# commands followed by that many arguments
+ARGUMENTS = {'\\clef': 1, '\\key': 2, '\\partial': 1, '\\bar': 1,
+             '\\version': 1, '\\set': 3, '\\override': 3}
+
+################## parsing ##################
+def tokenize(text):
+    return [t for t in TOKEN.findall(text) if not t.startswith('%')]
+
+def duration_ticks(digits, dots):
+    '''"4", "." -> ticks of a dotted quarter'''
+    d = int(digits)
+    assert TICKS % d == 0, "duration too fine for TICKS {}".format(digits)
+    ticks = TICKS // d
+    return ticks * (2 ** (len(dots) + 1) - 1) // 2 ** len(dots)
+
+class Parser:
+    '''
+    recursive descent over LilyPond tokens, collecting events per staff
+    '''
+    def __init__(self, text, velocity=90):
+        self.tokens = tokenize(text)
+        self.i = 0
+        self.velocity = velocity
+        self.duration = TICKS // 4 # lilypond repeats the last duration
+        self.factor = Fraction(1) # tuplet scaling
+        self.chordmode = False
+        self.voice = 0
+        self.n_voices = 1
+        self.staffs = [] # [instrument, rows]
+        self.staff = None
+        self.last = [] # rows of the last note, for ties
+        self.meta = {}
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def next(self):
+        assert self.i < len(self.tokens), "unexpected end of music"
+        self.i += 1
+        return self.tokens[self.i - 1]
+
+    def skip_item(self):
+        '''skip one token, or a whole block'''
+        depth = 0
+        while True:
+            t = self.next()
+            depth += t in ['{', '<<']
+            depth -= t in ['}', '>>']
+            if depth <= 0:
+                return
+
+    def new_staff(self, instrument):
+        self.staff = [instrument, []]
+        self.staffs.append(self.staff)
+
+    def in_staff(self, instrument, onset):
+        '''parse the next item in a staff of its own'''
+        outer = self.staff
+        self.new_staff(instrument)
+        onset = self.music(onset)
+        self.staff = outer
+        return onset
+
+    def in_voice(self, onset):
+        outer = self.voice
+        self.voice, self.n_voices = self.n_voices, self.n_voices + 1
+        onset = self.music(onset)
+        self.voice = outer
+        return onset
+
+    def sequence(self, onset):
+        while self.peek() != '}':
+            onset = self.music(onset)
+        self.next()
+        return onset
+
+    def parallel(self, onset):
+        end = onset
+        while self.peek() != '>>':
+            if self.peek() == '\\\\':
+                self.next()
+            elif self.peek() == '{':
+                end = max(end, self.in_voice(onset))
+            else:
+                end = max(end, self.music(onset))
+        self.next()
+        return end
+
+    def music(self, onset):
+        '''parse one item starting at onset, returns where it ends'''
+        t = self.next()
+        if t == '{':
+            return self.sequence(onset)
+        if t == '<<':
+            return self.parallel(onset)
+        if t == '~':
+            for row in self.last:
+                row[5] = 1
+            return onset
+        if t in ['|', '\\\\'] or t.startswith('"'):
+            return onset
+        if t.startswith('\\'):
+            return self.command(t, onset)
+        return self.note(t, onset)
+
+    def command(self, t, onset):
+        if t == '\\new':
+            context = self.next()
+            if self.peek() == '=':
+                self.next(), self.next()
+            if self.peek() == '\\with':
+                self.next(), self.skip_item()
+            if context in SILENT_CONTEXTS:
+                self.skip_item()
+                return onset
+            if context.endswith('Staff'):
+                return self.in_staff('drum' if context in DRUM_CONTEXTS
+                                     else 'piano', onset)
+            if context in ['Voice', 'DrumVoice']:
+                return self.in_voice(onset)
+            return self.music(onset)
+        if t == '\\drums':
+            return self.in_staff('drum', onset)
+        if t == '\\drummode': # its music belongs to the staff around it
+            return self.music(onset)
+        if t == '\\chordmode':
+            outer, self.chordmode = self.chordmode, True
+            onset = self.music(onset)
+            self.chordmode = outer
+            return onset
+        if t in ['\\tuplet', '\\times']:
+            n, d = map(int, self.next().split('/'))
+            if t == '\\tuplet':
+                n, d = d, n
+                if self.peek().isdigit(): # tuplet span duration
+                    self.next()
+            outer = self.factor
+            self.factor *= Fraction(n, d)
+            onset = self.music(onset)
+            self.factor = outer
+            return onset
+        if t == '\\repeat':
+            self.next() # unfold, volta, percent
+            start = self.i
+            for _ in range(int(self.next())):
+                self.i = start + 1
+                onset = self.music(onset)
+            if self.peek() == '\\alternative':
+                self.next(), self.skip_item()
+            return onset
+        if t == '\\time':
+            self.meta.setdefault('time_signature', self.next())
+            return onset
+        if t == '\\tempo':
+            if self.peek().startswith('"'):
+                self.next()
+            if self.peek()[:1].isdigit():
+                beat = self.next()
+                assert self.next() == '=', "expected \\tempo beat=bpm"
+                self.meta.setdefault('tempo', beat + '=' + self.next())
+            return onset
+        if t == '\\header':
+            self.next()
+            while self.peek() != '}':
+                key = self.next()
+                if self.peek() == '=':
+                    self.next()
+                    value = self.next()
+                    if key == 'title' and value.startswith('"'):
+                        self.meta.setdefault('heading', value[1:-1])
+            self.next()
+            return onset
+        if t in ['\\relative', '\\transpose', '\\fixed']:
+            raise AssertionError("{} is not supported".format(t))
+        if t in SKIPPED_BLOCKS:
+            self.skip_item()
+            return onset
+        for _ in range(ARGUMENTS.get(t, 0)):
+            self.next()
+        return onset # \score, articulations and dynamics
+
+    def note(self, t, onset):
+        m = NOTE.fullmatch(t)
+        assert m is not None, "have unparsed note {}".format(t)
+        pitch, digits, dots, mul_n, mul_d, modifier, bass, tie = m.groups()
+        if digits:
+            self.duration = duration_ticks(digits, dots)
+        ticks = self.factor * self.duration
+        if mul_n:
+            ticks *= Fraction(int(mul_n), int(mul_d or 1))
+        assert ticks.denominator == 1, "duration too fine for TICKS {}".format(t)
+        ticks = int(ticks)
+
+        if pitch == 'q': # repeat the last chord
+            pitches = [row[2] for row in self.last]
+        elif self.chordmode and pitch not in ['r', 'R', 's']:
+            pitches = chord_pitches(pitch + (modifier or '') + (bass or ''))
+        else:
+            pitches = [p for p in note_pitches(pitch) if p != REST]
+
+        if self.staff is None:
+            self.new_staff('piano')
+        self.last = [[onset, ticks, p, self.velocity, self.voice,
+                      1 if tie else 0] for p in pitches]
+        self.staff[1].extend(self.last)
+        return onset + ticks
+
+    def parse(self):
+        onset = 0
+        while self.peek() is not None:
+            onset = self.music(onset)
+        return self
+
+def to_events(rows):
+    return np.array([tuple(r) for r in rows], dtype=EVENT_DTYPE)
+
+def parse_music(music, velocity=90):
+    '''
+    LilyPond music -> event array
+    music: a string, or a list of strings like a Staff holds
+    '''
+    if type(music) is not str:
+        music = ' '.join(music)
+    parser = Parser(music, velocity).parse()
+    return to_events([r for _, rows in parser.staffs for r in rows])
+
+def parse_score(text, velocity=90):
+    '''
+    a whole .ly file -> (staffs, meta)
+    staffs: list of Staff holding event arrays, one per staff context
+    meta: tempo, time_signature and heading when the file sets them
+    '''
+    parser = Parser(text, velocity).parse()
+    staffs = [Staff(to_events(rows), instrument)
+              for instrument, rows in parser.staffs if rows]
+    return staffs, parser.meta
@@ -0,0 +1,183 @@
+'''
+market data for ts2music: closing prices by ticker and interval
+
+sources return (times, closes), int64 unix seconds and float64 prices in
+time order:
+YFinanceSource: downloads with yfinance, imported only when used
+FixtureSource: made up random walks (or given arrays), no network, for
+               tests and offline runs
+CachedSource: wraps another source with one .npz file per source,
+              interval and ticker under CACHE_DIR; only the bars newer
+              than the cache are fetched, and only once the cache is
+              max_age old
+
+example usage:
+source = CachedSource(YFinanceSource())
+times, closes = source.load('MSFT', '1d')
+prices = source.load_many(['MSFT', 'GOOGL'], '1d') # one download
+'''
+import datetime
+import os
+import tempfile
+import time
+import zlib
+import numpy as np
+
+CACHE_DIR = os.path.join(
+    os.environ.get('MUSIC_THEORY_CACHE',
+                   os.path.join(os.path.expanduser('~'), '.cache',
+                                'music_theory')),
+    'market')
+MAX_AGE = 6 * 3600 # seconds before a cached series is brought up to date
+
+# seconds per bar, for fixtures
+INTERVALS = {'1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600,
+             '1d': 86400, '1wk': 7 * 86400}
+
+def _empty():
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+class YFinanceSource:
+    '''yahoo finance through yfinance'''
+    name = 'yfinance'
+
+    def fetch_many(self, tickers, interval='1d', start=None):
+        '''
+        ticker -> (times, closes) in one download
+        start: unix seconds, only bars from that day on
+        '''
+        import yfinance as yf # only needed when going to the network
+        kwargs = {}
+        if start is not None:
+            kwargs['start'] = datetime.datetime.fromtimestamp(
+                start, datetime.timezone.utc).strftime('%Y-%m-%d')
+        prices = yf.download(list(tickers), interval=interval, progress=False,
+                             group_by='column', auto_adjust=False, **kwargs)
+        out = {}
+        for ticker in tickers:
+            close = prices['Close']
+            if close.ndim == 2: # a column per ticker
+                close = close[ticker]
+            close = close.dropna()
+            out[ticker] = (np.asarray(close.index.asi8, dtype=np.int64)
+                           // 10 ** 9, close.to_numpy(dtype=np.float64))
+        return out
+
+    def fetch(self, ticker, interval='1d', start=None):
+        return self.fetch_many([ticker], interval, start)[ticker]
+
+class FixtureSource:
+    '''
+    offline stand in: series given as ticker -> (times, closes), and a
+    seeded random walk ending now for any other ticker
+    length: bars of a random walk
+    '''
+    name = 'fixture'
+
+    def __init__(self, series=None, length=1000, seed=0):
+        self.series = dict(series or {})
+        self.length = length
+        self.seed = seed
+        self.calls = 0
+
+    def _walk(self, ticker, interval):
+        step = INTERVALS[interval]
+        end = int(time.time()) // step * step
+        times = end - step * np.arange(self.length, dtype=np.int64)[::-1]
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, self.length)))
+        return times, closes
+
+    def fetch_many(self, tickers, interval='1d', start=None):
+        self.calls += 1
+        out = {}
+        for ticker in tickers:
+            times, closes = self.series.get(ticker) or \
+                self._walk(ticker, interval)
+            keep = slice(None) if start is None else \
+                slice(np.searchsorted(times, start), None)
+            out[ticker] = (np.asarray(times[keep], dtype=np.int64),
+                           np.asarray(closes[keep], dtype=np.float64))
+        return out
+
+    def fetch(self, ticker, interval='1d', start=None):
+        return self.fetch_many([ticker], interval, start)[ticker]
+
+class CachedSource:
+    '''
+    source: where missing bars come from, YFinanceSource or FixtureSource;
+            every source caches under its own name, so made up prices never
+            end up in a real cache
+    max_age: seconds a cache file is trusted without asking the source,
+             None to never ask once a ticker is cached
+    '''
+    def __init__(self, source, cache_dir=CACHE_DIR, max_age=MAX_AGE):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, ticker, interval):
+        return os.path.join(self.cache_dir, self.source.name, interval,
+                            '{}.npz'.format(ticker.replace('/', '_')))
+
+    def read(self, ticker, interval):
+        '''cached (times, closes), empty arrays if not cached'''
+        try:
+            with np.load(self.path(ticker, interval)) as f:
+                return f['times'], f['closes']
+        except FileNotFoundError:
+            return _empty()
+
+    def write(self, ticker, interval, times, closes):
+        path = self.path(ticker, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, times=times, closes=closes)
+        os.replace(tmp, path)
+
+    def append(self, ticker, interval, times, closes):
+        '''
+        add newer bars to the cache, they replace cached bars from the
+        same time on (the last bar of a day in progress changes)
+        '''
+        old_times, old_closes = self.read(ticker, interval)
+        if len(times):
+            keep = old_times < times[0]
+            times = np.r_[old_times[keep], times]
+            closes = np.r_[old_closes[keep], closes]
+        else:
+            times, closes = old_times, old_closes
+        self.write(ticker, interval, times, closes)
+        return times, closes
+
+    def _fresh(self, ticker, interval):
+        try:
+            age = time.time() - os.path.getmtime(self.path(ticker, interval))
+        except FileNotFoundError:
+            return False
+        return self.max_age is None or age < self.max_age
+
+    def load_many(self, tickers, interval='1d', length=None):
+        '''
+        ticker -> (times, closes), the last length bars if given; stale
+        tickers are brought up to date with one call to the source,
+        from the oldest last cached bar among them
+        '''
+        series = dict((t, self.read(t, interval)) for t in tickers)
+        stale = [t for t in tickers if not self._fresh(t, interval)]
+        if stale:
+            lasts = [series[t][0][-1] if len(series[t][0]) else None
+                     for t in stale]
+            start = None if None in lasts else int(min(lasts))
+            fetched = self.source.fetch_many(stale, interval, start)
+            for t in stale:
+                series[t] = self.append(t, interval, *fetched[t])
+        if length is not None:
+            series = dict((t, (times[-length:], closes[-length:]))
+                          for t, (times, closes) in series.items())
+        return series
+
+    def load(self, ticker, interval='1d', length=None):
+        return self.load_many([ticker], interval, length)[ticker]
@@ -0,0 +1,180 @@
+'''
+Standard MIDI File writer: staffs straight to .midi, without lilypond
+
+one track per staff after a tempo track, drum staffs (and drum hits in
+any staff) play on the general midi drum channel
+
+example usage:
+write_midi('output/tmp.midi', [Staff(melody([1, 3, 5]))], tempo='4=100')
+write_midis([('a.midi', staffs_a, {}), ('b.midi', staffs_b, {'tempo': '4=90'})])
+
+from the command line, a .ly file written by this repo:
+python midi.py output/tmp.ly # writes output/tmp.midi
+'''
+import os
+import re
+import struct
+import sys
+import numpy as np
+from score import TICKS, REST, DRUM_BASE
+from lily import parse_music, parse_score
+
+PPQ = TICKS // 4 # ticks per quarter note
+KEY_OFFSET = 48 # midi key of pitch 0 (c), so c' is middle c
+DRUM_CHANNEL = 9
+
+def vlq(n):
+    '''variable length quantity'''
+    out = [n & 0x7f]
+    n >>= 7
+    while n:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(out[::-1])
+
+VLQ_TABLE = [vlq(n) for n in range(1 << 14)] # deltas up to ~8 whole notes
+
+def quarter_seconds(tempo):
+    '''"4=140" -> seconds per quarter note, dotted beats allowed'''
+    m = re.fullmatch(r"(\d+)(\.*)=(\d+)(?:-\d+)?", tempo.replace(' ', ''))
+    assert m is not None, "can not read tempo {}".format(tempo)
+    beat, dots, bpm = m.groups()
+    quarters = 4 / int(beat) * (2 - 0.5 ** len(dots))
+    return 60 / (int(bpm) * quarters)
+
+def tempo_microseconds(tempo):
+    return int(round(quarter_seconds(tempo) * 1e6))
+
+def meta_event(kind, data):
+    return b'\x00\xff' + bytes([kind]) + vlq(len(data)) + data
+
+def chunk(events):
+    '''an MTrk chunk from the encoded events, adds end of track'''
+    data = events + b'\x00\xff\x2f\x00'
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+def tempo_track(tempo, time_signature, heading):
+    n, d = map(int, time_signature.split('/'))
+    events = meta_event(0x03, heading.encode('utf-8'))
+    events += meta_event(0x51, struct.pack('>I', tempo_microseconds(tempo))[1:])
+    events += meta_event(0x58, bytes([n, d.bit_length() - 1, 24, 8]))
+    return chunk(events)
+
+def staff_events(staff):
+    '''event array of a staff, LilyPond strings are parsed'''
+    if isinstance(staff.ts, np.ndarray):
+        return staff.ts
+    return parse_music(staff.ts)
+
+def merge_ties(events):
+    '''one event per tied run of the same pitch in the same voice'''
+    events = events[(events['pitch'] != REST) & (events['duration'] > 0)]
+    events = events[np.lexsort((events['onset'], events['pitch'],
+                                events['voice']))]
+    if len(events) < 2:
+        return events
+    ends = events['onset'] + events['duration']
+    tied = (events['tie'][:-1] == 1) &\
+        (events['voice'][1:] == events['voice'][:-1]) &\
+        (events['pitch'][1:] == events['pitch'][:-1]) &\
+        (events['onset'][1:] == ends[:-1])
+    starts = np.flatnonzero(np.r_[True, ~tied])
+    merged = events[starts]
+    merged['duration'] = np.maximum.reduceat(ends, starts) - merged['onset']
+    return merged
+
+def note_messages(events, channel):
+    '''
+    note on/off messages of the events in playing order, as arrays:
+    (ticks, status, keys, velocity), note offs sort before note ons
+    at the same tick
+    '''
+    events = merge_ties(events)
+    drums = (events['pitch'] >= DRUM_BASE) | (channel == DRUM_CHANNEL)
+    keys = np.where(events['pitch'] >= DRUM_BASE,
+                    events['pitch'] - DRUM_BASE,
+                    events['pitch'].astype(np.int32) + KEY_OFFSET)
+    assert ((keys >= 0) & (keys < 128)).all(), "pitch outside midi range"
+    channels = np.where(drums, DRUM_CHANNEL, channel)
+
+    times = np.r_[events['onset'] + events['duration'], events['onset']]
+    is_on = np.r_[np.zeros(len(events), bool), np.ones(len(events), bool)]
+    order = np.lexsort((is_on, times))
+    status = np.where(is_on, 0x90, 0x80)[order] | np.r_[channels, channels][order]
+    velocity = np.r_[np.full(len(events), 64), events['velocity']][order]
+    return times[order], status, np.r_[keys, keys][order], velocity
+
+def encode_messages(deltas, status, keys, velocity):
+    '''delta timed channel messages as bytes'''
+    out = bytearray()
+    table = VLQ_TABLE
+    for delta, s, k, v in zip(deltas, status, keys, velocity):
+        out += table[delta] if delta < len(table) else vlq(delta)
+        out += bytes((s, k, v))
+    return bytes(out)
+
+def note_track(events, channel, name=''):
+    '''MTrk chunk with note on/off messages of the events'''
+    times, status, keys, velocity = note_messages(events, channel)
+    deltas = np.diff(times, prepend=0)
+    return chunk(meta_event(0x03, name.encode('utf-8')) +
+                 encode_messages(deltas.tolist(), status.tolist(),
+                                 keys.tolist(), velocity.tolist()))
+
+def staff_channels(staffs):
+    '''
+    midi channel of every staff, in order, drum staffs share DRUM_CHANNEL;
+    past 15 pitched staffs the channels are used again from the first
+    '''
+    channels = [c for c in range(16) if c != DRUM_CHANNEL]
+    out = []
+    pitched = 0
+    for staff in staffs:
+        if staff.instrument == 'drum':
+            out.append(DRUM_CHANNEL)
+        else:
+            out.append(channels[pitched % len(channels)])
+            pitched += 1
+    return out
+
+def smf(tracks):
+    '''Standard MIDI File (format 1) of MTrk chunks, tempo track first'''
+    header = b'MThd' + struct.pack('>IHHH', 6, 1, len(tracks), PPQ)
+    return header + b''.join(tracks)
+
+def midi_bytes(staffs, tempo='4=140', time_signature='4/4',
+               heading='simple chord'):
+    '''Standard MIDI File (format 1) of the staffs'''
+    tracks = [tempo_track(tempo, time_signature, heading)]
+    for staff, channel in zip(staffs, staff_channels(staffs)):
+        tracks.append(note_track(staff_events(staff), channel,
+                                 staff.instrument))
+    return smf(tracks)
+
+def write_midi(path, staffs, tempo='4=140', time_signature='4/4',
+               heading='simple chord'):
+    with open(path, 'wb') as f:
+        f.write(midi_bytes(staffs, tempo, time_signature, heading))
+    return path
+
+def write_midis(pieces):
+    '''
+    write many files in one process
+    pieces: iterable of (path, staffs, options), options are keyword
+            arguments of write_midi, eg. {'tempo': '4=90'}
+    returns the paths written
+    '''
+    return [write_midi(path, staffs, **options)
+            for path, staffs, options in pieces]
+
+def ly2midi(path, out=None):
+    '''a .ly file written by this repo -> .midi next to it'''
+    with open(path) as f:
+        staffs, meta = parse_score(f.read())
+    out = out or os.path.splitext(path)[0] + '.midi'
+    return write_midi(out, staffs, **meta)
+
+if __name__ == '__main__':
+    assert len(sys.argv) > 1, "usage: python midi.py file.ly [file.ly ...]"
+    for path in sys.argv[1:]:
+        print(ly2midi(path))
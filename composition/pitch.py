@@ -0,0 +1,14 @@
+'''
+LilyPond pitch codec for the composition scripts: note names <-> absolute
+numbers, c -> 0, c' -> 12, REST for rests
+
+the codec itself is lib/pitch.py, shared with lib.notes.NoteArray so both
+read 'as', 'es' and rests the same way
+'''
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.pitch import (STEPS, ACCIDENTALS, NAMES, RESTS, REST, MAX_OCTAVE,
+                       PITCH_TABLE, DECODE_TABLE, split_token, note2number,
+                       number2note, encode, decode)
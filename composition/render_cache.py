@@ -0,0 +1,220 @@
+'''
+content addressed cache for the lilypond -> ps2pdf -> timidity pipeline
+
+a render is keyed by the sha256 of the .ly source and the versions of
+the tools, so byte identical scores are rendered once; artifacts live
+under CACHE_DIR/<key[:2]>/<key>/ and the least recently used entries
+are evicted once the directory grows past max_bytes
+
+example usage:
+cache = RenderCache()
+paths = cache.render(open('output/tmp.ly').read(), 'output')
+# {'pdf': 'output/tmp.pdf', 'midi': 'output/tmp.midi'}
+
+from the command line (what simple.sh runs):
+python render_cache.py output/tmp.ly [--wav]
+'''
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+CACHE_DIR = os.path.join(
+    os.environ.get('MUSIC_THEORY_CACHE',
+                   os.path.join(os.path.expanduser('~'), '.cache',
+                                'music_theory')),
+    'render')
+MAX_BYTES = 512 * 2 ** 20
+
+# tool -> flag printing its version
+TOOLS = {'lilypond': '--version', 'ps2pdf': None, 'gs': '--version',
+         'timidity': '--version'}
+
+def _tool_stamp(tool):
+    '''where the tool is and when it changed, None if not installed'''
+    path = shutil.which(tool)
+    if path is None:
+        return None
+    st = os.stat(path)
+    return '{}:{}:{}'.format(os.path.realpath(path), st.st_size, st.st_mtime)
+
+def run_tools(source, work_dir, artifacts=('pdf', 'midi'), timeout=None):
+    '''the uncached pipeline, returns ext -> path in work_dir'''
+    ly = os.path.join(work_dir, 'render.ly')
+    with open(ly, 'w') as f:
+        f.write(source)
+    def run(*command):
+        subprocess.run(command, cwd=work_dir, check=True,
+                       capture_output=True, timeout=timeout)
+    run('lilypond', 'render.ly')
+    files = {}
+    for ext in artifacts:
+        path = os.path.join(work_dir, 'render.' + ext)
+        if ext == 'pdf' and not os.path.exists(path): # older lilypond
+            run('ps2pdf', 'render.ps')
+        if ext == 'wav':
+            run('timidity', '-Ow', '-o', 'render.wav', 'render.midi')
+        assert os.path.exists(path), "lilypond did not write {}".format(ext)
+        files[ext] = path
+    return files
+
+class RenderCache:
+    '''
+    cache_dir: where artifacts are kept
+    max_bytes: size bound of cache_dir, enforced after every store
+    '''
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._versions = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ################## keys ##################
+    def versions(self):
+        '''
+        tool -> version string, probed once and remembered in
+        versions.json until the tool binary changes, so a cache hit
+        does not start any process
+        '''
+        if self._versions is not None:
+            return self._versions
+        path = os.path.join(self.cache_dir, 'versions.json')
+        try:
+            with open(path) as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            known = {}
+        versions, changed = {}, False
+        for tool, flag in TOOLS.items():
+            stamp = _tool_stamp(tool)
+            entry = known.get(tool)
+            if entry is None or entry['stamp'] != stamp:
+                entry = {'stamp': stamp, 'version': self._probe(tool, flag)
+                         if stamp else 'missing'}
+                known[tool], changed = entry, True
+            versions[tool] = entry['version']
+        if changed:
+            self._atomic_write(path, json.dumps(known, indent=2).encode())
+        self._versions = versions
+        return versions
+
+    @staticmethod
+    def _probe(tool, flag):
+        if flag is None:
+            return 'installed'
+        out = subprocess.run([tool, flag], capture_output=True, text=True)
+        lines = (out.stdout or out.stderr).strip().splitlines()
+        return lines[0] if lines else 'unknown'
+
+    def key(self, source, artifacts=('pdf', 'midi')):
+        h = hashlib.sha256()
+        h.update(source.encode('utf-8') if type(source) is str else source)
+        h.update(json.dumps([self.versions(), sorted(artifacts)],
+                            sort_keys=True).encode())
+        return h.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    ################## lookup and store ##################
+    def get(self, key):
+        '''ext -> cached path, or None on a miss; marks the entry used'''
+        entry = self.entry(key)
+        try:
+            names = os.listdir(entry)
+        except FileNotFoundError:
+            return None
+        os.utime(entry) # recency for LRU eviction
+        return dict((os.path.splitext(n)[1][1:], os.path.join(entry, n))
+                    for n in names)
+
+    def put(self, key, files):
+        '''copy files (ext -> path) in, atomically, returns the entry'''
+        entry = self.entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.', dir=os.path.dirname(entry))
+        for ext, path in files.items():
+            shutil.copyfile(path, os.path.join(staging, 'render.' + ext))
+        try:
+            os.rename(staging, entry)
+        except OSError: # someone else stored it first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=entry)
+        return entry
+
+    def evict(self, keep=None):
+        '''drop least recently used entries, but keep, until under max_bytes'''
+        entries = []
+        for shard in os.listdir(self.cache_dir):
+            shard = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard):
+                continue
+            for key in os.listdir(shard):
+                if key.startswith('.'): # still being stored
+                    continue
+                entry = os.path.join(shard, key)
+                if entry == keep:
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, n))
+                           for n in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    @staticmethod
+    def _atomic_write(path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    ################## rendering ##################
+    def render(self, source, out_dir, name='tmp', artifacts=('pdf', 'midi'),
+               timeout=None):
+        '''
+        artifacts of the LilyPond source copied to out_dir/name.<ext>,
+        tools only run on a cache miss; returns ext -> path
+        '''
+        key = self.key(source, artifacts)
+        cached = self.get(key)
+        if cached is None:
+            self.misses += 1
+            with tempfile.TemporaryDirectory() as work_dir:
+                self.put(key, run_tools(source, work_dir, artifacts, timeout))
+            cached = self.get(key)
+        else:
+            self.hits += 1
+        out = {}
+        for ext in artifacts:
+            out[ext] = os.path.join(out_dir, '{}.{}'.format(name, ext))
+            shutil.copyfile(cached[ext], out[ext])
+        return out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="cached lilypond render")
+    parser.add_argument('ly', type=str)
+    parser.add_argument('--wav', action='store_true',
+                        help='also render audio with timidity')
+    parser.add_argument('--max-mb', type=float, default=MAX_BYTES / 2 ** 20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache = RenderCache(max_bytes=int(args.max_mb * 2 ** 20))
+    with open(args.ly) as f:
+        source = f.read()
+    name = os.path.splitext(os.path.basename(args.ly))[0]
+    paths = cache.render(source, os.path.dirname(args.ly) or '.', name,
+                         ('pdf', 'midi', 'wav') if args.wav else
+                         ('pdf', 'midi'))
+    print('{} in {:.3f}s: {}'.format('hit' if cache.hits else 'miss',
+                                     time.perf_counter() - start,
+                                     ' '.join(paths.values())))
@@ -0,0 +1,55 @@
+'''
+writing durations as LilyPond notes
+'''
+def binarize(n):
+    '''convert base 10 number "n" to list of binary digits'''
+    binary_repr = []
+    while n != 0:
+        n, digit = n // 2, n % 2
+        binary_repr.append(digit)
+    binary_repr = binary_repr[::-1]
+    return binary_repr
+
+KNOWN_UNITS = [1, 2, 4, 8, 16, 32, 64]
+
+def simplify_duration(duration, unit=16):
+    '''
+    durations, to be tied together, that make up duration amount of
+    1/unit notes, it tries to simplify the note written
+    eg. simplify_duration(7, 4) == ('1', '2.')
+    '''
+    assert unit in KNOWN_UNITS, "unit must in {}".format(KNOWN_UNITS)
+
+    # binary representation: so I can simplify to how many 1, 2, etc.
+    # with unit as the smallest granularity
+    # pad so that the first entry is a note of unit 1
+    binary_repr = binarize(duration)
+    n_digits = KNOWN_UNITS.index(unit) + 1
+    binary_repr = [0] * (n_digits - len(binary_repr)) + binary_repr
+
+    # further simplify by collecting nearby repr
+    # for idx in range(1, len(binary_repr)): # front to back
+    for idx in range(len(binary_repr)-1, 0, -1): # back to front
+        if binary_repr[idx-1] == 1 and binary_repr[idx] == 1:
+            binary_repr[idx-1] += 1
+            binary_repr[idx] = 0
+
+    return tuple('{}'.format(unit) + ("." if count > 1 else "")
+                 for unit, count in zip(KNOWN_UNITS, binary_repr)
+                 if count != 0)
+
+# (duration, unit) -> tied durations, precomputed up to 4 whole notes
+DURATION_TABLE = dict(((duration, unit), simplify_duration(duration, unit))
+                      for unit in KNOWN_UNITS
+                      for duration in range(4 * unit + 1))
+
+def rhythm_notation(duration, note, unit=16):
+    '''
+    make the single note have duration amount of time
+    notes are tied together by ties, rests have no tie
+    '''
+    durations = DURATION_TABLE.get((duration, unit))
+    if durations is None:
+        durations = DURATION_TABLE[(duration, unit)] = \
+            simplify_duration(duration, unit)
+    return ('~ ' if note != 'r' else ' ').join(note + d for d in durations)
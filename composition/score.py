@@ -0,0 +1,262 @@
+'''
+structured intermediate representation for staffs: instead of a list of
+LilyPond strings, a staff can hold a numpy record array of note events
+
+onset, duration: in TICKS per whole note
+pitch: absolute number as in pitch.py (c' -> 12), REST for rests,
+       DRUM_BASE + general midi key for drum hits
+velocity: 0..127, voice: polyphonic voice in the staff,
+tie: 1 when tied to the next event of the same pitch
+
+example usage:
+events = events_from_notes(["c'", "<e' g'>", 'r', "g'"], [2, 2, 1, 3], unit=8)
+main([Staff(transpose(events, 2))])
+'''
+import numpy as np
+from pitch import encode, decode, REST
+from rhythm import simplify_duration
+
+TICKS = 1920 # per whole note, divisible by 64ths, triplets and quintuplets
+DRUM_BASE = 1000
+
+EVENT_DTYPE = np.dtype([('onset', 'i4'), ('duration', 'i4'),
+                        ('pitch', 'i2'), ('velocity', 'u1'),
+                        ('voice', 'u1'), ('tie', 'u1')])
+
+# lilypond drum names -> general midi key
+DRUMS = {'bd': 36, 'bda': 35, 'sn': 38, 'sne': 40, 'ss': 37, 'hc': 39,
+         'hh': 42, 'hhp': 44, 'hho': 46, 'cymc': 49, 'cymcb': 57, 'cymr': 51,
+         'cyms': 55, 'cymch': 52, 'tomh': 50, 'tommh': 48, 'tomml': 47,
+         'toml': 45, 'tomfh': 43, 'tomfl': 41, 'tamb': 54, 'cb': 56}
+GM2DRUM = dict((key, name) for name, key in DRUMS.items())
+# the long names (and short synonyms) lilypond also takes, rendered short
+DRUMS.update(bassdrum=36, acousticbassdrum=35, snare=38, acousticsnare=38,
+             sna=38, electricsnare=40, sidestick=37, handclap=39, hihat=42,
+             closedhihat=42, hhc=42, pedalhihat=44, openhihat=46,
+             crashcymbal=49, crashcymbala=49, cymca=49, crashcymbalb=57,
+             ridecymbal=51, splashcymbal=55, chinesecymbal=52, hightom=50,
+             himidtom=48, lowmidtom=47, lowtom=45, highfloortom=43,
+             lowfloortom=41, tambourine=54, cowbell=56)
+
+name2staff = {
+    'piano': '\\new PianoStaff',
+    'drum': '\\drums'
+}
+
+class Staff:
+    '''
+    staff is just a bunch of note with instrument info
+    ts: list of LilyPond strings, or an EVENT_DTYPE array
+    '''
+    def __init__(self, ts, instrument='piano', clef='treble'):
+        self.instrument = instrument
+        self.ts = ts
+        self.clef = clef
+
+    def tokens(self):
+        '''LilyPond strings of the staff'''
+        if isinstance(self.ts, np.ndarray):
+            return render_events(self.ts)
+        return self.ts
+
+def render_body(staffs, tempo='4=140', time_signature='4/4', key='c \\major'):
+    '''one \\score block of the staffs'''
+    body = "\\score{\n << \n"
+    for staff in staffs:
+        body += "%s { \\clef %s \\tempo %s \\time %s %s \n"\
+                % (name2staff[staff.instrument], staff.clef,
+                   tempo, time_signature,
+                   '\\key %s' % key if staff.instrument != 'drum' else '')
+        body += " ".join(staff.tokens())
+        body += "}\n"
+    body += ">>\n \\layout {} \\midi{} }\n"
+    return body
+
+def render_header(heading='simple chord'):
+    '''version and title of a LilyPond file'''
+    return """\\version "2.18.2"
+    \\header {
+    title = "%s"
+    composer = "Jiaxuan Wang"
+    tagline = "Copyright: MIT license"
+    }""" % heading
+
+def render_score(staffs, tempo='4=140', time_signature='4/4', key='c \\major',
+                 heading='simple chord'):
+    '''the LilyPond source of a score'''
+    return render_header(heading) + \
+        render_body(staffs, tempo, time_signature, key)
+
+################## building events ##################
+def note_pitches(note):
+    '''
+    pitches of one note string: "c'" -> [12], "<c e g>" -> [0, 4, 7],
+    'r' -> [REST], 'sn' -> [DRUM_BASE + 38]
+    '''
+    if note in DRUMS:
+        return [DRUM_BASE + DRUMS[note]]
+    if note.startswith('<'):
+        assert note.endswith('>'), "unclosed chord {}".format(note)
+        names = note[1:-1].split()
+        pitches = iter(encode([n for n in names if n not in DRUMS]).tolist())
+        return [DRUM_BASE + DRUMS[n] if n in DRUMS else next(pitches)
+                for n in names]
+    return [int(encode([note])[0])]
+
+def events_from_notes(notes, rhythm=None, unit=16, onset=0, voice=0,
+                      velocity=90):
+    '''
+    events for notes with rhythm, same conventions as simple.add_rhythm:
+    rhythm entries are units of 1/unit notes, or (n, d) tuplets of n
+    notes taking d units, and notes repeat when rhythm is longer
+    '''
+    assert TICKS % unit == 0, "unit too fine for TICKS"
+    if len(notes) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    if rhythm is None:
+        rhythm = [1] * len(notes)
+    cache = {}
+    rows = []
+    i = 0
+    for duration in rhythm:
+        if type(duration) in [tuple, list]: # tuplet
+            n_to_eat, duration = duration
+        else: # regular
+            n_to_eat = 1
+        ticks = duration * TICKS // unit
+        assert ticks % n_to_eat == 0, "tuplet too fine for TICKS"
+        ticks //= n_to_eat
+        for _ in range(n_to_eat):
+            note = notes[i % len(notes)]
+            if note not in cache:
+                cache[note] = note_pitches(note)
+            for pitch in cache[note]:
+                rows.append((onset, ticks, pitch, velocity, voice, 0))
+            onset += ticks
+            i += 1
+    return np.array(rows, dtype=EVENT_DTYPE)
+
+################## vectorized transforms ##################
+def pitched(events):
+    '''mask of events that have a pitch (not rests or drums)'''
+    return (events['pitch'] != REST) & (events['pitch'] < DRUM_BASE)
+
+def end(events):
+    '''tick where the last event stops'''
+    if len(events) == 0:
+        return 0
+    return int((events['onset'] + events['duration']).max())
+
+def transpose(events, semitones):
+    out = events.copy()
+    mask = pitched(events)
+    out['pitch'][mask] += semitones
+    return out
+
+def invert(events, axis):
+    '''mirror pitches around the absolute pitch axis'''
+    out = events.copy()
+    mask = pitched(events)
+    out['pitch'][mask] = 2 * axis - out['pitch'][mask]
+    return out
+
+def retime(events, factor):
+    '''stretch onsets and durations by factor, eg. 2 augments, 0.5 diminishes'''
+    out = events.copy()
+    out['onset'] = np.round(events['onset'] * factor)
+    out['duration'] = np.round(events['duration'] * factor)
+    return out
+
+def shift(events, ticks):
+    out = events.copy()
+    out['onset'] += ticks
+    return out
+
+def concat(parts):
+    '''play event arrays one after another'''
+    offsets = np.cumsum([0] + [end(p) for p in parts[:-1]])
+    return np.concatenate([shift(p, o) for p, o in zip(parts, offsets)]) \
+        if len(parts) else np.zeros(0, dtype=EVENT_DTYPE)
+
+def stack(parts):
+    '''play event arrays together, each in its own voice'''
+    out = []
+    for voice, p in enumerate(parts):
+        p = p.copy()
+        p['voice'] = voice
+        out.append(p)
+    return np.concatenate(out) if out else np.zeros(0, dtype=EVENT_DTYPE)
+
+################## rendering ##################
+TICKS_64 = TICKS // 64
+TUPLETS = [(3, 2), (5, 4), (6, 4)]
+
+def duration_marks(ticks):
+    '''LilyPond durations that add up to ticks, eg. 7 16ths -> ('4.', '16')'''
+    n = ticks // TICKS_64
+    wholes = max(0, n // 64 - 1) # simplify_duration covers up to 1.
+    return ('1',) * wholes + simplify_duration(n - 64 * wholes, 64)
+
+def _tuplet(ticks):
+    for n, d in TUPLETS:
+        if ticks * n % (d * TICKS_64) == 0:
+            return n, d
+    raise AssertionError("can not write {} ticks".format(ticks))
+
+def _voice_items(events):
+    '''(note string, onset, duration, tie) per onset, gaps become rests'''
+    events = events[np.lexsort((events['pitch'], events['onset']))]
+    onsets = events['onset']
+    starts = np.flatnonzero(np.r_[True, onsets[1:] != onsets[:-1]])
+    stops = np.r_[starts[1:], len(events)]
+    plain = (events['pitch'] >= DRUM_BASE) | (events['pitch'] == REST)
+    names = decode(np.where(plain, 0, events['pitch']))
+    cursor = 0
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        onset = int(onsets[start])
+        duration = int(events['duration'][start])
+        assert onset >= cursor,\
+            "overlapping notes in one voice at {}".format(onset)
+        assert (events['duration'][start:stop] == duration).all(),\
+            "notes of a chord need the same duration at {}".format(onset)
+        if onset > cursor:
+            yield 'r', cursor, onset - cursor, False
+        pitches = events['pitch'][start:stop].tolist()
+        notes = [GM2DRUM[p - DRUM_BASE] if p >= DRUM_BASE else
+                 'r' if p == REST else names[start + k]
+                 for k, p in enumerate(pitches)]
+        note = notes[0] if len(notes) == 1 else '<' + ' '.join(notes) + '>'
+        yield note, onset, duration, bool(events['tie'][start:stop].any())
+        cursor = onset + duration
+
+def _render_voice(events):
+    tokens = []
+    tuplet = None
+    for note, onset, duration, tie in _voice_items(events):
+        ratio = None if duration % TICKS_64 == 0 else _tuplet(duration)
+        if ratio != tuplet:
+            if tuplet is not None:
+                tokens.append('}')
+            if ratio is not None:
+                tokens.append('\\tuplet %d/%d {' % ratio)
+            tuplet = ratio
+        if ratio is not None:
+            duration = duration * ratio[0] // ratio[1]
+        marks = duration_marks(duration)
+        token = ('~ ' if note != 'r' else ' ').join(note + m for m in marks)
+        tokens.append(token + ('~' if tie and note != 'r' else ''))
+    if tuplet is not None:
+        tokens.append('}')
+    return tokens
+
+def render_events(events):
+    '''LilyPond strings for an event array, voices become << {} \\\\ {} >>'''
+    voices = np.unique(events['voice'])
+    if len(voices) <= 1:
+        return _render_voice(events)
+    tokens = ['<<']
+    for k, v in enumerate(voices):
+        if k:
+            tokens.append('\\\\')
+        tokens += ['{'] + _render_voice(events[events['voice'] == v]) + ['}']
+    return tokens + ['>>']
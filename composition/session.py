@@ -0,0 +1,267 @@
+'''
+long practice sessions, generated and written a segment at a time
+
+a session is an endless stream of segments, each a few measures in the
+next key around the circle of fifths: a random functional progression
+played as a practice0 style arpeggio or a finger picking pattern, the
+chords, and a drum groove; sinks write every segment as it comes, so
+memory stays the same however long the session runs and the start of
+the files can be played while the rest is still being generated
+
+example usage:
+segments = until(session(seed=0), minutes=120)
+stream(segments, [LilySink('output/session.ly'),
+                  MidiSink('output/session.midi'),
+                  WavSink('output/session.wav')])
+
+from the command line:
+python session.py output/session --minutes 120 --formats midi,wav
+'''
+import argparse
+import struct
+import wave
+import numpy as np
+from simple import (build_scale, chord, random_functional_progressions,
+                    progression_degrees, progression_names, sheet_rng)
+from score import (Staff, TICKS, REST, events_from_notes, end, render_body,
+                   render_header)
+from midi import (PPQ, vlq, meta_event, tempo_microseconds, quarter_seconds,
+                  note_messages, encode_messages, staff_channels)
+from synth import SAMPLE_RATE, staff_audio
+
+# the circle of fifths, LOW_KEYS are played an octave lower
+KEYS = ['c', 'g', 'd', 'a', 'e', 'b', 'fis', 'des', 'aes', 'ees', 'bes', 'f']
+LOW_KEYS = ['a', 'b', 'bes', 'aes']
+
+# one measure of eighths over a chord, indices into its degrees
+ARPEGGIOS = [[0, 1, 2, 1, 2, 0, 1, 2], # practice0
+             [0, 2, 1, 2, 0, 2, 1, 2]]
+# (degree index, octave) eighths, like finger_picking0 and finger_picking1
+PICKINGS = [[(0, 0), (1, 1)] * 4,
+            [(0, 0), (0, 1), (2, 0), (1, 0), (0, 1), (2, 0), (2, 0), (0, 1)]]
+# one measure of 16ths per drum, - is a rest
+GROOVES = [{'bd': 'x---x---x---x---', 'sn': '----x-------x---',
+            'hh': 'x-x-x-x-x-x-x-x-'},
+           {'bd': 'x-----x-x-------', 'sn': '----x-------x---',
+            'hh': 'xxxxxxxxxxxxxxxx'},
+           {'sn': '----x--x----x---', 'hh': 'x-x-x-x-x-x-x-x-'}]
+
+class Segment:
+    '''staffs of event arrays that all start at tick 0, and how to play them'''
+    def __init__(self, staffs, tempo='4=80', time_signature='4/4',
+                 key='c \\major', heading=''):
+        self.staffs = staffs
+        self.tempo = tempo
+        self.time_signature = time_signature
+        self.key = key
+        self.heading = heading
+        self.ticks = max([end(s.ts) for s in self.staffs] + [0])
+
+################## generating ##################
+def _repeat(events, times):
+    '''events played times times, one whole note apart'''
+    out = np.tile(events, times)
+    out['onset'] += np.repeat(np.arange(times) * TICKS, len(events))
+    return out
+
+def groove(pattern, measures):
+    '''drum staff playing a GROOVES entry for measures'''
+    one = np.concatenate([
+        events_from_notes([name if hit == 'x' else 'r' for hit in hits],
+                          unit=16, voice=i)
+        for i, (name, hits) in enumerate(sorted(pattern.items()))])
+    return Staff(_repeat(one[one['pitch'] != REST], measures), 'drum')
+
+def segment(key, rng, tempo='4=80'):
+    '''a progression in key, with an accompaniment chosen by rng'''
+    root = key + ("" if key in LOW_KEYS else "'")
+    scale = build_scale(root, 0)
+    progression = random_functional_progressions(1, rng=rng)[0]
+    chords = progression_degrees(progression)
+    names = progression_names(progression)
+
+    notes = []
+    if rng.integers(2):
+        pattern = ARPEGGIOS[rng.integers(len(ARPEGGIOS))]
+        for degrees in chords[:-1]:
+            notes += [scale(degrees[i]) for i in pattern]
+    else:
+        pattern = PICKINGS[rng.integers(len(PICKINGS))]
+        for degrees in chords[:-1]:
+            notes += [scale(degrees[i] + 7 * o) for i, o in pattern]
+    notes.append('r')
+    rhythm = [1] * (len(notes) - 1) + [8]
+    measures = len(chords)
+
+    staffs = [Staff(events_from_notes(notes, rhythm, unit=8)),
+              Staff(events_from_notes([chord(scale, d) for d in chords],
+                                      unit=1)),
+              groove(GROOVES[rng.integers(len(GROOVES))], measures)]
+    return Segment(staffs, tempo, key='{} \\major'.format(key),
+                   heading=", ".join(names))
+
+def session(seed=0, tempo='4=80', start=None):
+    '''
+    endless generator of segments, segment i only depends on (seed, i)
+    start: first key, random if None
+    '''
+    rng = sheet_rng(seed, 0)
+    first = KEYS.index(start) if start else int(rng.integers(len(KEYS)))
+    i = 0
+    while True:
+        yield segment(KEYS[(first + i) % len(KEYS)], sheet_rng(seed, i + 1),
+                      tempo)
+        i += 1
+
+def until(segments, minutes):
+    '''the segments that start before minutes of music have played'''
+    seconds = 0
+    for s in segments:
+        if seconds >= minutes * 60:
+            return
+        yield s
+        seconds += s.ticks / PPQ * quarter_seconds(s.tempo)
+
+################## sinks ##################
+class LilySink:
+    '''a LilyPond file with one \\score per segment'''
+    def __init__(self, path, heading='practice session'):
+        self.f = open(path, 'w')
+        self.f.write(render_header(heading) + '\n')
+
+    def write(self, segment):
+        self.f.write('% {}\n'.format(segment.heading))
+        self.f.write(render_body(segment.staffs, segment.tempo,
+                                 segment.time_signature, segment.key))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+class MidiSink:
+    '''
+    a format 0 Standard MIDI File, one track holding every channel; like
+    the .wav the file is valid after every segment: the track is ended
+    and its length patched in, the next segment writes over the end
+    '''
+    def __init__(self, path, heading='practice session'):
+        self.f = open(path, 'wb')
+        self.f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, PPQ))
+        self.f.write(b'MTrk\0\0\0\0')
+        self.length = 0 # of the track without its end
+        self.now = 0 # tick of the last message written
+        self.offset = 0 # tick the next segment starts at
+        self._write(meta_event(0x03, heading.encode('utf-8')))
+        self._end()
+
+    def _write(self, data):
+        self.f.write(data)
+        self.length += len(data)
+
+    def _end(self):
+        '''end the track where the last segment ends and patch its length'''
+        end = vlq(self.offset - self.now) + b'\xff\x2f\x00'
+        self.f.write(end)
+        self.f.truncate()
+        self.f.seek(18) # the MTrk length
+        self.f.write(struct.pack('>I', self.length + len(end)))
+        self.f.seek(22 + self.length) # the next segment replaces the end
+        self.f.flush()
+
+    def write(self, segment):
+        n, d = map(int, segment.time_signature.split('/'))
+        # tempo and time signature at the start of the segment
+        tempo = struct.pack('>I', tempo_microseconds(segment.tempo))[1:]
+        self._write(vlq(self.offset - self.now) + meta_event(0x51, tempo)[1:] +
+                    meta_event(0x58, bytes([n, d.bit_length() - 1, 24, 8])))
+        self.now = self.offset
+
+        messages = [note_messages(staff.ts, channel) for staff, channel in
+                    zip(segment.staffs, staff_channels(segment.staffs))]
+        times, status, keys, velocity = [np.concatenate(m) for m in
+                                         zip(*messages)]
+        order = np.lexsort((status >> 4, times)) # note offs first
+        times = times[order].astype(np.int64) + self.offset
+        deltas = np.diff(times, prepend=self.now)
+        self._write(encode_messages(deltas.tolist(), status[order].tolist(),
+                                    keys[order].tolist(),
+                                    velocity[order].tolist()))
+        if len(times):
+            self.now = int(times[-1])
+        self.offset += segment.ticks
+        self._end()
+
+    def close(self):
+        self.f.close()
+
+class WavSink:
+    '''
+    16 bit mono .wav; notes ringing past the end of a segment are carried
+    over into the next one, the header is valid after every segment
+    '''
+    def __init__(self, path, sample_rate=SAMPLE_RATE, gain=0.25):
+        self.f = open(path, 'wb')
+        self.wav = wave.open(self.f, 'wb')
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+        self.sample_rate = sample_rate
+        self.gain = gain
+        self.seconds = 0 # where the next segment starts
+        self.written = 0 # samples
+        self.carry = np.zeros(0, dtype=np.float32)
+
+    def _write(self, x):
+        x = np.tanh(self.gain * x)
+        self.wav.writeframes((x * 32767).astype('<i2').tobytes())
+        self.written += len(x)
+
+    def write(self, segment):
+        self.seconds += segment.ticks / PPQ * quarter_seconds(segment.tempo)
+        length = int(round(self.seconds * self.sample_rate)) - self.written
+        tracks = [staff_audio(staff, segment.tempo, self.sample_rate)
+                  for staff in segment.staffs]
+        x = np.zeros(max([length, len(self.carry)] + [len(t) for t in tracks]),
+                     dtype=np.float32)
+        for t in tracks + [self.carry]:
+            x[:len(t)] += t
+        self._write(x[:length])
+        self.carry = x[length:]
+        self.f.flush()
+
+    def close(self):
+        self._write(self.carry)
+        self.wav.close()
+        self.f.close()
+
+SINKS = {'ly': LilySink, 'midi': MidiSink, 'wav': WavSink}
+
+def stream(segments, sinks):
+    '''write every segment to every sink, then close them; returns the count'''
+    n = 0
+    try:
+        for s in segments:
+            for sink in sinks:
+                sink.write(s)
+            n += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+    return n
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="stream a practice session")
+    parser.add_argument('out', type=str, help='path without extension')
+    parser.add_argument('--minutes', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tempo', type=str, default='4=80')
+    parser.add_argument('--start', type=str, default=None, choices=KEYS,
+                        help='first key, random by default')
+    parser.add_argument('--formats', type=str, default='ly,midi,wav',
+                        help='comma separated, of ly, midi, wav')
+    args = parser.parse_args()
+
+    sinks = [SINKS[ext]('{}.{}'.format(args.out, ext))
+             for ext in args.formats.split(',')]
+    segments = until(session(args.seed, args.tempo, args.start), args.minutes)
+    print('{} segments'.format(stream(segments, sinks)))
@@ -45,9 +45,16 @@ EXAMPLES:
    ])
 
 '''
-import itertools, re
-from functools import partial
+import itertools
+from functools import lru_cache
 import numpy as np
+from pitch import note2number, number2note
+from lib.notes import MODES, SCALE_PATTERNS # pitch.py makes lib importable
+from rhythm import KNOWN_UNITS, rhythm_notation
+from score import Staff, render_score, events_from_notes, concat
+from chords import resolve_chord_mode, split_chord
+from midi import write_midi
+from synth import write_wav
 
 name2chord = {
     'I': [1, 3, 5],
@@ -60,56 +67,24 @@ name2chord = {
     'VIIdim': [7, 9, 11]
 }
 
-name2staff = {
-    'piano': '\\new PianoStaff',
-    'drum': '\drums'
-}
-
-class Staff:
-    ''' staff is just a bunch of note with instrument info'''
-    def __init__(self, ts, instrument='piano', clef='treble'):
-        self.instrument = instrument
-        self.ts = ts
-        self.clef = clef
-
 def main(staffs, tempo='4=140', time_signature='4/4', key='c \major',
          heading='simple chord', add_metronome=False,
-         metronome_measures=10):
+         metronome_measures=10, midi_file=None, wav_file=None):
     '''
     staffs: some lines of music
+    midi_file: also write a .midi file there, without lilypond
+    wav_file: also write a .wav file there, see synth.py
     '''
     assert type(staffs[0]) is Staff, 'melody should be list of staffs'
 
     if add_metronome:
         staffs.append(Staff(['hh4'] * 4 * metronome_measures, 'drum'))
 
-    body = "\score{\n << \n"
-    for staff in staffs:
-        body += "%s { \\clef %s \\tempo %s \\time %s %s \n"\
-                % (name2staff[staff.instrument], staff.clef,
-                   tempo, time_signature,
-                   '\key %s' % key if staff.instrument != 'drum' else '')
-        body += " ".join(staff.ts)
-        body += "}\n"
-    body += ">>\n \layout {} \midi{} }\n"
-
-    title = """\\version "2.18.2"
-    \header {
-    title = "%s"
-    composer = "Jiaxuan Wang"
-    tagline = "Copyright: MIT license"
-    }""" % heading
-
-    print(title + body)
-
-def binarize(n):
-    '''convert base 10 number "n" to list of binary digits'''
-    binary_repr = []
-    while n != 0:
-        n, digit = n // 2, n % 2
-        binary_repr.append(digit)
-    binary_repr = binary_repr[::-1]
-    return binary_repr
+    if midi_file:
+        write_midi(midi_file, staffs, tempo, time_signature, heading)
+    if wav_file:
+        write_wav(wav_file, staffs, tempo)
+    print(render_score(staffs, tempo, time_signature, key, heading))
 
 def chord(scale, degrees):
     '''a chord'''
@@ -120,43 +95,11 @@ def swing(chord1, chord2=None):
     chord2 = chord2 if chord2 else chord1
     return r"\tuplet 3/2 %s8~ %s %s " % (chord1, chord1, chord2)
 
-def note2number(note):
-    '''
-    calculate the absolute number from note to number
-    ex: "c" -> 0
-    ex: "fis''" -> 12 * 2 + 6 = 30
-    ex: "c," -> -12
-    '''
-    notes = ['c', 'd', 'e', 'f', 'g', 'a', 'b']
-    degrees = [0, 2, 4, 5, 7, 9, 11]
-    n = degrees[notes.index(note[0])]
-    c = ""
-    for p in range(1, len(note)):
-        c = c + note[p]
-        if c == 'is':
-            n += 1
-            c = ""
-        elif c == 'es':
-            n -= 1
-            c = ""
-        elif c == "'":
-            n += 12
-            c = ""
-        elif c == ',':
-            n -= 12
-            c = ""
-    assert c == "", "have unparsed note {}".format(c)
-    return n
-
-def number2note(n):
-    '''
-    the inverse of note2number
-    but this is still ambiguous: e.g., fes = e = disis,
-    need to be given scale to determine what is, now not supported
-    '''
-    notes = ['c', 'cis', 'd', 'ees', 'e', 'f', 'fis', 'g', 'gis', 'a', 'bes', 'b']
-    note, pitch = notes[n % 12], n // 12
-    return note + ("," if pitch < 0 else "'") * abs(pitch)
+# offset from the root of degree 1..7 of every scale in lib.notes, the
+# church modes and the natural, harmonic and melodic (going up) minors
+MODE_OFFSETS = dict(
+    (m, tuple(int(d) for d in np.cumsum(pattern)[:7]))
+    for m, pattern in SCALE_PATTERNS.items())
 
 def build_scale(root, mode='Ionian'):
     '''
@@ -166,16 +109,21 @@ def build_scale(root, mode='Ionian'):
     or
     scale = build_scale('c', 1)
     main([Staff([scale(i) for i in range(1, 8)])])
+
+    scales are cached, the same (root, mode) returns the same function
     '''
-    modes = ['ionian', 'dorian', 'phrygian', 'lydian', 'mixolydian',
-             'aeolian', 'locrian']
-    # convert mode to number
+    # convert mode to name
     if type(mode) is str:
-        mode = dict((a, b) for a, b in zip(modes, range(len(modes))))[mode.lower()]
+        mode = mode.lower()
+    else:
+        mode = MODES[mode]
+    return _build_scale(root, mode)
 
-    diffs = [2, 2, 1, 2, 2, 2, 1] # diff between nodes in 'ionian'
-    diffs = np.cumsum([0] + diffs[mode:] + diffs[:mode])
+@lru_cache(maxsize=None)
+def _build_scale(root, mode):
+    assert mode in MODE_OFFSETS, "mode must be in {}".format(list(MODE_OFFSETS))
     n = note2number(root)
+    pitches = tuple(n + d for d in MODE_OFFSETS[mode])
 
     def scale(degree):
         '''degree can be a number, or a tuple with offset, or r for rest'''
@@ -186,8 +134,12 @@ def build_scale(root, mode='Ionian'):
         else:
             return degree # handles cases like 'r', 'hihat' etc.
         idx, span  = (degree - 1) % 7, (degree - 1) // 7
-        return number2note(n + span * 12 + diffs[idx] + offset)
+        return number2note(pitches[idx] + span * 12 + offset)
 
+    scale.root, scale.mode = root, mode
+    # degree 1..7 -> absolute number, see note2number
+    scale.pitches = np.array(pitches)
+    scale.pitches.flags.writeable = False
     return scale
 
 ################## degrees manipulation ############
@@ -205,6 +157,51 @@ def invert(degrees, root=1):
     return res
 
 ################## add flavors #############
+def iter_rhythm(notes, rhythm=None, unit=16):
+    '''
+    generator form of add_rhythm, yields one token at a time
+    notes and rhythm may be any iterables, eg. generators; notes are only
+    repeated when they are a sequence (list, tuple, array), a stream of
+    notes is consumed as it goes and must last as long as the rhythm
+    '''
+    assert unit in KNOWN_UNITS, "unit must in {}".format(KNOWN_UNITS)
+    if rhythm is None: # each note takes unit time
+        for note in notes:
+            yield rhythm_notation(1, note, unit)
+        return
+
+    if hasattr(notes, '__getitem__'):
+        n_notes = len(notes)
+        if n_notes == 0: return
+        def note_at(i):
+            return notes[i % n_notes]
+    else: # a stream is read once and never kept, so it can not repeat
+        end = object()
+        notes = iter(notes)
+        pending = [next(notes, end)]
+        if pending[0] is end: return
+        def note_at(i): # called once per i, in order
+            note = pending.pop() if pending else next(notes, end)
+            assert note is not end,\
+                "rhythm is longer than the notes, repeating needs a list"
+            return note
+
+    i = 0 # index of the next note to consume, repeating notes when out
+    for duration in rhythm:
+        if type(duration) in [tuple, list]: # tuplet
+            n_to_eat, duration = duration
+        else: # regular
+            n_to_eat = 1
+
+        if n_to_eat == 1: # regular
+            yield rhythm_notation(duration, note_at(i), unit)
+        else: # tuplet
+            yield '\\tuplet %d/%d {' % (n_to_eat, duration)
+            for k in range(n_to_eat):
+                yield '{}{}'.format(note_at(i + k), unit)
+            yield '}'
+        i += n_to_eat
+
 def add_rhythm(notes, rhythm=None, unit=16):
     '''
     if rhythm is None, each note takes unit time
@@ -217,85 +214,9 @@ def add_rhythm(notes, rhythm=None, unit=16):
             where (1, 2) means 1 note taking 2 unit times.
             This notation helps write triplets, e.g.,
             (3, 2) means 3 notes taking 2 unit times
-    output: list of notes with rhythm
+    output: list of notes with rhythm, see iter_rhythm for a generator
     '''
-    if len(notes) == 0: return []
-    
-    if rhythm is None:
-        rhythm = [1] * len(notes)
-
-    def simplify(duration, note, unit=16):
-        '''
-        make the single note have duration amount of time
-        it tries to simplify the note written
-        notes are tied together by ties
-        '''
-        known_units = [1, 2, 4, 8, 16, 32, 64]
-        assert unit in known_units, "unit must in {}".format(known_units)
-
-        # binary representation: so I can simplify to how many 1, 2, etc.
-        # with unit as the smallest granularity
-        # pad so that the first entry is a note of unit 1
-        binary_repr = binarize(duration)
-        n_digits = known_units.index(unit) + 1
-        binary_repr = [0] * (n_digits - len(binary_repr)) + binary_repr
-
-        # further simplify by collecting nearby repr
-        # for idx in range(1, len(binary_repr)): # front to back
-        for idx in range(len(binary_repr)-1, 0, -1): # back to front
-            if binary_repr[idx-1] == 1 and binary_repr[idx] == 1:
-                binary_repr[idx-1] += 1
-                binary_repr[idx] = 0
-
-        # add ties
-        notes = ['{}{}'.format(note, unit) + ("." if count > 1 else "")\
-                 for unit, count in zip(known_units, binary_repr)\
-                 if count != 0]
-
-        if note != 'r': # rest has no tie
-            for i in range(len(notes)-1):
-                notes[i] += '~'
-
-        return ' '.join(notes)
-
-    def rhythm_to_noteconsumer(rhythm):
-        '''
-        Given a rhythm list, return a note consumer
-
-        a note consumer is a function
-        input: list of note
-        output: list of notes embellished by rhythm
-        '''
-        def consumer(notes):
-            orig_notes = notes
-            out = []
-            for duration in rhythm:
-                if type(duration) in [tuple, list]: # tuplet
-                    n_to_eat, duration = duration
-                else: # regular
-                    n_to_eat = 1
-
-                # append more notes when notes run out
-                if len(notes) < n_to_eat:
-                    notes = notes + orig_notes
-                
-                consumed = notes[:n_to_eat]
-                notes = notes[n_to_eat:]
-
-                if n_to_eat == 1: # regular
-                    out.append(simplify(duration, consumed[0], unit=unit))
-                else: # tuplet
-                    out.extend(
-                        ['\\tuplet %d/%d {' % (n_to_eat, duration)] +
-                        ['{}{}'.format(note, unit) for note in consumed] +
-                        ['}']
-                    )
-
-            return out
-
-        return consumer
-
-    return rhythm_to_noteconsumer(rhythm)(notes)
+    return list(iter_rhythm(notes, rhythm, unit))
 
 def add_chord_names(chords):
     '''
@@ -337,13 +258,14 @@ def tweleve_bar_blues(scale=build_scale('c', 'ionian')):
     main([Staff(ts)], tempo='4=160')
 
 ################## improvisation for 1 bar ########
-def random_notes(scale):
+def random_notes(scale, rng=None):
     '''
     random for 1 bar, choose from a scale and the rest bar
+    rng: np.random.Generator, the global np.random if None
     '''
     choose_from = [scale(i) for i in range(1,8)] + ['r']
     # return [scale(i) for i in np.random.choice(range(1,8), 7)] + ['r']
-    return np.random.choice(choose_from, 8)
+    return _choice(rng, choose_from, 8)
 
 def up_scale(scale):
     '''
@@ -357,18 +279,21 @@ def down_scale(scale):
     '''
     return [scale(i) for i in list(range(8,1,-1))] + ['r']
 
-def random_rhythm(unit=8):
+def random_rhythm(unit=8, rng=None):
     '''random rhythm for unit beats'''
     res = []
     curr = 0
     while curr < unit:
-        cand = np.random.choice(range(1, unit+1))
+        cand = _choice(rng, range(1, unit+1))
         res.append(min(cand, unit-curr))
         curr += res[-1]
     return res
 
-def dorian_improv():
-    '''for improvisation: https://www.youtube.com/watch?v=o7dGlZAMKi0'''
+def dorian_improv(rng=None):
+    '''
+    for improvisation: https://www.youtube.com/watch?v=o7dGlZAMKi0
+    rng: np.random.Generator, the global np.random if None
+    '''
     mode = 'dorian'
     root = 'd'
     scale = build_scale(root, mode)
@@ -383,14 +308,14 @@ def dorian_improv():
         mel = [scale(i) for i in [1, 3, 5, 7, 7, 8, 6, 6]]
         pieces = [mel, ['r'],
                   down_scale(scale),
-                  random_notes(scale),
-                  random_notes(scale),
-                  random_notes(scale),
+                  random_notes(scale, rng),
+                  random_notes(scale, rng),
+                  random_notes(scale, rng),
                   up_scale(scale)]
         upper = add_rhythm(list(itertools.chain(*pieces)), unit=8)
 
     else:
-        pieces = [add_rhythm(random_notes(scale), random_rhythm(),
+        pieces = [add_rhythm(random_notes(scale, rng), random_rhythm(rng=rng),
                              unit=8) for _ in range(measures)]
         upper = list(itertools.chain(*pieces))
 
@@ -402,41 +327,143 @@ def dorian_improv():
 '''standard chord progressions
 and chord progressions that I picked up over the years
 '''
-def random_functional_chords(scale, M=None, m=None):
+HOME = [['I'], ['I', 'III'], ['I', 'VI'], ['I', 'III', 'VI'], ['I', 'VI', 'III']]
+BRIDGE = [['IV'], ['II'], ['IV', 'II'], ['II', 'IV']]
+OUTSIDE = [['V7'], ['V'], ['VIIdim']]
+CHORD_NAMES = list(name2chord)
+MAX_CHORDS = 7 # longest home + bridge + outside + I
+MAX_DEGREES = 6 # a 4 note chord and the 2 degrees match_max_min may add
+
+def _name_table(options):
+    '''ragged lists of chord names -> padded index array, -1 pads'''
+    width = max(len(o) for o in options)
+    return np.array([[CHORD_NAMES.index(name) for name in o] +
+                     [-1] * (width - len(o)) for o in options])
+
+HOME_IDX, BRIDGE_IDX, OUTSIDE_IDX = map(_name_table, [HOME, BRIDGE, OUTSIDE])
+CHORD_SIZES = np.array([len(name2chord[name]) for name in CHORD_NAMES])
+CHORD_DEGREES = np.array([name2chord[name] + [0] * (4 - len(name2chord[name]))
+                          for name in CHORD_NAMES])
+
+PROGRESSION_DTYPE = np.dtype([
+    ('length', 'u1'), # number of chords
+    ('names', 'U6', (MAX_CHORDS,)),
+    ('degrees', 'i1', (MAX_CHORDS, MAX_DEGREES)),
+    ('n_degrees', 'u1', (MAX_CHORDS,)) # degrees used in each chord
+])
+
+def _draw(rng, high, n):
+    '''n ints below high, from the global np.random if rng is None'''
+    if rng is None:
+        return np.random.randint(high, size=n)
+    return rng.integers(high, size=n)
+
+def _choice(rng, options, size=None):
+    '''like np.random.choice, from the global np.random if rng is None'''
+    if rng is None:
+        return np.random.choice(options, size)
+    return rng.choice(options, size)
+
+def sheet_rng(seed, index):
+    '''
+    the independent stream of sheet index in a batch generated from seed,
+    the same as np.random.SeedSequence(seed).spawn(n)[index] for any n, so
+    a sheet can be regenerated alone and batches split across processes
+    '''
+    return np.random.default_rng(np.random.SeedSequence(seed,
+                                                        spawn_key=(index,)))
+
+def _match_max_min(degrees, count, M, m):
+    '''
+    match_max_min for many chords at once, one per row
+    degrees: (n, MAX_DEGREES) with count[i] used, M, m: (n,)
+    returns degrees, count and the new max and min
+    '''
+    valid = np.arange(MAX_DEGREES) < count[:, None]
+    Mc, mc = M[:, None], m[:, None]
+    above = (degrees > Mc) & ((degrees - Mc) % 7 > 1)
+    below = ~above & (degrees < mc) & ((mc - degrees) % 7 > 1)
+    degrees = np.where(valid & above, Mc + (degrees - Mc) % 7 - 7,
+                       np.where(valid & below, mc - (mc - degrees) % 7 + 7,
+                                degrees))
+    hi = np.where(valid, degrees, -128).max(axis=1)
+    lo = np.where(valid, degrees, 127).min(axis=1)
+    rows = np.arange(len(degrees))
+    # an octave lower top note when the chord sits too high, and the
+    # other way round, the appended notes keep hi (then lo) unchanged
+    add = lo > m + 1
+    degrees[rows[add], count[add]] = hi[add] - 7
+    lo = np.where(add, np.minimum(lo, hi - 7), lo)
+    count = count + add
+    add = hi < M - 1
+    degrees[rows[add], count[add]] = lo[add] + 7
+    hi = np.where(add, np.maximum(hi, lo + 7), hi)
+    count = count + add
+    return degrees, count, hi, lo
+
+def random_functional_progressions(n, M=None, m=None, rng=None):
+    '''
+    n common functional chord progressions at once, a PROGRESSION_DTYPE
+    array; sampling and max/min matching as in random_functional_chords,
+    vectorized over the n progressions
+    M is the maximum degree to match, m is minimum degree to match
+    rng: np.random.Generator, the global np.random if None
+    '''
+    ids = np.concatenate([HOME_IDX[_draw(rng, len(HOME), n)],
+                          BRIDGE_IDX[_draw(rng, len(BRIDGE), n)],
+                          OUTSIDE_IDX[_draw(rng, len(OUTSIDE), n)],
+                          np.full((n, 1), CHORD_NAMES.index('I'))], axis=1)
+    # pads to the end of each row
+    ids = np.take_along_axis(ids, np.argsort(ids < 0, axis=1, kind='stable'),
+                             axis=1)
+    out = np.zeros(n, dtype=PROGRESSION_DTYPE)
+    out['length'] = (ids >= 0).sum(axis=1)
+    out['names'] = np.where(ids >= 0, np.array(CHORD_NAMES)[ids], '')
+
+    match = M is not None and m is not None
+    M = np.full(n, 0 if M is None else M)
+    m = np.full(n, 0 if m is None else m)
+    for k in range(MAX_CHORDS):
+        rows = np.flatnonzero(ids[:, k] >= 0)
+        if len(rows) == 0:
+            break
+        chord_ids = ids[rows, k]
+        degrees = np.zeros((len(rows), MAX_DEGREES), dtype=np.int64)
+        degrees[:, :4] = CHORD_DEGREES[chord_ids]
+        count = CHORD_SIZES[chord_ids]
+        if match:
+            degrees, count, hi, lo = _match_max_min(degrees, count,
+                                                    M[rows], m[rows])
+        else: # the first chord is kept when there is nothing to match
+            valid = np.arange(MAX_DEGREES) < count[:, None]
+            hi = np.where(valid, degrees, -128).max(axis=1)
+            lo = np.where(valid, degrees, 127).min(axis=1)
+        out['degrees'][rows, k] = degrees
+        out['n_degrees'][rows, k] = count
+        M[rows], m[rows] = hi, lo
+        match = True
+    return out
+
+def progression_degrees(progression):
+    '''one PROGRESSION_DTYPE row -> list of degree lists'''
+    return [progression['degrees'][k, :c].tolist()
+            for k, c in enumerate(progression['n_degrees']
+                                  [:progression['length']].tolist())]
+
+def progression_names(progression):
+    return progression['names'][:progression['length']].tolist()
+
+def random_functional_chords(scale, M=None, m=None, rng=None):
     '''build common functional chord progressions
     M is the maximum degree to match
     m is minimum degree to match
+    rng: np.random.Generator, the global np.random if None
+    see random_functional_progressions to sample many at once
     '''
-    home = [['I'], ['I', 'III'], ['I', 'VI'], ['I', 'III', 'VI'], ['I', 'VI', 'III']]
-    bridge = [['IV'], ['II'], ['IV', 'II'], ['II', 'IV']]
-    outside = [['V7'], ['V'], ['VIIdim']]
-    names = np.random.choice(home) + np.random.choice(bridge) + \
-        outside[np.random.choice(len(outside))] + ['I']
-    # build the chords
-    chords_deg = [name2chord[name] for name in names]
-
-    # simplify chords by matching max and min
-    def match_max_min(degrees, M=None, m=None): # M is max, m is min
-        if M is None or m is None: return degrees
-        new_degrees = []
-        for deg in degrees:
-            if deg > M and (deg-M) % 7 > 1:
-                deg = M + (deg-M) % 7 - 7
-            elif deg < m and (m-deg) % 7 > 1:
-                deg = m - (m-deg) % 7 + 7
-            new_degrees.append(deg)
-        if min(new_degrees) > m + 1:
-           new_degrees.append(max(new_degrees) - 7)
-        if max(new_degrees) < M - 1:
-           new_degrees.append(min(new_degrees) + 7)
-        return new_degrees
-
-    matched_chords_deg = []
-    for degrees in chords_deg:
-        degrees = match_max_min(degrees, M, m)
-        matched_chords_deg.append(degrees)
-        M, m = max(degrees), min(degrees)
-    return [chord(scale, i) for i in matched_chords_deg], names
+    progression = random_functional_progressions(1, M, m, rng)[0]
+    return [chord(scale, degrees)
+            for degrees in progression_degrees(progression)],\
+        progression_names(progression)
 
 def chord_progression0():
     play_chord_mode(['b:m', 'g', 'd', 'a'], heading="D maj vi IV I V")
@@ -489,42 +516,230 @@ def melody(degrees, rhythm=None, scale=build_scale("c'"), unit=4,
                     rhythm_transform(rhythm), unit=unit)
     return ts
 
+def melody_events(degrees, rhythm=None, scale=build_scale("c'"), unit=4,
+                  degree_transform=lambda x: x,
+                  rhythm_transform=lambda x: x):
+    '''like melody, but returns an event array, see score.py'''
+    return events_from_notes([scale(i) for i in degree_transform(degrees)],
+                             rhythm_transform(rhythm), unit=unit)
+
+def chord_events(scale, degrees, duration=1, unit=1):
+    '''a chord as events, lasting duration 1/unit notes'''
+    return events_from_notes([chord(scale, degrees)], [duration], unit=unit)
+
+################# lazy variations ################
+def _hashable(x):
+    '''lists inside degrees and rhythm -> tuples, for memo keys'''
+    if type(x) in [tuple, list]:
+        return tuple(_hashable(i) for i in x)
+    return x
+
+@lru_cache(maxsize=256)
+def _slots(degrees, rhythm):
+    '''
+    pair degrees with rhythm once per source, like add_rhythm does:
+    one (degrees, duration) per rhythm entry, tuplets hold n degrees
+    '''
+    if rhythm is None:
+        return tuple(((d,), 1) for d in degrees)
+    if len(degrees) == 0:
+        return ()
+    slots, i = [], 0
+    for duration in rhythm:
+        n = duration[0] if type(duration) is tuple else 1
+        slots.append((tuple(degrees[(i + k) % len(degrees)]
+                            for k in range(n)), duration))
+        i += n
+    return tuple(slots)
+
+def _invert_degree(d, root):
+    if type(d) is int:
+        return root - (d - 1)
+    if type(d) is tuple:
+        return (root - (d[0] - 1), -d[1])
+    return d # rests, drums and chords stay
+
+def _transpose_degree(d, steps):
+    if type(d) is int:
+        return d + steps
+    if type(d) is tuple:
+        return (d[0] + steps, d[1])
+    return d
+
+DEGREE_OPS = {'invert': _invert_degree, 'transpose': _transpose_degree}
+
+def _stretch(duration, k):
+    if type(duration) is tuple: # tuplet keeps its notes, spans k times longer
+        return (duration[0], duration[1] * k)
+    return duration * k
+
+@lru_cache(maxsize=1024)
+def _fuse(source, chain):
+    '''
+    (notes, rhythm, unit) of a source after the transform chain, in one
+    pass: order ops become an index array over the slots, degree ops are
+    composed per distinct degree, scale and rhythm ops fold into the
+    scale, a duration factor and the unit
+    '''
+    degrees, rhythm, root, mode, unit = source
+    slots = _slots(degrees, rhythm)
+    order = np.arange(len(slots))
+    backwards, factor, degree_ops = False, 1, []
+    for op, args in chain:
+        if op == 'retrograde':
+            order, backwards = order[::-1], not backwards
+        elif op == 'repeat':
+            order = np.tile(order, args[0])
+        elif op == 'augment':
+            factor *= args[0]
+        elif op == 'diminish':
+            unit *= args[0]
+        elif op == 'mode':
+            mode = args[0]
+        elif op == 'shift':
+            root = number2note(note2number(root) + args[0])
+        elif op == 'scale':
+            root, mode = args
+        else:
+            degree_ops.append((DEGREE_OPS[op], args))
+
+    scale = build_scale(root, mode)
+    memo = {}
+    def note(d):
+        if d not in memo:
+            x = d
+            for f, args in degree_ops:
+                x = f(x, *args)
+            memo[d] = scale(x)
+        return memo[d]
+
+    notes, new_rhythm = [], []
+    for i in order.tolist():
+        degs, duration = slots[i]
+        notes.extend(note(d) for d in (degs[::-1] if backwards else degs))
+        new_rhythm.append(_stretch(duration, factor))
+    return tuple(notes), tuple(new_rhythm), unit
+
+@lru_cache(maxsize=1024)
+def _tokens(source, chain):
+    return tuple(iter_rhythm(*_fuse(source, chain)))
+
+class Phrase:
+    '''
+    a lazy melody: degrees, rhythm, scale and unit as in melody, plus a
+    chain of transforms; nothing is computed until the phrase is
+    rendered, then the whole chain runs as one pass over the source and
+    the result is memoized by (source, chain)
+
+    example usage:
+    p = Phrase([1, 2, 3, 5], [2, 1, 1, 4], build_scale("c'"), unit=8)
+    main([Staff(Suite([p, p.invert(5), p.mode('aeolian').retrograde(),
+                       p.transpose(2).augment().repeat(2)]))])
+    '''
+    def __init__(self, degrees, rhythm=None, scale=build_scale("c'"),
+                 unit=4):
+        self.source = (_hashable(degrees), _hashable(rhythm),
+                       scale.root, scale.mode, unit)
+        self.chain = ()
+
+    def then(self, op, *args):
+        '''a new phrase with op appended to the chain'''
+        phrase = Phrase.__new__(Phrase)
+        phrase.source, phrase.chain = self.source, self.chain + ((op, args),)
+        return phrase
+
+    def invert(self, root=1):
+        '''mirror degrees around root, see invert'''
+        return self.then('invert', root)
+
+    def transpose(self, steps):
+        '''move every degree by steps within the scale'''
+        return self.then('transpose', steps)
+
+    def shift(self, semitones):
+        '''move the scale root by semitones'''
+        return self.then('shift', semitones)
+
+    def mode(self, mode):
+        '''same root, another mode, eg. 'aeolian' or 5'''
+        return self.then('mode', mode.lower() if type(mode) is str
+                         else MODES[mode])
+
+    def with_scale(self, scale):
+        return self.then('scale', scale.root, scale.mode)
+
+    def retrograde(self):
+        return self.then('retrograde')
+
+    def augment(self, k=2):
+        '''durations k times longer'''
+        return self.then('augment', k)
+
+    def diminish(self, k=2):
+        '''durations k times shorter'''
+        return self.then('diminish', k)
+
+    def repeat(self, n=2):
+        return self.then('repeat', n)
+
+    def notes(self):
+        '''(notes, rhythm, unit) ready for add_rhythm'''
+        return _fuse(self.source, self.chain)
+
+    def tokens(self):
+        return _tokens(self.source, self.chain)
+
+    def events(self):
+        notes, rhythm, unit = self.notes()
+        return events_from_notes(notes, rhythm, unit=unit)
+
+    def __iter__(self):
+        return iter(self.tokens())
+
+class Suite:
+    '''phrases played one after another, still lazy, usable as Staff(Suite(...))'''
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.phrases)
+
+    def events(self):
+        return concat([p.events() for p in self.phrases])
+
 ################# specific variations #############
 def variation_idea0(degrees, rhythm, scale, unit, tempo):
     '''
     uses melody and performs certain predefined
     variation on a given piece
     '''
-    mels = []
     # original melody
-    mels.append(melody(degrees, rhythm, scale, unit))
+    source = Phrase(degrees, rhythm, scale, unit)
+    mels = [source]
     # build other variations
     ### inversion
-    for degree_transform in [partial(invert, root=5)]:
-        mels.append(melody(degrees, rhythm, scale, unit,
-                                     degree_transform))
+    mels.append(source.invert(5))
     ### change scale
     for s in [build_scale("bes'", 'aeolian'),
               build_scale("b'", 'aeolian'),
               build_scale("c''", 'aeolian')]:
-        mels.append(melody(degrees, rhythm, s, unit))
+        mels.append(source.with_scale(s))
     ### ending
-    mels.append(add_rhythm(up_scale(s), unit=unit))
-    mels.append(add_rhythm(down_scale(s), unit=unit))
-    mels.append(
-        add_rhythm([chord(s, [1, 3, 5]),
-                    chord(s, [0, 2, 4, (6, -1)]),
-                    chord(s, [1-7, 3-7, 5-7])],
-                   unit=2),
-    )
-
-    # output sound
-    lines = [Staff(list(itertools.chain(*mels)))]
+    mels.append(Phrase(list(range(1, 8)) + ['r'], scale=s, unit=unit))
+    mels.append(Phrase(list(range(8, 1, -1)) + ['r'], scale=s, unit=unit))
+    mels.append(Phrase([chord(s, [1, 3, 5]),
+                        chord(s, [0, 2, 4, (6, -1)]),
+                        chord(s, [1-7, 3-7, 5-7])], scale=s, unit=2))
+
+    # output sound, the phrases are only evaluated here
+    lines = [Staff(Suite(mels))]
     main(lines, tempo=tempo)
 
-def practice0():
+def practice0(progressions=None, rng=None):
     '''
     daily practice routinue with common chord progression
+    progressions: 2 rows of random_functional_progressions, sampled if None
+    rng: np.random.Generator, the global np.random if None; see sheet_rng
     '''
     def pattern(scale, degrees, unit=8):
         # change the pattern below to create different excercises
@@ -537,12 +752,16 @@ def practice0():
         # new_degrees = [degrees[i] for i in [0,1,2,2,1,0]]
         return add_rhythm([scale(d) for d in new_degrees], unit=unit)
 
-    root = chr(ord('a') + np.random.randint(8))
+    root = chr(ord('a') + _draw(rng, 7, None)) # a to g
     scale = build_scale("{}'".format(root), 0)    
     mel0, mel1 = [], []
     n_measures = 0
-    for i in range(2):
-        chords, names = random_functional_chords(scale)
+    if progressions is None:
+        progressions = random_functional_progressions(2, rng=rng)
+    for progression in progressions:
+        names = progression_names(progression)
+        chords = [chord(scale, degrees)
+                  for degrees in progression_degrees(progression)]
         last_chord = chords[-1]
         chords, names = chords[:-1], names[:-1]
         mel0.extend(list(itertools.chain(*[pattern(scale, name2chord[name])\
@@ -785,31 +1004,22 @@ def play_notes(notes, unit=1, heading=""):
 
 def chord_mode(chords, rhythm=None, unit=1):
     '''given a sequence of chords play the chords out'''
-    def idx_end_note(note_str):
-        '''given note str, e.g, "c'':m" return 3'''
-        # idx = 1
-        # while len(note_str) > idx and note_str[idx] in ["'", ","] :
-        #     idx += 1
-        # return idx
-        return re.search("[a-z][es|is]*['|,]*", note_str).end()
-
     def add_modifiers(chords, modifiers):
-        # return [(c if m == '' else c + ':' + m)
-        #         for c, m in zip(chords, modifiers)]
         return [(c + m)
                 for c, m in zip(chords, modifiers)]
 
-    chords, modifiers = list(zip(*map(lambda c:
-                                      #c.split(':') if ':' in c else [c,''],
-                                      (c[:idx_end_note(c)],
-                                       c[idx_end_note(c):]),
-                                      chords)))
+    chords, modifiers = list(zip(*map(split_chord, chords)))
     chord_music = ['\chordmode {'] +\
         add_modifiers(add_rhythm(chords, rhythm, unit=unit),
                       modifiers) + ['}']
 
     return add_chord_names(chord_music)
 
+def chord_mode_events(chords, rhythm=None, unit=1):
+    '''like chord_mode, but returns an event array of the chord pitches'''
+    return events_from_notes([resolve_chord_mode(c) for c in chords],
+                             rhythm, unit=unit)
+
 def play_chord_mode(chords, rhythm=None, unit=1, heading=""):
     chords = chord_mode(chords, rhythm, unit)
     main([Staff(chords)], heading=heading)
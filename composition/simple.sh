@@ -3,8 +3,14 @@ echo $1
 rm output/tmp.*
 python simple.py | tee output/tmp.ly
 cd output
-lilypond tmp.ly
-ps2pdf tmp.ps || { echo 'my_command failed' ; exit 1; }
-
-timidity tmp.midi
+# AUDIO_ONLY=1 ./simple.sh skips engraving and playback,
+# midi.py and synth.py write tmp.midi and tmp.wav
+if [ -n "$AUDIO_ONLY" ]; then
+    python ../midi.py tmp.ly
+    python ../synth.py tmp.ly
+else
+    # lilypond and ps2pdf only run when tmp.ly is new, see render_cache.py
+    python ../render_cache.py tmp.ly || { echo 'my_command failed' ; exit 1; }
+    timidity tmp.midi
+fi
 cd -
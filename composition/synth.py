@@ -0,0 +1,212 @@
+'''
+offline synthesizer: staffs -> PCM with numpy, written as .wav
+
+pitched notes are a few decaying harmonics shaped by an ADSR envelope,
+drum hits come from a small bank of synthesized one shot samples;
+audio is rendered in chunks, so memory stays bounded however long the
+piece is
+
+example usage:
+write_wav('output/tmp.wav', [Staff(melody([1, 3, 5])),
+                             Staff(['sn4', 'hh', 'hh', 'hh'], 'drum')])
+
+from the command line, a .ly file written by this repo:
+python synth.py output/tmp.ly # writes output/tmp.wav
+'''
+import os
+import sys
+import wave
+from functools import lru_cache
+import numpy as np
+from score import DRUM_BASE
+from midi import (PPQ, KEY_OFFSET, quarter_seconds,
+                  staff_events, merge_ties)
+from lily import parse_score
+
+SAMPLE_RATE = 44100
+CHUNK = 8192 # samples rendered at once
+
+# seconds, and the sustain level
+ATTACK, DECAY, SUSTAIN, RELEASE = 0.005, 0.4, 0.35, 0.08
+HARMONICS = np.array([1, 0.5, 0.25, 0.12], dtype=np.float32)
+
+NOTE_DTYPE = np.dtype([('start', 'i8'), ('length', 'i8'), ('stop', 'i8'),
+                       ('freq', 'f4'), ('amp', 'f4'), ('drum', 'i2')])
+
+################## percussion ##################
+def _sweep(t, f0, f1, time):
+    '''phase of a sine gliding from f0 to f1 Hz with time constant time'''
+    return 2 * np.pi * (f1 * t + (f0 - f1) * time * (1 - np.exp(-t / time)))
+
+@lru_cache(maxsize=None)
+def drum_sample(key, sample_rate=SAMPLE_RATE):
+    '''one shot float32 sample for a general midi drum key'''
+    rng = np.random.default_rng(key) # the same hit every time
+    def noise(seconds):
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        return t, rng.uniform(-1, 1, len(t))
+
+    if key in (35, 36): # bass drum
+        t, _ = noise(0.35)
+        x = np.sin(_sweep(t, 160, 45, 0.04)) * np.exp(-t / 0.12)
+    elif key in (37, 38, 40): # snare, side stick
+        t, n = noise(0.25)
+        x = 0.7 * n * np.exp(-t / 0.06) +\
+            0.5 * np.sin(2 * np.pi * 185 * t) * np.exp(-t / 0.05)
+    elif key in (42, 44, 46): # hihat closed, pedal, open
+        t, n = noise(0.5 if key == 46 else 0.12)
+        hiss = np.diff(n, prepend=0) / 2 # crude high pass
+        x = 0.5 * hiss * np.exp(-t / (0.2 if key == 46 else 0.025))
+    elif key in (49, 51, 52, 55, 57, 59): # cymbals
+        t, n = noise(1.2)
+        x = 0.4 * np.diff(n, prepend=0) / 2 * np.exp(-t / 0.4)
+    elif key in (41, 43, 45, 47, 48, 50): # toms, higher key higher pitch
+        t, _ = noise(0.4)
+        f = 80 * 2 ** ((key - 41) / 12)
+        x = np.sin(_sweep(t, 1.5 * f, f, 0.05)) * np.exp(-t / 0.15)
+    else: # percussion without a voice of its own, a short click
+        t, n = noise(0.08)
+        x = 0.5 * n * np.exp(-t / 0.015)
+    x = x.astype(np.float32)
+    x.flags.writeable = False
+    return x
+
+################## notes ##################
+def note_table(staffs, tempo='4=140', sample_rate=SAMPLE_RATE, gains=None):
+    '''
+    NOTE_DTYPE array of every note in the staffs, sorted by start
+    start, length, stop in samples, stop includes the release or the
+    drum sample; drum is the midi key of drum hits and -1 otherwise
+    gains: per staff volume, 1 by default
+    '''
+    samples_per_tick = quarter_seconds(tempo) / PPQ * sample_rate
+    tables = []
+    for k, staff in enumerate(staffs):
+        events = merge_ties(staff_events(staff))
+        drum = (events['pitch'] >= DRUM_BASE) | (staff.instrument == 'drum')
+        keys = np.where(events['pitch'] >= DRUM_BASE,
+                        events['pitch'] - DRUM_BASE,
+                        events['pitch'].astype(np.int32) + KEY_OFFSET)
+        notes = np.zeros(len(events), dtype=NOTE_DTYPE)
+        notes['start'] = np.round(events['onset'] * samples_per_tick)
+        notes['length'] = np.round(events['duration'] * samples_per_tick)
+        notes['freq'] = 440 * 2 ** ((keys - 69) / 12)
+        notes['amp'] = events['velocity'] / 127 * \
+            (1 if gains is None else gains[k])
+        notes['drum'] = np.where(drum, keys, -1)
+        tables.append(notes)
+    notes = np.concatenate(tables) if tables else np.zeros(0, NOTE_DTYPE)
+
+    release = int(RELEASE * sample_rate)
+    notes['stop'] = notes['start'] + notes['length'] + release
+    for key in np.unique(notes['drum'][notes['drum'] >= 0]).tolist():
+        hits = notes['drum'] == key
+        notes['stop'][hits] = notes['start'][hits] + \
+            len(drum_sample(key, sample_rate))
+    return notes[np.argsort(notes['start'], kind='stable')]
+
+def envelope(t, length, sample_rate=SAMPLE_RATE):
+    '''
+    ADSR level at times t (seconds, one row per note) of notes
+    lasting length samples, 0 outside the note and its release
+    '''
+    held = length[:, None] / sample_rate
+    level = np.where(t < ATTACK, t / ATTACK,
+                     SUSTAIN + (1 - SUSTAIN) *
+                     np.exp(-np.maximum(t - ATTACK, 0) / DECAY * 4))
+    release = np.clip(1 - (t - held) / RELEASE, 0, 1)
+    return np.where(t < 0, 0, level * release)
+
+def _tones(notes, c0, c1, sample_rate):
+    '''sum of the pitched notes over samples [c0, c1)'''
+    # offsets in integers first, float32 can not hold hours of samples
+    t = (np.arange(c0, c1)[None, :] - notes['start'][:, None])\
+        .astype(np.float32) / sample_rate
+    phase = 2 * np.pi * notes['freq'][:, None] * t
+    x = sum(a * np.sin((h + 1) * phase) for h, a in enumerate(HARMONICS))
+    x *= envelope(t, notes['length'], sample_rate)
+    return notes['amp'].dot(x.astype(np.float32))
+
+################## rendering ##################
+def _mix_chunks(notes, sample_rate=SAMPLE_RATE, chunk=CHUNK):
+    '''generator of the unclipped float32 sum of the notes, chunk by chunk'''
+    if len(notes) == 0:
+        return
+    starts, stops = notes['start'], notes['stop']
+    span = int((stops - starts).max()) # longest note reaches this far back
+    total = int(stops.max())
+    for c0 in range(0, total, chunk):
+        c1 = min(c0 + chunk, total)
+        lo, hi = np.searchsorted(starts, [c0 - span, c1])
+        active = notes[lo:hi][stops[lo:hi] > c0]
+        out = np.zeros(c1 - c0, dtype=np.float32)
+        tones = active[active['drum'] < 0]
+        if len(tones):
+            out += _tones(tones, c0, c1, sample_rate)
+        for hit in active[active['drum'] >= 0].tolist():
+            start, amp, key = hit[0], hit[4], hit[5]
+            sample = drum_sample(key, sample_rate)
+            a, b = max(c0, start), min(c1, start + len(sample))
+            out[a - c0:b - c0] += amp * sample[a - start:b - start]
+        yield out
+
+def render_chunks(staffs, tempo='4=140', sample_rate=SAMPLE_RATE,
+                  chunk=CHUNK, gain=0.25, gains=None):
+    '''
+    generator of float32 mono chunks in [-1, 1], at most chunk samples
+    gain: master volume, loud passages are soft clipped
+    '''
+    notes = note_table(staffs, tempo, sample_rate, gains)
+    for out in _mix_chunks(notes, sample_rate, chunk):
+        yield np.tanh(gain * out)
+
+def staff_audio(staff, tempo='4=140', sample_rate=SAMPLE_RATE):
+    '''
+    one staff as an unclipped float32 array, staffs rendered apart can
+    be added up and passed to mix, eg. to rerender only what changed
+    '''
+    chunks = list(_mix_chunks(note_table([staff], tempo, sample_rate),
+                              sample_rate))
+    return np.concatenate(chunks) if chunks else np.zeros(0, np.float32)
+
+def mix(tracks, chunk=CHUNK, gain=0.25):
+    '''generator of clipped chunks of the sum of staff_audio arrays'''
+    total = max([len(x) for x in tracks] + [0])
+    for c0 in range(0, total, chunk):
+        out = np.zeros(min(chunk, total - c0), dtype=np.float32)
+        for x in tracks:
+            part = x[c0:c0 + chunk]
+            out[:len(part)] += part
+        yield np.tanh(gain * out)
+
+def render(staffs, tempo='4=140', sample_rate=SAMPLE_RATE, **kwargs):
+    '''the whole piece as one float32 array'''
+    chunks = list(render_chunks(staffs, tempo, sample_rate, **kwargs))
+    return np.concatenate(chunks) if chunks else np.zeros(0, np.float32)
+
+def write_frames(path, chunks, sample_rate=SAMPLE_RATE):
+    '''16 bit mono .wav of float chunks in [-1, 1], streamed to disk'''
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for x in chunks:
+            f.writeframes((x * 32767).astype('<i2').tobytes())
+    return path
+
+def write_wav(path, staffs, tempo='4=140', sample_rate=SAMPLE_RATE, **kwargs):
+    '''16 bit mono .wav, streamed to disk chunk by chunk'''
+    return write_frames(path, render_chunks(staffs, tempo, sample_rate,
+                                            **kwargs), sample_rate)
+
+def ly2wav(path, out=None, sample_rate=SAMPLE_RATE):
+    '''a .ly file written by this repo -> .wav next to it'''
+    with open(path) as f:
+        staffs, meta = parse_score(f.read())
+    out = out or os.path.splitext(path)[0] + '.wav'
+    return write_wav(out, staffs, meta.get('tempo', '4=140'), sample_rate)
+
+if __name__ == '__main__':
+    assert len(sys.argv) > 1, "usage: python synth.py file.ly [file.ly ...]"
+    for path in sys.argv[1:]:
+        print(ly2wav(path))
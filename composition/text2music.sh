@@ -2,6 +2,11 @@
 echo $1
 python text2music.py -t "$1" > output/tmp.ly
 cd output
-lilypond tmp.ly
-timidity tmp.midi
+if [ -n "$AUDIO_ONLY" ]; then
+    python ../midi.py tmp.ly
+    python ../synth.py tmp.ly
+else
+    python ../render_cache.py tmp.ly
+    timidity tmp.midi
+fi
 cd -
@@ -1,13 +1,32 @@
+'''
+time series to music: every point is a quarter note, higher is higher
+
+series too long for memory are read in chunks (stdin, .csv, or a .npy
+file memory mapped), normalized with a running or windowed min/max and
+written out as one \\score per chunk while the rest is still being read;
+long series can be downsampled to a playable number of notes first
+
+example usage:
+main(np.sin(np.linspace(0, 4 * np.pi, 40)), span=2, bass_degree=5)
+stream_score(read_npy('sensor.npy'), mode='window', window=1000)
+
+from the command line:
+python ts2music.py -t 1 2 3 2 1
+seq 1000000 | python ts2music.py --stdin --normalize running
+python ts2music.py --csv metrics.csv --column latency --normalize window
+python ts2music.py --npy sensor.npy --chunk 1000000
+python ts2music.py --npy minutes.npy --notes 500 --reduce peaks
+'''
 import argparse
+import itertools
 import logging
+import sys
 import numpy as np
 from functools import partial
-import yfinance as yf
-import pandas as pd
+from downsample import METHODS, downsample, downsample_chunks, reduce_chunks
+from market import CachedSource, FixtureSource, YFinanceSource
 
-parser = argparse.ArgumentParser(description="time series to music")
-parser.add_argument('-t', type=float, nargs='+', default=[1,2,3,2,1])
-args = parser.parse_args()
+CHUNK = 100000 # points read and emitted at a time
 
 def normalize(ts, n_notes):
     '''
@@ -21,53 +40,276 @@ def number2note(n, n_notes):
     notes = ['c', 'd', 'e', 'f', 'g', 'a', 'b']
     return "{}{}".format(notes[note], "'" * (pitch+1))
 
+def note_table(n_notes, time_unit=None):
+    '''number2note of 0..n_notes-1 as an array, tokens if time_unit is given'''
+    suffix = '' if time_unit is None else str(time_unit)
+    return np.array([number2note(n, n_notes) + suffix for n in range(n_notes)])
+
+def numbers2notes(ns, n_notes, time_unit=None):
+    '''vectorized number2note, one table lookup for the whole array'''
+    return note_table(n_notes, time_unit)[np.asarray(ns)]
+
 def transpose(ts, notes, degree):
     return [notes[(notes.index(note) - degree) % len(notes)] for note in ts]
 
-def main(args, span=4, time_signature='3/4', tempo='4=210', time_unit=4,
-         key='c', bass_degree=3, bass_ts=None):
+def transpose_numbers(ns, degree, n_notes):
+    '''transpose on quantized numbers, like transpose on their notes'''
+    return (np.asarray(ns) - degree) % n_notes
+
+################## streamed input ##################
+def read_stdin(chunk=CHUNK, stream=None):
+    '''float chunks of whitespace separated numbers, eg. one per line'''
+    stream = sys.stdin if stream is None else stream
+    while True:
+        lines = list(itertools.islice(stream, chunk))
+        if not lines:
+            return
+        yield np.array(''.join(lines).split(), dtype=float)
+
+def read_csv(path, column=0, chunk=CHUNK, delimiter=','):
+    '''
+    float chunks of one column of a csv file
+    column: index, or the name of a column in the header line
+    '''
+    with open(path) as f:
+        if type(column) is str:
+            header = next(f).strip().split(delimiter)
+            assert column in header, "no column {} in {}".format(column, path)
+            column = header.index(column)
+        while True:
+            lines = list(itertools.islice(f, chunk))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter=delimiter, usecols=column,
+                             ndmin=1)
+
+def read_npy(path, column=0, chunk=CHUNK):
+    '''float chunks of a memory mapped .npy file, a column if it is 2d'''
+    data = np.load(path, mmap_mode='r')
+    assert data.ndim in [1, 2], "expect a 1d series or 2d columns"
+    for start in range(0, len(data), chunk):
+        part = data[start:start + chunk]
+        yield np.asarray(part if data.ndim == 1 else part[:, column],
+                         dtype=float)
+
+def series_range(chunks):
+    '''(min, max) of a series in one pass over its chunks'''
+    lo, hi = np.inf, -np.inf
+    for x in chunks:
+        if len(x):
+            lo, hi = min(lo, x.min()), max(hi, x.max())
+    return lo, hi
+
+################## chunked normalization ##################
+def _window_extreme(x, window, ufunc):
+    '''
+    ufunc (np.maximum or np.minimum) over the window points ending at each
+    point of x, the first window - 1 points are history; linear time
+    '''
+    n = len(x) - window + 1
+    pad = (-len(x)) % window
+    fill = -np.inf if ufunc is np.maximum else np.inf
+    blocks = np.r_[x, np.full(pad, fill)].reshape(-1, window)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return ufunc(suffix[:n], prefix[window - 1:window - 1 + n])
+
+def quantize(x, lo, hi, n_notes):
+    '''like normalize, with lo and hi given per point or for all of x'''
+    span = np.where(hi > lo, hi - lo, 1)
+    return np.clip(((x - lo) / span * n_notes).astype(int), 0, n_notes)
+
+def normalize_chunks(chunks, n_notes, mode='running', window=None,
+                     bounds=None):
+    '''
+    quantized chunks of a streamed series, in constant memory
+    mode: 'global' scales by bounds, the (min, max) of the whole series
+                   (see series_range), the same as normalize
+          'running' scales every point by the min and max seen so far
+          'window' by the min and max of the last window points
+    '''
+    assert mode in ['global', 'running', 'window'], "unknown mode " + mode
+    if mode == 'global':
+        lo, hi = bounds
+        for x in chunks:
+            yield quantize(x, lo, hi, n_notes)
+    elif mode == 'running':
+        lo, hi = np.inf, -np.inf
+        for x in chunks:
+            if len(x) == 0:
+                continue
+            lows = np.minimum.accumulate(np.r_[lo, x])[1:]
+            highs = np.maximum.accumulate(np.r_[hi, x])[1:]
+            lo, hi = lows[-1], highs[-1]
+            yield quantize(x, lows, highs, n_notes)
+    else:
+        assert window is not None and window > 0, "window mode needs window"
+        history = np.zeros(0)
+        for x in chunks:
+            if len(x) == 0:
+                continue
+            # the first points only have the history there is
+            y = np.r_[np.full(window - 1 - len(history), np.nan), history, x]
+            lows = _window_extreme(np.where(np.isnan(y), np.inf, y), window,
+                                   np.minimum)
+            highs = _window_extreme(np.where(np.isnan(y), -np.inf, y), window,
+                                    np.maximum)
+            history = y[len(y) - (window - 1):] if window > 1 else history
+            history = history[~np.isnan(history)]
+            yield quantize(x, lows, highs, n_notes)
+
+################## scores ##################
+def staves(ts, bass, tempo, time_signature, time_unit):
+    '''a PianoStaff \\score of the melody and bass note names'''
+    staff = "\\score{\n\\new PianoStaff << \n"
+    staff += "  \\new Staff { \\clef treble \\tempo %s \\time %s " \
+             % (tempo, time_signature) +\
+             " ".join(map(lambda x: x + str(time_unit), ts)) + "}\n"
+    staff += "  \\new Staff {"+" ".join(map(lambda x: x + str(time_unit),
+                                                      bass)) + "}\n"
+    staff += ">>\n \\layout {} \\midi{} }\n"
+    return staff
+
+def header(title):
+    return """\\header {
+    title = \"""" + title + """\"
+    composer = "Jiaxuan Wang"
+    tagline = "Copyright: MIT license"
+    }"""
+
+def main(ts, span=4, time_signature='3/4', tempo='4=210', time_unit=4,
+         key='c', bass_degree=3, bass_ts=None, notes=None, reduce='lttb'):
     '''
+    ts: the series, all in memory
     span: how many 7 notes span
+    notes: play at most this many notes, longer series are downsampled
+           with reduce, see downsample.py
     '''
     assert key == 'c', "only key of c supported for now"
+    if notes is not None:
+        ts = downsample(ts, notes, reduce)
+        bass_ts = None if bass_ts is None else \
+            downsample(bass_ts, notes, reduce)
 
     n_notes = span * 7
     n2note = partial(number2note, n_notes=n_notes)
     notes = list(map(n2note, np.arange(n_notes)))
-    
-    ts = normalize(args.t, n_notes-1) # -1 for note using the n_notes note b/c 0 based
-    ts = list(map(n2note, ts))
-    logging.warning(ts)
+
+    melody = normalize(ts, n_notes-1) # -1 for note using the n_notes note b/c 0 based
+    melody = list(map(n2note, melody))
+    logging.warning(melody)
 
     if bass_ts is None:
-        bass = transpose(ts, notes, bass_degree)
+        bass = transpose(melody, notes, bass_degree)
     else:
         bass = normalize(bass_ts, n_notes-1)
         bass = list(map(n2note, bass))
-        logging.warning(bass)        
+        logging.warning(bass)
 
-    staff = "\score{\n\\new PianoStaff << \n"
-    staff += "  \\new Staff { \\clef treble \\tempo %s \\time %s " \
-             % (tempo, time_signature) +\
-             " ".join(map(lambda x: x + str(time_unit), ts)) + "}\n"
-    staff += "  \\new Staff {"+" ".join(map(lambda x: x + str(time_unit),
-                                                      bass)) + "}\n"  
-    
-    
-    staff += ">>\n \layout {} \midi{} }\n"
+    print(header(" ".join(map(str, ts))) +
+          staves(melody, bass, tempo, time_signature, time_unit))
 
-    title = """\header {
-    title = \"""" + " ".join(map(str, args.t)) + """\"
-    composer = "Jiaxuan Wang"
-    tagline = "Copyright: MIT license"
-    }"""
+def stream_score(chunks, span=4, time_signature='3/4', tempo='4=210',
+                 time_unit=4, bass_degree=3, mode='running', window=None,
+                 bounds=None, title='time series', out=None, bucket=None,
+                 reduce='lttb', notes=None, length=None):
+    '''
+    like main for a series too long for memory: chunks are normalized
+    (see normalize_chunks) and printed as one \\score each, as they come
+    bucket: reduce every bucket points to one note (two for peaks) first,
+            see downsample.reduce_chunks
+    notes: with length, the number of points, reduce to exactly this many
+           notes first, see downsample.downsample_chunks
+    returns the number of notes
+    '''
+    out = sys.stdout if out is None else out
+    if notes is not None:
+        assert length is not None, "notes needs the length of the series"
+        chunks = downsample_chunks(chunks, length, notes, reduce)
+    elif bucket is not None:
+        chunks = reduce_chunks(chunks, bucket, reduce)
+    n_notes = span * 7
+    table = note_table(n_notes)
+    out.write(header(title))
+    count = 0
+    for ns in normalize_chunks(chunks, n_notes - 1, mode, window, bounds):
+        melody = table[ns].tolist()
+        bass = table[transpose_numbers(ns, bass_degree, n_notes)].tolist()
+        out.write(staves(melody, bass, tempo, time_signature, time_unit))
+        out.flush()
+        count += len(ns)
+    return count
+
+def stock(ticker, length, interval='1d', source=None):
+    '''
+    the last length closing prices of ticker
+    source: see market.py, yfinance through the on disk cache by default
+    '''
+    if source is None:
+        source = CachedSource(YFinanceSource())
+    if isinstance(source, CachedSource):
+        return source.load(ticker, interval, length)[1]
+    return source.fetch(ticker, interval)[1][-length:]
 
-    print(title + staff)
-    
 if __name__ == '__main__':
-    ts = np.linspace(0, 4*np.pi, 40) 
+    parser = argparse.ArgumentParser(description="time series to music")
+    parser.add_argument('-t', type=float, nargs='+', default=None)
+    parser.add_argument('--stdin', action='store_true',
+                        help='read numbers from stdin')
+    parser.add_argument('--csv', type=str, default=None)
+    parser.add_argument('--column', type=str, default='0',
+                        help='csv column index or name, npy column index')
+    parser.add_argument('--npy', type=str, default=None)
+    parser.add_argument('--chunk', type=int, default=CHUNK)
+    parser.add_argument('--normalize', choices=['global', 'running', 'window'],
+                        default='running',
+                        help='global rereads files for their min and max')
+    parser.add_argument('--window', type=int, default=None)
+    parser.add_argument('--notes', type=int, default=None,
+                        help='downsample to this many notes')
+    parser.add_argument('--bucket', type=int, default=None,
+                        help='points per note when streaming stdin or csv')
+    parser.add_argument('--reduce', choices=METHODS, default='lttb')
+    parser.add_argument('--stock', type=str, default=None,
+                        help='closing prices of a ticker, eg. MSFT')
+    parser.add_argument('--length', type=int, default=40,
+                        help='number of closes for --stock')
+    parser.add_argument('--interval', type=str, default='1d')
+    parser.add_argument('--offline', action='store_true',
+                        help='made up prices for --stock, no network')
+    parser.add_argument('--span', type=int, default=2)
+    parser.add_argument('--bass-degree', type=int, default=5)
+    args = parser.parse_args()
+    if args.notes and (args.csv or args.stdin) and not args.bucket:
+        # their length is only known once they have been read
+        parser.error('--notes needs --bucket when streaming csv/stdin')
+
+    column = int(args.column) if args.column.isdigit() else args.column
+    if args.npy or args.csv:
+        def read():
+            if args.npy:
+                return read_npy(args.npy, column, args.chunk)
+            return read_csv(args.csv, column, args.chunk)
+        bounds = series_range(read()) if args.normalize == 'global' else None
+        # the length of an .npy is known without reading it
+        notes = args.notes if args.npy else None
+        length = len(np.load(args.npy, mmap_mode='r')) if notes else None
+        stream_score(read(), args.span, bass_degree=args.bass_degree,
+                     mode=args.normalize, window=args.window, bounds=bounds,
+                     title=args.npy or args.csv, bucket=args.bucket,
+                     reduce=args.reduce, notes=notes, length=length)
+        sys.exit()
+    if args.stdin:
+        assert args.normalize != 'global', "stdin can only be read once"
+        stream_score(read_stdin(args.chunk), args.span,
+                     bass_degree=args.bass_degree, mode=args.normalize,
+                     window=args.window, title='stdin', bucket=args.bucket,
+                     reduce=args.reduce)
+        sys.exit()
+
+    ts = np.linspace(0, 4*np.pi, 40)
     bass_ts = None
-    
+
     def fib(length):
         ret = [1,1]
         while length > len(ret):
@@ -81,18 +323,20 @@ if __name__ == '__main__':
             n *= 10
         return ret[:length]
 
-    def stock(ticker, length, interval='1d'):
-        prices = yf.download(ticker, interval=interval, progress=False)
-        return np.array(prices['Close'])[-length:]
-    
-    args.t = np.sin(ts)
-    # args.t = np.exp(ts)
-    # args.t = decimal(np.pi, len(ts))
-    # args.t = decimal(np.e, len(ts))
-    # args.t = decimal(np.sqrt(2), len(ts))
-    # args.t = stock('MSFT', len(ts), interval='1d')
-    # args.t = stock('GOOGL', len(ts)) # variations F
+    t = np.sin(ts) if args.t is None else args.t
+    if args.stock:
+        # made up prices are not worth caching
+        source = FixtureSource() if args.offline else \
+            CachedSource(YFinanceSource())
+        t = stock(args.stock, args.length, args.interval, source)
+    # t = np.exp(ts)
+    # t = decimal(np.pi, len(ts))
+    # t = decimal(np.e, len(ts))
+    # t = decimal(np.sqrt(2), len(ts))
+    # t = stock('MSFT', len(ts), interval='1d')
+    # t = stock('GOOGL', len(ts)) # variations F
     # bass_ts = stock('GOOGL', len(ts))
 
     # ideas to try: bass note try to use 12 bar blues or things of that sort
-    main(args, span=2, bass_degree=5, bass_ts=bass_ts)
+    main(t, span=args.span, bass_degree=args.bass_degree, bass_ts=bass_ts,
+         notes=args.notes, reduce=args.reduce)
@@ -0,0 +1,303 @@
+'''
+live mode: rerender a score every time its source is saved
+
+the module holding the score (simple.py by default) and its siblings are
+polled for changes and reloaded; the score expression is only evaluated
+again when the source of a function or global it reaches changed, and
+only the staffs that came out different are turned into midi tracks and
+audio again, the others come from a per staff cache
+
+example usage:
+watcher = Watcher('variation_idea0(**pagnini24())', 'output/watch')
+watcher.run() # writes watch.ly, watch.midi and watch.wav on every save
+
+from the command line:
+python watch.py "variation_idea0(**pagnini24())" --out output/watch
+python watch.py "practice0()" --play aplay # plays watch.wav after each change
+'''
+import argparse
+import ast
+import hashlib
+import importlib
+import inspect
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+import score
+import midi
+import synth
+from render_cache import RenderCache
+
+# reloaded in this order, a module only imports the ones before it
+MODULES = ['pitch', 'rhythm', 'score', 'chords', 'lily', 'midi', 'synth']
+MAX_STAFFS = 256 # staff renders kept by StaffCache
+
+################## what changed ##################
+def definitions(path):
+    '''
+    top level name -> hash of its definition in the python file, comments
+    and formatting do not count; also returns name -> names it uses
+    '''
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    hashes, uses = {}, {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names = [node.name]
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) \
+                else [node.target]
+            names = [n.id for t in targets for n in ast.walk(t)
+                     if isinstance(n, ast.Name)]
+        else:
+            continue
+        digest = hashlib.sha256(ast.dump(node).encode()).hexdigest()
+        used = set(n.id for n in ast.walk(node) if isinstance(n, ast.Name))
+        for name in names: # redefinitions keep the last one
+            hashes[name] = digest
+            uses[name] = used
+    return hashes, uses
+
+def reachable(expression, uses):
+    '''top level names the expression needs, following function bodies'''
+    todo = [n.id for n in ast.walk(ast.parse(expression, mode='eval'))
+            if isinstance(n, ast.Name)]
+    seen = set()
+    while todo:
+        name = todo.pop()
+        if name in seen or name not in uses:
+            continue
+        seen.add(name)
+        todo.extend(uses[name])
+    return seen
+
+def fingerprint(expression, path):
+    '''changes only when a definition the expression reaches changes'''
+    hashes, uses = definitions(path)
+    h = hashlib.sha256(expression.encode())
+    for name in sorted(reachable(expression, uses)):
+        h.update('{}={};'.format(name, hashes[name]).encode())
+    return h.hexdigest()
+
+################## per staff renders ##################
+def staff_key(staff, *extra):
+    '''hash of what a staff sounds like'''
+    h = hashlib.sha256(repr((staff.instrument, staff.clef) + extra).encode())
+    if isinstance(staff.ts, np.ndarray):
+        h.update(staff.ts.tobytes())
+    else:
+        h.update('\0'.join(staff.ts).encode())
+    return h.hexdigest()
+
+class StaffCache:
+    '''midi tracks and audio of staffs, least recently used dropped first'''
+    def __init__(self, max_staffs=MAX_STAFFS, sample_rate=synth.SAMPLE_RATE):
+        self.max_staffs = max_staffs
+        self.sample_rate = sample_rate
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def _get(self, key, make):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = make()
+        while len(self.entries) > self.max_staffs:
+            self.entries.popitem(last=False)
+        return value
+
+    def track(self, staff, channel):
+        return self._get(staff_key(staff, 'midi', channel),
+                         lambda: midi.note_track(midi.staff_events(staff),
+                                                 channel, staff.instrument))
+
+    def audio(self, staff, tempo):
+        return self._get(staff_key(staff, 'wav', tempo, self.sample_rate),
+                         lambda: synth.staff_audio(staff, tempo,
+                                                   self.sample_rate))
+
+################## watching ##################
+def _atomic_write(path, write):
+    '''write(tmp_path) then move it over path, players never see half a file'''
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        write(tmp)
+        # mkstemp makes it private, give it the mode open() would
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+class Watcher:
+    '''
+    expression: python evaluated in the module, calls main() like the
+                functions in simple.py do
+    out: path prefix of the artifacts, .ly .midi and .wav are written
+    module: name of the module holding the score
+    pdf: also engrave with lilypond, through render_cache.py
+    play: command started on the .wav after each change, eg. 'aplay'
+    seed: np.random is seeded with it before every evaluation, so random
+          parts of a score only change when their source does
+    '''
+    def __init__(self, expression, out='output/watch', module='simple',
+                 wav=True, pdf=False, play=None, seed=0):
+        self.expression = expression
+        self.out = out
+        self.wav = wav
+        self.pdf = pdf
+        self.play = play
+        self.seed = seed
+        self.module = importlib.import_module(module)
+        self.modules = [importlib.import_module(m) for m in MODULES] + \
+            [self.module]
+        self.mtimes = self._mtimes()
+        self.cache = StaffCache()
+        self.render_cache = RenderCache() if pdf else None
+        self.built = None # fingerprint the current artifacts are from
+        self.player = None
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+
+    def _mtimes(self):
+        return [os.stat(m.__file__).st_mtime_ns for m in self.modules]
+
+    def changed(self):
+        '''reload the modules after the first one that changed, if any'''
+        mtimes = self._mtimes()
+        first = next((i for i, (a, b) in enumerate(zip(self.mtimes, mtimes))
+                      if a != b), None)
+        self.mtimes = mtimes
+        if first is None:
+            return False
+        for i in range(first, len(self.modules)):
+            self.modules[i] = importlib.reload(self.modules[i])
+        self.module = self.modules[-1]
+        if first < len(MODULES): # the helpers changed, start over
+            self.built = None
+            self.cache.entries.clear()
+        return True
+
+    def evaluate(self):
+        '''(staffs, options) the expression passes to main'''
+        calls = []
+        main = self.module.main
+        def capture(*args, **kwargs):
+            bound = inspect.signature(main).bind(*args, **kwargs)
+            bound.apply_defaults()
+            calls.append(bound.arguments)
+        np.random.seed(self.seed)
+        self.module.main = capture
+        try:
+            eval(self.expression, vars(self.module))
+        finally:
+            self.module.main = main
+        assert calls, "{} did not call main".format(self.expression)
+        options = calls[-1]
+        staffs = options.pop('staffs')
+        if options.pop('add_metronome'):
+            staffs.append(score.Staff(['hh4'] * 4 *
+                                      options['metronome_measures'], 'drum'))
+        return staffs, options
+
+    def build(self):
+        '''
+        rerender if what the expression reaches changed
+        returns a dict of timings, or None when nothing had to be done
+        '''
+        start = time.perf_counter()
+        current = fingerprint(self.expression, self.module.__file__)
+        if current == self.built:
+            return None
+        staffs, options = self.evaluate()
+        evaluated = time.perf_counter()
+        tempo, time_signature = options['tempo'], options['time_signature']
+        misses = self.cache.misses
+
+        source = score.render_score(staffs, tempo, time_signature,
+                                    options['key'], options['heading'])
+        with open(self.out + '.ly', 'w') as f:
+            f.write(source)
+        tracks = [midi.tempo_track(tempo, time_signature, options['heading'])]
+        tracks += [self.cache.track(staff, channel) for staff, channel in
+                   zip(staffs, midi.staff_channels(staffs))]
+        rendered = self.cache.misses - misses # the wav follows the midi
+        data = midi.smf(tracks)
+        def write_midi(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        _atomic_write(self.out + '.midi', write_midi)
+        if self.wav:
+            audio = [self.cache.audio(staff, tempo) for staff in staffs]
+            _atomic_write(self.out + '.wav', lambda path: synth.write_frames(
+                path, synth.mix(audio), self.cache.sample_rate))
+        if self.pdf:
+            self.render_cache.render(source, os.path.dirname(self.out) or '.',
+                                     os.path.basename(self.out), ('pdf',))
+        self.built = current
+        done = time.perf_counter()
+        return {'evaluate': evaluated - start, 'render': done - evaluated,
+                'staffs': len(staffs),
+                'rendered': rendered}
+
+    def _play(self):
+        if self.player is not None and self.player.poll() is None:
+            self.player.terminate()
+        self.player = subprocess.Popen(self.play.split() +
+                                       [self.out + '.wav'])
+
+    def step(self):
+        '''one poll: reload, rebuild and play if needed; returns the timings'''
+        if not self.changed() and self.built is not None:
+            return None
+        try:
+            timings = self.build()
+        except Exception as e: # keep watching through typos
+            print('error: {}: {}'.format(type(e).__name__, e), file=sys.stderr)
+            return None
+        if timings is not None and self.play and self.wav:
+            self._play()
+        return timings
+
+    def run(self, interval=0.2, stream=sys.stderr):
+        '''poll every interval seconds until interrupted'''
+        while True:
+            timings = self.step()
+            if timings is not None:
+                stream.write('{}: evaluated in {:.3f}s, rendered {}/{} staffs '
+                             'in {:.3f}s\n'.format(
+                                 self.out, timings['evaluate'],
+                                 timings['rendered'], timings['staffs'],
+                                 timings['render']))
+            time.sleep(interval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="rerender a score on save")
+    parser.add_argument('expression', type=str,
+                        help='eg. "variation_idea0(**pagnini24())"')
+    parser.add_argument('--out', type=str, default='output/watch')
+    parser.add_argument('--module', type=str, default='simple')
+    parser.add_argument('--interval', type=float, default=0.2)
+    parser.add_argument('--no-wav', action='store_true')
+    parser.add_argument('--pdf', action='store_true',
+                        help='also engrave with lilypond')
+    parser.add_argument('--play', type=str, default=None,
+                        help='player command for the .wav, eg. aplay')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    watcher = Watcher(args.expression, args.out, args.module,
+                      not args.no_wav, args.pdf, args.play, args.seed)
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
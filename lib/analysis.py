@@ -0,0 +1,142 @@
+'''
+exact counting, enumeration and uniform sampling of the progressions
+produced by lib/progression.py: walks of k chords that start on start,
+end on start and do not visit start in between
+
+counts are python ints, so they stay exact for any k
+
+example usage:
+counter = ProgressionCounter(EDGES)
+counter.count(8) # number of 8 chord progressions
+for p in counter.enumerate(8, cursor=100): # resume from the 100th
+    print(p) # (1, 2, 5, ...)
+counter.sample(8, 10, np.random.default_rng(0))
+'''
+import numpy as np
+from lib.progression import EDGES
+
+def adjacency_matrix(edges):
+    '''(7, 7) python int matrix, [i, j] counts edges degree i+1 -> j+1'''
+    A = np.zeros((7, 7), dtype=object)
+    A[:] = 0
+    for degree, nexts in edges.items():
+        for n in nexts:
+            A[degree - 1, n - 1] += 1
+    return A
+
+def matrix_power(M, k):
+    '''exact M^k for object (python int) matrices, by repeated squaring'''
+    result = np.zeros(M.shape, dtype=object)
+    result[:] = 0
+    for i in range(M.shape[0]):
+        result[i, i] = 1
+    while k:
+        if k & 1:
+            result = result.dot(M)
+        M = M.dot(M)
+        k >>= 1
+    return result
+
+def _randbelow(rng, n):
+    '''uniform int in [0, n) for arbitrarily large n'''
+    if n < 1 << 62:
+        return int(rng.integers(n))
+    # multiply-shift with 64 spare bits, bias below 2^-64
+    bits = n.bit_length() + 64
+    x = int.from_bytes(rng.bytes((bits + 7) // 8), 'little') >> \
+        (-bits % 8)
+    return (x * n) >> bits
+
+class ProgressionCounter:
+    '''
+    edges: rule graph, eg. lib.progression.EDGES
+    progressions are ordered lexicographically by their degrees; a degree
+    listed twice in edges is two parallel edges, each one rank block, so
+    the progression has one rank per choice of edges and rank gives the
+    one taking the first of each
+    '''
+    def __init__(self, edges=EDGES, start=1):
+        self.A = adjacency_matrix(edges)
+        self.s = start - 1
+        inner = [i for i in range(7) if i != self.s]
+        self.inner = inner
+        self.B = self.A[np.ix_(inner, inner)] # walks avoiding start
+        self.out = self.A[self.s, inner] # start -> inner
+        self.into = self.A[inner, self.s] # inner -> start
+        self.successors = [[w for w in range(7) if self.A[v, w]]
+                           for v in range(7)]
+        # completions[r][v]: ways from degree v+1 back to start in r steps
+        self.completions = [None, [self.A[v, self.s] for v in range(7)]]
+
+    def count(self, k):
+        '''number of progressions of k chords, O(log k) matrix products'''
+        if k < 2:
+            return 0
+        if k == 2:
+            return int(self.A[self.s, self.s])
+        return int(self.out.dot(matrix_power(self.B, k - 3)).dot(self.into))
+
+    def counts(self, k_max):
+        '''[count(0), ..., count(k_max)]'''
+        return [self.count(k) for k in range(k_max + 1)]
+
+    def completions_(self, r):
+        while len(self.completions) <= r:
+            prev = self.completions[-1]
+            self.completions.append(
+                [sum(self.A[v, w] * prev[w]
+                     for w in self.successors[v] if w != self.s)
+                 for v in range(7)])
+        return self.completions[r]
+
+    def ways_(self, k, i, w):
+        '''progressions of k chords whose chord i (0 based) is degree w+1'''
+        if i == k - 1:
+            return 1 if w == self.s else 0
+        if w == self.s:
+            return 0
+        return self.completions_(k - 1 - i)[w]
+
+    def unrank(self, k, rank):
+        '''the rank-th (0 based) progression of k chords'''
+        assert 0 <= rank < self.count(k), "rank out of range"
+        v, progression = self.s, [self.s + 1]
+        for i in range(1, k):
+            for w in self.successors[v]:
+                ways = self.A[v, w] * self.ways_(k, i, w)
+                if rank < ways:
+                    # parallel edges come one block after another
+                    rank %= self.ways_(k, i, w)
+                    break
+                rank -= ways
+            v = w
+            progression.append(w + 1)
+        return tuple(progression)
+
+    def rank(self, progression):
+        '''inverse of unrank, the rank taking the first of parallel edges'''
+        k = len(progression)
+        degrees = [d - 1 for d in progression]
+        assert degrees[0] == self.s and degrees[-1] == self.s,\
+            "progression must start and end on {}".format(self.s + 1)
+        rank = 0
+        for i in range(1, k):
+            v, chosen = degrees[i - 1], degrees[i]
+            assert self.A[v, chosen], "not an edge {}".format((v+1, chosen+1))
+            for w in self.successors[v]:
+                if w == chosen:
+                    break
+                rank += self.A[v, w] * self.ways_(k, i, w)
+        return rank
+
+    def enumerate(self, k, cursor=0):
+        '''lazily yield progressions of k chords in order from rank cursor'''
+        for rank in range(cursor, self.count(k)):
+            yield self.unrank(k, rank)
+
+    def sample(self, k, n, rng=None):
+        '''n progressions of k chords, uniformly, by unranking random ranks'''
+        rng = np.random.default_rng() if rng is None else rng
+        total = self.count(k)
+        assert total > 0, "no progression of {} chords".format(k)
+        return [self.unrank(k, _randbelow(rng, total)) for _ in range(n)]
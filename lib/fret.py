@@ -1,31 +1,389 @@
-def get_fret(chord):
-    key = chord.mode
-    key += chord.notes[0].name
-
-    fret = {
-        'mC': [['x35543']],
-        'MC': [['x32010']],
-        'mC#': [['x46654']],
-        
-        'mD': [['xx0231']],
-        'MD': [['xx0232']],
-        
-        'mE': [['022000']],
-        'ME': [['022100']],
-        'mF': [['133111']],
-        'MF': [['133211']],
-        'mF#': [['244222']],
-        'MF#': [['244322']],       
-
-        'MG': [['320003']],
-
-        'oG#': [['4xx434']],
-
-        'mA': [['x02210']],
-        'MA': [['x02220']],
-
-        'mB': [['x24432']],
-        'MB': [['x24442']],
-        'oB': [['x20031']]
-    }
-    return fret[key]
+'''
+guitar chord voicings, generated instead of written by hand
+
+every fingering within a fret range and hand stretch is enumerated,
+named with lib.notes.identify_chords, ranked and saved as a sorted
+structured array that is memory mapped on load
+
+example usage:
+get_fret(Chord(['C', 'E', 'G']))[:3]
+load_voicings().lookup('G', '7', position=3)
+'''
+import hashlib
+import os
+import tempfile
+import numpy as np
+from lib.notes import Note, CHORD_SYMBOLS, SLASH, identify_chords
+
+STANDARD_TUNING = (40, 45, 50, 55, 59, 64) # midi numbers, low E to high e
+MUTED = -1
+MAX_POSITION = 32
+RANKING = 2 # bump when generate_voicings scores or orders differently
+
+CACHE_DIR = os.environ.get(
+    'MUSIC_THEORY_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'music_theory'))
+
+def voicing_dtype(n_strings):
+    return np.dtype([('key', 'i4'), # see voicing_key, the sort order
+                     ('root', 'i1'), ('quality', 'i1'),
+                     ('position', 'i1'), ('inversion', 'i1'),
+                     ('score', 'f4'), # lower is easier
+                     ('frets', 'i1', (n_strings,))])
+
+def voicing_key(root, quality, position):
+    return (root * len(CHORD_SYMBOLS) + quality) * MAX_POSITION + position
+
+def format_frets(frets):
+    '''[-1, 3, 2, 0, 1, 0] -> 'x32010', frets above 9 are put in ()'''
+    return ''.join('x' if f == MUTED else
+                   str(f) if f < 10 else '({})'.format(f) for f in frets)
+
+def _candidate_frets(n_strings, max_fret, max_stretch):
+    '''every assignment of muted, open or a fret within one hand window'''
+    windows = []
+    for low in range(1, max(max_fret - max_stretch + 1, 1) + 1):
+        options = np.array([MUTED, 0] + list(range(low, min(low + max_stretch,
+                                                           max_fret + 1))),
+                           dtype=np.int8)
+        idx = np.indices((len(options),) * n_strings).reshape(n_strings, -1).T
+        windows.append(options[idx])
+    return np.unique(np.concatenate(windows), axis=0)
+
+def generate_voicings(tuning=STANDARD_TUNING, max_fret=12, max_stretch=4,
+                      min_strings=3, max_fingers=4):
+    '''
+    enumerate and rank every playable fingering of every known chord
+
+    playable: at least min_strings sounding strings, fretted notes span
+    less than max_stretch frets and at most max_fingers fingers, where a
+    barre on the lowest fret is one finger
+    returns a structured array of voicing_dtype sorted by key then score
+    '''
+    tuning = np.asarray(tuning, dtype=np.int64)
+    n_strings = len(tuning)
+    frets = _candidate_frets(n_strings, max_fret, max_stretch)
+
+    sounded = frets != MUTED
+    fretted = frets > 0
+    n_sounded = sounded.sum(axis=1)
+    first = sounded.argmax(axis=1)
+    last = n_strings - 1 - sounded[:, ::-1].argmax(axis=1)
+    inner_muted = last - first + 1 - n_sounded
+    ok = n_sounded >= min_strings
+
+    big = np.int8(127)
+    low_fret = np.where(fretted, frets, big).min(axis=1)
+    high_fret = np.where(fretted, frets, -1).max(axis=1)
+    span = np.where(fretted.any(axis=1), high_fret - low_fret, 0)
+    ok &= span < max_stretch
+
+    # fingers, a barre covers the lowest fret when no open string is above it
+    n_fretted = fretted.sum(axis=1)
+    at_low = fretted & (frets == low_fret[:, None])
+    barre_from = at_low.argmax(axis=1)
+    strings = np.arange(n_strings)
+    open_above = ((frets == 0) &
+                  (strings[None, :] > barre_from[:, None])).any(axis=1)
+    n_low = at_low.sum(axis=1)
+    fingers = np.where(~open_above & (n_low > 1),
+                       n_fretted - n_low + 1, n_fretted)
+    ok &= fingers <= max_fingers
+
+    frets, sounded, fretted = frets[ok], sounded[ok], fretted[ok]
+    first, fingers, span = first[ok], fingers[ok], span[ok]
+    low_fret, n_sounded = low_fret[ok], n_sounded[ok]
+    inner_muted = inner_muted[ok]
+
+    # name them
+    pcs = (tuning[None, :] + frets) % 12
+    masks = np.bitwise_or.reduce(np.where(sounded, 1 << pcs, 0), axis=1)
+    basses = pcs[np.arange(len(frets)), first]
+    roots, qualities, inversions = identify_chords(masks, basses)
+    named = (qualities >= 0) & (inversions != SLASH)
+
+    has_open = (sounded & ~fretted).any(axis=1)
+    position = np.where(has_open | ~fretted.any(axis=1), 0, low_fret)
+    hand = np.where(fretted.any(axis=1), low_fret, 0)
+    # a muted string between sounding ones needs a finger to damp it
+    score = (fingers + span + 1.5 * (n_strings - n_sounded) + 2.0 * inner_muted
+             + 0.5 * hand + 3.0 * (inversions != 0))
+
+    voicings = np.zeros(named.sum(), dtype=voicing_dtype(n_strings))
+    voicings['root'] = roots[named]
+    voicings['quality'] = qualities[named]
+    voicings['position'] = position[named]
+    voicings['inversion'] = inversions[named]
+    voicings['score'] = score[named]
+    voicings['frets'] = frets[named]
+    voicings['key'] = voicing_key(voicings['root'].astype(np.int32),
+                                  voicings['quality'].astype(np.int32),
+                                  voicings['position'].astype(np.int32))
+    # equal scores: more sounding strings, then fewer inner muted ones,
+    # not the candidate order that puts muted strings first
+    order = np.lexsort((inner_muted[named], -n_sounded[named],
+                        voicings['score'], voicings['key']))
+    return voicings[order]
+
+class VoicingIndex:
+    '''
+    voicings saved by generate_voicings, memory mapped
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.voicings = np.load(path, mmap_mode='r')
+        self.keys = self.voicings['key']
+
+    @classmethod
+    def build(cls, path, **kwargs):
+        '''generate voicings (kwargs go to generate_voicings) and save'''
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # a temp file of its own, concurrent builders never share one
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                   suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, generate_voicings(**kwargs))
+        os.replace(tmp, path)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.voicings)
+
+    def lookup(self, root, quality, position=None):
+        '''
+        voicings of a chord, easiest first
+        root: Note or name, quality: symbol in CHORD_SYMBOLS
+        position: fret of the index finger, 0 for open chords,
+                  None for any position
+        '''
+        root = Note(root).rep
+        quality = CHORD_SYMBOLS.index(quality)
+        if position is None:
+            start = voicing_key(root, quality, 0)
+            end = start + MAX_POSITION
+        else:
+            start = voicing_key(root, quality, position)
+            end = start + 1
+        lo, hi = np.searchsorted(self.keys, [start, end])
+        found = self.voicings[lo:hi]
+        if position is None:
+            found = found[np.argsort(found['score'], kind='stable')]
+        return found
+
+    def frets(self, root, quality, position=None):
+        '''like lookup, formatted as strings, eg. ['x32010', ...]'''
+        return [format_frets(f) for f in
+                self.lookup(root, quality, position)['frets'].tolist()]
+
+_indexes = {}
+
+def layout_stamp(n_strings):
+    '''
+    short hash of what a saved index depends on besides its arguments:
+    the chord symbols, the key layout, the dtype and the ranking
+    '''
+    layout = repr((CHORD_SYMBOLS, MAX_POSITION,
+                   voicing_dtype(n_strings).descr, RANKING))
+    return hashlib.sha256(layout.encode()).hexdigest()[:12]
+
+def load_voicings(tuning=STANDARD_TUNING, max_fret=12, max_stretch=4,
+                  cache_dir=CACHE_DIR):
+    '''shared VoicingIndex, generated into cache_dir the first time'''
+    key = (tuple(tuning), max_fret, max_stretch, cache_dir)
+    if key not in _indexes:
+        name = 'voicings_{}_{}_{}_{}.npy'.format(
+            '-'.join(map(str, tuning)), max_fret, max_stretch,
+            layout_stamp(len(tuning)))
+        path = os.path.join(cache_dir, name)
+        if os.path.exists(path):
+            _indexes[key] = VoicingIndex(path)
+        else:
+            _indexes[key] = VoicingIndex.build(
+                path, tuning=tuning, max_fret=max_fret,
+                max_stretch=max_stretch)
+    return _indexes[key]
+
+def get_fret(chord, position=None, index=None):
+    '''
+    fingerings of a lib.notes.Chord, easiest first, eg. [['x32010'], ...]
+    empty when the chord is not recognized
+    '''
+    if chord.root is None:
+        return []
+    index = load_voicings() if index is None else index
+    return [[f] for f in index.frets(chord.root, chord.mode, position)]
+
+################## voice leading ##################
+class MovementCost:
+    '''
+    cost model for moving the fretting hand between voicings
+
+    shift: per fret the hand (index finger fret) moves
+    per_string: per fret changed on strings sounding in both voicings
+    difficulty: times the voicing score, favours easy shapes
+    with per_string=0 the solver runs in O(K log K) per chord for K
+    candidates; otherwise that part of the cost bounds the rest from
+    below and picks the candidates min_movement_path keeps
+    '''
+    def __init__(self, shift=1.0, per_string=0.0, difficulty=2.0):
+        self.shift = shift
+        self.per_string = per_string
+        self.difficulty = difficulty
+
+    @property
+    def separable(self):
+        return self.per_string == 0
+
+    def hand(self, voicings):
+        '''index finger fret of each voicing, 0 when nothing is fretted'''
+        frets = voicings['frets']
+        fretted = frets > 0
+        low = np.where(fretted, frets, 127).min(axis=1)
+        return np.where(fretted.any(axis=1), low, 0).astype(np.float64)
+
+    def node(self, voicings):
+        return self.difficulty * voicings['score'].astype(np.float64)
+
+    def pair(self, prev, cur):
+        '''(len(prev), len(cur)) matrix of movement costs'''
+        cost = self.shift * np.abs(self.hand(prev)[:, None] -
+                                   self.hand(cur)[None, :])
+        if self.per_string:
+            # one string at a time keeps temporaries 2d
+            a = prev['frets'].astype(np.float64)
+            b = cur['frets'].astype(np.float64)
+            for s in range(a.shape[1]):
+                diff = np.abs(a[:, s, None] - b[None, :, s])
+                diff[a[:, s] == MUTED, :] = 0
+                diff[:, b[:, s] == MUTED] = 0
+                cost += self.per_string * diff
+        return cost
+
+def _l1_min(values, prev_hand, cur_hand, shift):
+    '''
+    for every cur_hand[j]:
+    min_i values[i] + shift * |prev_hand[i] - cur_hand[j]|
+    and the argmin, through sorted prefix and suffix minima
+    '''
+    order = np.argsort(prev_hand, kind='stable')
+    h, v = prev_hand[order], values[order]
+    pos = np.arange(len(h))
+
+    def running_min(x):
+        acc = np.minimum.accumulate(x)
+        return acc, np.maximum.accumulate(np.where(x == acc, pos, 0))
+
+    # from below: values[i] - shift * h[i] + shift * cur
+    below, below_arg = running_min(v - shift * h)
+    # from above: values[i] + shift * h[i] - shift * cur, scanned backwards
+    above, above_arg = running_min((v + shift * h)[::-1])
+    above, above_arg = above[::-1], (len(h) - 1 - above_arg)[::-1]
+
+    n_below = np.searchsorted(h, cur_hand, side='right')
+    inf = np.inf
+    cost_below = np.where(n_below > 0, below[np.maximum(n_below - 1, 0)] +
+                          shift * cur_hand, inf)
+    cost_above = np.where(n_below < len(h),
+                          above[np.minimum(n_below, len(h) - 1)] -
+                          shift * cur_hand, inf)
+    use_below = cost_below <= cost_above
+    best = np.where(use_below, cost_below, cost_above)
+    arg = np.where(use_below, below_arg[np.maximum(n_below - 1, 0)],
+                   above_arg[np.minimum(n_below, len(h) - 1)])
+    return best, order[arg]
+
+def _dense_path(candidates, cost, chunk):
+    '''min_movement_path over every pair of candidates, O(K^2) per chord'''
+    total = cost.node(candidates[0])
+    back = []
+    for prev, cur in zip(candidates, candidates[1:]):
+        step = max(1, chunk // len(prev))
+        best = np.empty(len(cur))
+        arg = np.empty(len(cur), dtype=np.int64)
+        for start in range(0, len(cur), step):
+            m = total[:, None] + cost.pair(prev, cur[start:start + step])
+            arg[start:start + step] = m.argmin(axis=0)
+            best[start:start + step] = m.min(axis=0)
+        total = best + cost.node(cur)
+        back.append(arg)
+    return total, back
+
+def _separable_path(candidates, cost):
+    '''min_movement_path ignoring per_string, O(K log K) per chord'''
+    total = cost.node(candidates[0])
+    back = []
+    for prev, cur in zip(candidates, candidates[1:]):
+        best, arg = _l1_min(total, cost.hand(prev), cost.hand(cur),
+                            cost.shift)
+        total = best + cost.node(cur)
+        back.append(arg)
+    return total, back
+
+def _path_bounds(candidates, cost):
+    '''
+    for every candidate, the least separable cost of a whole path through
+    it, a lower bound of its real cost since per_string only adds
+    '''
+    hands = [cost.hand(c) for c in candidates]
+    nodes = [cost.node(c) for c in candidates]
+    forward = [nodes[0]]
+    for i in range(1, len(candidates)):
+        best, _ = _l1_min(forward[-1], hands[i - 1], hands[i], cost.shift)
+        forward.append(best + nodes[i])
+    backward = [np.zeros(len(candidates[-1]))]
+    for i in range(len(candidates) - 2, -1, -1):
+        best, _ = _l1_min(backward[-1] + nodes[i + 1], hands[i + 1],
+                          hands[i], cost.shift)
+        backward.append(best)
+    return [f + b for f, b in zip(forward, backward[::-1])]
+
+def _trace(total, back):
+    path = [int(total.argmin())]
+    for arg in reversed(back):
+        path.append(int(arg[path[-1]]))
+    return path[::-1], float(total.min())
+
+def min_movement_path(candidates, cost=None, keep=256, chunk=1 << 22):
+    '''
+    choose one voicing per chord with the least total cost, by dynamic
+    programming over the candidates of consecutive chords
+
+    candidates: list of voicing arrays, eg. from VoicingIndex.lookup
+    cost: MovementCost
+    keep: when cost is not separable, only the keep candidates of each
+          chord with the lowest bound on a whole path through them (see
+          _path_bounds) go through the exact O(keep^2) step; the result
+          is exact when no dropped candidate has a bound below its total,
+          None keeps them all
+    chunk: max entries of a dense cost matrix held at once
+    returns (list of indices into each candidate array, total cost)
+    '''
+    cost = MovementCost() if cost is None else cost
+    assert all(len(c) for c in candidates), "every chord needs a voicing"
+    if len(candidates) == 0:
+        return [], 0.0
+    if cost.separable:
+        return _trace(*_separable_path(candidates, cost))
+
+    if keep is None:
+        return _trace(*_dense_path(candidates, cost, chunk))
+    kept = [np.argsort(b, kind='stable')[:keep]
+            for b in _path_bounds(candidates, cost)]
+    path, total = _trace(*_dense_path([c[k] for c, k in zip(candidates, kept)],
+                                      cost, chunk))
+    return [int(k[i]) for k, i in zip(kept, path)], total
+
+def voice_progression(chords, cost=None, limit=None, index=None):
+    '''
+    fingerings for a list of lib.notes.Chord with the least hand movement
+    limit: only consider the limit easiest voicings of each chord
+    returns fret strings, eg. ['x32010', '133211', ...]
+    '''
+    index = load_voicings() if index is None else index
+    candidates = []
+    for chord in chords:
+        assert chord.root is not None, "unknown chord {}".format(chord)
+        voicings = index.lookup(chord.root, chord.mode)
+        candidates.append(voicings if limit is None else voicings[:limit])
+    path, _ = min_movement_path(candidates, cost)
+    return [format_frets(c['frets'][i]) for c, i in zip(candidates, path)]
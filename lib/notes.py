@@ -1,3 +1,7 @@
+import warnings
+import numpy as np
+from lib.pitch import REST, encode, decode
+
 name2number = {
     'C': 0, 'Db': 1, 'C#': 1, 'D': 2, 'Eb': 3, 'D#': 3, 'E': 4, 'F': 5,
     'Gb': 6, 'F#': 6, 'G': 7, 'Ab': 8, 'G#': 8, 'A': 9, 'Bb': 10, 'A#': 10, 'B': 11
@@ -7,127 +11,247 @@ number2name = dict((val, n) for n, val in name2number.items())
 NOTES = list(number2name.values())
 
 class Note:
+    '''
+    pitch class, interned: there is exactly one Note object per pitch class
+
+    eg. Note('C#') is Note('Db') is Note(1)
+    '''
+    __slots__ = ('rep', 'name')
 
-    def __init__(self, name):
+    def __new__(cls, name):
+        if type(name) is Note:
+            return name
         if type(name) == int:
-            self.rep = name % 12
-        else:
-            allowed = 'ABCDEFG'
-            assert name[0] in allowed, 'Not valid name, need in {}'.format(allowed)
-            number_rep = name2number[name[0]]
-            if len(name) > 1:
-                for i in range(1, len(name)):
-                    assert name[i] in '#b', "# or b needed"
-                    if name[i] == '#':
-                        number_rep += 1
-                    else:
-                        number_rep -= 1
-            self.rep = number_rep % 12 # todo: think about whether wrap around
-
-        self.name = number2name[self.rep]
+            return _NOTE_TABLE[name % 12]
+        note = _NAME2NOTE.get(name)
+        if note is None:
+            note = _NOTE_TABLE[Note.parse_(name)]
+            _NAME2NOTE[name] = note
+        return note
+
+    @staticmethod
+    def parse_(name):
+        allowed = 'ABCDEFG'
+        assert name[0] in allowed, 'Not valid name, need in {}'.format(allowed)
+        number_rep = name2number[name[0]]
+        if len(name) > 1:
+            for i in range(1, len(name)):
+                assert name[i] in '#b', "# or b needed"
+                if name[i] == '#':
+                    number_rep += 1
+                else:
+                    number_rep -= 1
+        return number_rep % 12 # todo: think about whether wrap around
+
+    @classmethod
+    def build_(cls, rep):
+        note = object.__new__(cls)
+        object.__setattr__(note, 'rep', rep)
+        object.__setattr__(note, 'name', number2name[rep])
+        return note
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Note is immutable')
+
+    def __reduce__(self):
+        return (Note, (self.rep,))
 
     def __repr__(self):
         return self.name
 
+    def __eq__(self, other):
+        if type(other) is not Note:
+            return NotImplemented
+        return self.rep == other.rep
+
+    def __hash__(self):
+        return hash(self.rep)
+
     def __add__(self, other_interval):
         assert type(other_interval) is Interval
-        return Note(other_interval.rep + self.rep)
+        return _NOTE_TABLE[(self.rep + other_interval.rep) % 12]
 
     def __sub__(self, other):
         assert type(other) is Note
         # todo: think about whether wrap around
-        return Interval((self.rep - other.rep) % 12) 
+        return _INTERVAL_TABLE[(self.rep - other.rep) % 12 - _MIN_INTERVAL]
+
+_NOTE_TABLE = tuple(Note.build_(rep) for rep in range(12))
+_NAME2NOTE = dict((name, _NOTE_TABLE[rep]) for name, rep in name2number.items())
+
+NAMED_INTERVALS = ('m2', 'M2', 'm3', 'M3', 'P4', 'tritone',
+                   'P5', 'm6', 'M6', 'm7', 'M7')
 
 class Interval:
     '''
-    distance measure for music
-    
-    eg. Interval('m2') == Interval(1) == 1 == 'm2'
-    '''
-    def __init__(self, name):
-        named_interval = ['m2', 'M2', 'm3', 'M3', 'P4', 'tritone',
-                          'P5', 'm6', 'M6', 'm7', 'M7']
-        self.name2rep = lambda x: 1 + named_interval.index(x)
-        self.rep2name = lambda n: str(n) if (n<=0 or n>=12) else named_interval[n-1]
-        
+    distance measure for music, interned like Note
+
+    eg. Interval('m2') == Interval(1) == 1, Interval(1).name == 'm2'
+
+    Interval('m2') == 'm2' still holds but is deprecated and warns: a name
+    does not hash like its interval, so the two can not share a set or
+    dict; compare .name, or build Interval(name), instead
+    '''
+    __slots__ = ('rep', 'name')
+
+    def __new__(cls, name):
+        if type(name) is Interval:
+            return name
         if type(name) == int:
             number_rep = name
         else:
-            assert name in named_interval,\
-                "not valide name, need in {}".format(named_interval)
-            number_rep = self.name2rep(name)
+            assert name in NAMED_INTERVALS,\
+                "not valide name, need in {}".format(NAMED_INTERVALS)
+            number_rep = 1 + NAMED_INTERVALS.index(name)
+        return Interval.lookup_(number_rep)
+
+    @staticmethod
+    def lookup_(rep):
+        idx = rep - _MIN_INTERVAL
+        if 0 <= idx < len(_INTERVAL_TABLE):
+            return _INTERVAL_TABLE[idx]
+        # intervals outside the prebuilt range are interned on demand
+        interval = _EXTRA_INTERVALS.get(rep)
+        if interval is None:
+            interval = _EXTRA_INTERVALS[rep] = Interval.build_(rep)
+        return interval
+
+    @classmethod
+    def build_(cls, rep):
+        interval = object.__new__(cls)
+        object.__setattr__(interval, 'rep', rep)
+        object.__setattr__(interval, 'name', Interval.rep2name(rep))
+        return interval
+
+    @staticmethod
+    def rep2name(n):
+        return str(n) if (n<=0 or n>=12) else NAMED_INTERVALS[n-1]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Interval is immutable')
+
+    def __reduce__(self):
+        return (Interval, (self.rep,))
 
-        self.rep = number_rep
-        self.name = name
-        
     def __repr__(self):
-        return self.rep2name(self.rep)
-    
+        return self.name
+
     def __add__(self, other):
         if type(other) == Interval:
-            return Interval(other.rep + self.rep)
+            return Interval.lookup_(other.rep + self.rep)
         elif type(other) == Note:
-            return Note(other.rep + self.rep)
+            return _NOTE_TABLE[(other.rep + self.rep) % 12]
         else:
-            raise Error("not implemented")
+            return NotImplemented
 
     def __eq__(self, other):
-        if type(other) != Interval:
-            other = Interval(other)
-        return self.rep == other.rep
-        
+        if type(other) is Interval:
+            return self.rep == other.rep
+        if type(other) == int: # hashes like the int, names would not
+            return self.rep == other
+        if other in NAMED_INTERVALS:
+            warnings.warn("comparing an Interval to a name is deprecated, "
+                          "compare .name or Interval(name)",
+                          DeprecationWarning, stacklevel=2)
+            return self.rep == 1 + NAMED_INTERVALS.index(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.rep)
+
+# prebuild every interval within two octaves either way
+_MIN_INTERVAL, _MAX_INTERVAL = -24, 24
+_INTERVAL_TABLE = tuple(Interval.build_(rep)
+                        for rep in range(_MIN_INTERVAL, _MAX_INTERVAL + 1))
+_EXTRA_INTERVALS = {}
+
+MODES = ('ionian', 'dorian', 'phrygian', 'lydian', 'mixolydian',
+         'aeolian', 'locrian')
+MINOR_MODES = ('natural', 'harmonic', 'melodic')
+
+_IONIAN_STEPS = [2, 2, 1, 2, 2, 2, 1]
+SCALE_PATTERNS = dict(
+    [(mode, [0] + _IONIAN_STEPS[i:] + _IONIAN_STEPS[:i])
+     for i, mode in enumerate(MODES)] +
+    [('natural', [0, 2, 1, 2, 2, 1, 2, 2]),
+     ('harmonic', [0, 2, 1, 2, 2, 1, 3, 1]), # #7
+     ('melodic', [0, 2, 1, 2, 2, 2, 2, 1, # #6 and #7 up
+                  -2, -2, -1, -2, -2, -1, -2])] # down is natural
+)
+
+def scale_mode(major=True, minor_mode='natural', mode=None):
+    '''
+    name of the scale pattern in SCALE_PATTERNS
+    mode can be a church mode name or number (0 is ionian) or a minor mode
+    '''
+    if mode is None:
+        assert minor_mode in MINOR_MODES,\
+            "minor mode must be in {}".format(list(MINOR_MODES))
+        return 'ionian' if major else minor_mode
+    if type(mode) == int:
+        return MODES[mode]
+    mode = mode.lower()
+    assert mode in SCALE_PATTERNS,\
+        "mode must be in {}".format(list(SCALE_PATTERNS))
+    return mode
+
 class Scale:
+    '''
+    immutable; prefer get_scale, which hands out shared prebuilt scales
+    '''
+    __slots__ = ('root_note', 'mode', 'major', 'minor_mode',
+                 'notes', 'pitches')
 
-    def __init__(self, root_note, major=True, minor_mode='natural'):
+    def __init__(self, root_note, major=True, minor_mode='natural', mode=None):
 
         '''
         minor mode:
         natural: just plain
         harmonic: #7
         melodic: #6 and #7 up, down is natural
-        '''
-
-        assert minor_mode in ['harmonic', 'melodic', 'natural'],\
-            "minor mode must be in ['harmonic', 'melodic', 'natural']"
 
-        if type(root_note) is not Note:
-            root_note = Note(root_note)
-        self.root_note = root_note
+        mode: overrides major and minor_mode, see scale_mode
+        '''
+        mode = scale_mode(major, minor_mode, mode)
+        root_note = Note(root_note)
+        notes = self.fill_pattern_(root_note, SCALE_PATTERNS[mode])
+        # degree 1..7 -> pitch class, ascending
+        pitches = np.array([n.rep for n in notes[:7]], dtype=np.int8)
+        pitches.flags.writeable = False
 
-        self.major = major
-        self.minor_mode = minor_mode
+        for name, value in [('root_note', root_note), ('mode', mode),
+                            ('major', (notes[2] - root_note) == Interval('M3')),
+                            ('minor_mode', mode if mode in MINOR_MODES
+                             else minor_mode),
+                            ('notes', tuple(notes)), ('pitches', pitches)]:
+            object.__setattr__(self, name, value)
 
-        if self.major:
-            pattern = [0, 2, 2, 1, 2, 2, 2, 1]
-            notes = self.fill_pattern_(pattern)
-        else:
-            if minor_mode == 'natural':
-                pattern = [0, 2, 1, 2, 2, 1, 2, 2]
-                notes = self.fill_pattern_(pattern)
-            elif minor_mode == 'harmonic':
-                pattern = [0, 2, 1, 2, 2, 1, 3, 1]
-                notes = self.fill_pattern_(pattern)
-            else: # melodic
-                pattern = [0, 2, 1, 2, 2, 2, 2, 1, # up
-                           -2, -2, -1, -2, -2, -1, -2]
-                notes = self.fill_pattern_(pattern)
-                
-        self.notes = notes
-
-    def fill_pattern_(self, pattern):
+    @staticmethod
+    def fill_pattern_(root_note, pattern):
         notes = []
         cumsum = 0
         for p in pattern:
             cumsum += p
-            notes.append(self.root_note + Interval(cumsum))
+            notes.append(root_note + Interval(cumsum))
         return notes
 
+    def __setattr__(self, name, value):
+        raise AttributeError('Scale is immutable')
+
+    def __reduce__(self):
+        return (get_scale, (self.root_note, True, 'natural', self.mode))
+
     def __repr__(self):
         res = ""
-        if self.major: res += 'major: '
-        else: res += '{} minor: '.format(self.minor_mode)
+        if self.mode == 'ionian': res += 'major: '
+        elif self.mode in MINOR_MODES: res += '{} minor: '.format(self.mode)
+        else: res += '{}: '.format(self.mode)
         return res + ','.join(map(str, self.notes))
 
+    def degree(self, degree):
+        '''note of a 1 based degree, wraps around the octave'''
+        return _NOTE_TABLE[self.pitches[(degree - 1) % 7]]
+
     def chord(self, chord_number):
         assert chord_number < 8 and chord_number > 0, "chord number in [1,7]"
         pattern = [0, 2, 4] 
@@ -135,16 +259,182 @@ class Scale:
         notes = [self.notes[i] for i in pattern]
         return Chord(notes)
 
+class ScaleRegistry:
+    '''
+    every root x mode in SCALE_PATTERNS, built once on first use
+    lookups with previously seen arguments are a single dict lookup
+    '''
+    def __init__(self):
+        self.scales = None # (root rep, mode) -> Scale
+        self.lookup = {} # raw get arguments -> Scale
+
+    def build_(self):
+        self.scales = dict(((root.rep, mode), Scale(root, mode=mode))
+                           for root in _NOTE_TABLE
+                           for mode in SCALE_PATTERNS)
+
+    def get(self, root_note, mode='ionian'):
+        key = (root_note, mode)
+        scale = self.lookup.get(key)
+        if scale is None:
+            if self.scales is None:
+                self.build_()
+            scale = self.scales[(Note(root_note).rep, scale_mode(mode=mode))]
+            self.lookup[key] = scale
+        return scale
+
+    def __len__(self):
+        if self.scales is None:
+            self.build_()
+        return len(self.scales)
+
+SCALES = ScaleRegistry()
+
+def get_scale(root_note, major=True, minor_mode='natural', mode=None):
+    '''same arguments as Scale, but returns the shared registry scale'''
+    if mode is None:
+        mode = scale_mode(major, minor_mode)
+    return SCALES.get(root_note, mode)
+
+################## chord recognition ##################
+'''
+a chord is recognized from its pitch class set, a 12 bit mask where
+bit i is set when pitch class i (C is 0) sounds, plus its bass
+'''
+# (symbol, semitones above the root), earlier entries win ambiguities
+CHORD_QUALITIES = (
+    # triads
+    ('M', (0, 4, 7)), ('m', (0, 3, 7)), ('o', (0, 3, 6)), ('+', (0, 4, 8)),
+    # sevenths
+    ('7', (0, 4, 7, 10)), ('M7', (0, 4, 7, 11)), ('m7', (0, 3, 7, 10)),
+    ('m7b5', (0, 3, 6, 10)), ('o7', (0, 3, 6, 9)), ('mM7', (0, 3, 7, 11)),
+    ('+7', (0, 4, 8, 10)), ('+M7', (0, 4, 8, 11)),
+    # ninths, so they are not read as a seventh over a foreign bass; the
+    # ninth goes last, intervals are in inversion order
+    ('9', (0, 4, 7, 10, 2)), ('M9', (0, 4, 7, 11, 2)), ('m9', (0, 3, 7, 10, 2)),
+    # suspended
+    ('sus2', (0, 2, 7)), ('sus4', (0, 5, 7)), ('7sus4', (0, 5, 7, 10)),
+    # added tones
+    ('6', (0, 4, 7, 9)), ('m6', (0, 3, 7, 9)), ('add9', (0, 2, 4, 7)),
+    ('madd9', (0, 2, 3, 7)), ('add4', (0, 4, 5, 7)),
+    # power chord, only when nothing else fits
+    ('5', (0, 7)),
+)
+CHORD_SYMBOLS = tuple(symbol for symbol, _ in CHORD_QUALITIES)
+SLASH = -1 # inversion of a chord over a bass that is not a chord tone
+
+def pc_mask(notes):
+    '''pitch class set of notes (Note, names or ints) as a 12 bit mask'''
+    mask = 0
+    for note in notes:
+        mask |= 1 << Note(note).rep
+    return mask
+
+def pc_masks(pitches):
+    '''
+    batch pc_mask over the last axis of an int array (eg. NoteArray.rep)
+    pad short chords by repeating one of their notes
+    '''
+    pitches = np.asarray(pitches)
+    return np.bitwise_or.reduce(1 << (pitches % 12), axis=-1)
+
+def _build_chord_tables():
+    n_masks = 1 << 12
+    # quality of the chord rooted at each pitch class, -1 if none
+    quality_at = np.full((n_masks, 12), -1, dtype=np.int8)
+    # best reading of each mask ignoring the bass
+    root = np.full(n_masks, -1, dtype=np.int8)
+    quality = np.full(n_masks, -1, dtype=np.int8)
+    # position of (bass - root) % 12 among a quality's intervals
+    inversion = np.full((len(CHORD_QUALITIES), 12), SLASH, dtype=np.int8)
+    for q in range(len(CHORD_QUALITIES) - 1, -1, -1): # best priority last
+        intervals = CHORD_QUALITIES[q][1]
+        inversion[q, list(intervals)] = np.arange(len(intervals))
+        for r in range(11, -1, -1):
+            mask = pc_mask([r + i for i in intervals])
+            quality_at[mask, r] = q
+            root[mask], quality[mask] = r, q
+    for table in (quality_at, root, quality, inversion):
+        table.flags.writeable = False
+    return quality_at, root, quality, inversion
+
+CHORD_QUALITY_AT, CHORD_ROOT, CHORD_QUALITY, CHORD_INVERSION = \
+    _build_chord_tables()
+# the same tables as tuples, one chord at a time is faster without numpy
+_QUALITY_AT, _ROOT, _QUALITY, _INVERSION = (
+    tuple(map(tuple, CHORD_QUALITY_AT.tolist())), tuple(CHORD_ROOT.tolist()),
+    tuple(CHORD_QUALITY.tolist()), tuple(map(tuple, CHORD_INVERSION.tolist())))
+
+def identify_chords(masks, basses=None):
+    '''
+    batch chord recognition by table lookup
+    masks: int array of pitch class masks, see pc_masks
+    basses: pitch class of the lowest note, None means root position
+
+    returns int arrays (roots, qualities, inversions), qualities index
+    CHORD_QUALITIES and are -1 when unknown, inversions is 0 for root
+    position, 1 for first inversion ... and SLASH for a foreign bass
+    '''
+    masks = np.asarray(masks, dtype=np.int64)
+    roots = CHORD_ROOT[masks].astype(np.int64)
+    qualities = CHORD_QUALITY[masks].astype(np.int64)
+    if basses is None:
+        return roots, qualities, np.where(qualities >= 0, 0, SLASH)
+
+    basses = np.asarray(basses, dtype=np.int64) % 12
+    # a foreign bass: read the chord without it
+    bass_bit = 1 << basses
+    upper = masks & ~bass_bit
+    slash = (qualities < 0) & (CHORD_QUALITY[upper] >= 0)
+    roots = np.where(slash, CHORD_ROOT[upper], roots)
+    qualities = np.where(slash, CHORD_QUALITY[upper], qualities)
+
+    # prefer the reading rooted on the bass, eg. Am7 over C6 for A C E G
+    rooted = CHORD_QUALITY_AT[masks, basses].astype(np.int64)
+    use_bass = (rooted >= 0) & ~slash
+    roots = np.where(use_bass, basses, roots)
+    qualities = np.where(use_bass, rooted, qualities)
+
+    inversions = CHORD_INVERSION[qualities, (basses - roots) % 12]
+    inversions = np.where(slash | (qualities < 0) | (masks & bass_bit == 0),
+                          SLASH, inversions)
+    return roots, qualities, inversions
+
+def identify_chord(notes):
+    '''
+    notes: Note, names or ints, the first one is the bass
+    returns (root Note, quality symbol, inversion) or None if unknown
+    eg. identify_chord(['E', 'G', 'C']) == (C, 'M', 1)
+    '''
+    bass = Note(notes[0]).rep
+    mask = pc_mask(notes)
+    # identify_chords for one chord, the bass is always in mask
+    upper = mask & ~(1 << bass)
+    if _QUALITY[mask] < 0 and _QUALITY[upper] >= 0: # a foreign bass
+        return _NOTE_TABLE[_ROOT[upper]], CHORD_SYMBOLS[_QUALITY[upper]], SLASH
+    root, quality = _ROOT[mask], _QUALITY[mask]
+    if _QUALITY_AT[mask][bass] >= 0:
+        root, quality = bass, _QUALITY_AT[mask][bass]
+    if quality < 0:
+        return None
+    return (_NOTE_TABLE[root], CHORD_SYMBOLS[quality],
+            _INVERSION[quality][(bass - root) % 12])
+
 class Chord:
     '''
     chords are just more than 3 notes together
-    assume no inversion applied (sorted)
+    the first note is the bass, see CHORD_QUALITIES for recognized modes
     
-    current modes support:
+    eg. modes:
     M: major (1, 3, 5), occur in 1 4 5 major scale or 3 6 7 minor scale
     m: minor (1, 3b, 5), 
     o: diminished (1, 3b, 5b)
     +: augmented (1, 3, 5#)
+    7, M7, m7, m7b5 (half diminished), o7 (diminished 7)
+    sus2, sus4, 6, m6, add9 ...
+
+    root is None and mode is "" when not recognized
+    inversion is 0 in root position and SLASH over a foreign bass
     '''
 
     def __init__(self, notes):
@@ -156,28 +446,182 @@ class Chord:
             self.notes.append(note)
 
         # determine chord type
-        self.mode = ""        
-        notes = self.notes
-        if notes[1] - notes[0] == 'M3': # M3
-            if notes[2] - notes[0] == 'P5': # P5
-                self.mode = 'M' # major
-            elif notes[2] - notes[0] == 'm6':
-                self.mode = '+' # augmented
-        elif notes[1] - notes[0] == 'm3': # m3
-            if notes[2] - notes[0] == 'P5': # P5
-                self.mode = 'm' # minor
-            elif notes[2] - notes[0] == 'tritone': # tritone
-                self.mode = 'o' # diminished
-        elif notes[1] - notes[0] == 'P4': # P4
-            if notes[2] - notes[0] == 'P5': # P5
-                self.mode = 'sus4' # sus4 cord
-        elif notes[1] - notes[0] == 'M2': # M2
-            if notes[2] - notes[0] == 'P5': # P5
-                self.mode = 'sus2' # sus2 cord
+        self.mode, self.root, self.inversion = "", None, 0
+        res = identify_chord(self.notes)
+        if res is not None:
+            self.root, self.mode, self.inversion = res
+
+    @property
+    def name(self):
+        '''eg. C, Am7, G/B, D/C'''
+        if self.root is None:
+            return ''
+        name = self.root.name + ('' if self.mode == 'M' else self.mode)
+        if self.inversion != 0:
+            name += '/' + self.notes[0].name
+        return name
 
     def __repr__(self):
         res = self.mode
         return res + self.notes.__repr__()
-            
 
-    
+################## array backed notes ##################
+'''
+absolute pitches for whole corpora at once, numbered like LilyPond
+absolute mode (c -> 0, c' -> 12, c, -> -12) with the codec in lib/pitch.py
+'''
+
+def _as_reps(x):
+    '''int, Interval, Note or array like -> int array'''
+    if isinstance(x, (NoteArray, IntervalArray)):
+        return x.rep
+    if type(x) in (Interval, Note):
+        return x.rep
+    return np.asarray(x, dtype=np.int32)
+
+class IntervalArray:
+    '''
+    array of Interval, stored as signed semitones
+
+    eg. IntervalArray([1, 7]).names() == ['m2', 'P5']
+    names and to_intervals keep the shape, nested lists for 2-D
+    '''
+    __slots__ = ('rep',)
+
+    def __init__(self, intervals):
+        if isinstance(intervals, IntervalArray):
+            rep = intervals.rep
+        elif len(intervals) and type(intervals[0]) is Interval:
+            rep = np.array([i.rep for i in intervals], dtype=np.int32)
+        else:
+            rep = np.array(intervals, dtype=np.int32)
+        rep.flags.writeable = False
+        self.rep = rep
+
+    def __len__(self):
+        return len(self.rep)
+
+    @property
+    def shape(self):
+        return self.rep.shape
+
+    def __getitem__(self, idx):
+        rep = self.rep[idx]
+        if rep.ndim == 0:
+            return Interval(int(rep))
+        return IntervalArray(rep)
+
+    def __repr__(self):
+        return 'IntervalArray({})'.format(self.rep)
+
+    def __add__(self, other):
+        if isinstance(other, NoteArray):
+            return other + self
+        return IntervalArray(self.rep + _as_reps(other))
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return IntervalArray(-self.rep)
+
+    def reduce(self):
+        '''fold compound intervals into one octave, direction is upward'''
+        return IntervalArray(self.rep % 12)
+
+    def _nested(self, f):
+        flat = np.empty(self.rep.size, dtype=object)
+        flat[:] = [f(n) for n in self.rep.ravel().tolist()]
+        return flat.reshape(self.rep.shape).tolist()
+
+    def names(self):
+        return self._nested(Interval.rep2name)
+
+    def to_intervals(self):
+        return self._nested(Interval)
+
+class NoteArray:
+    '''
+    array of absolute pitches, c -> 0, c' -> 12, REST for rests, see
+    lib/pitch.py
+
+    eg. NoteArray.from_lily(["c'", "e'"]).transpose(2).to_lily() == ["d'", "fis'"]
+    '''
+    __slots__ = ('rep',)
+
+    def __init__(self, pitches):
+        if isinstance(pitches, NoteArray):
+            rep = pitches.rep
+        else:
+            rep = np.array(pitches, dtype=np.int32)
+        rep.flags.writeable = False
+        self.rep = rep
+
+    @classmethod
+    def from_notes(cls, notes, octave=0):
+        '''Note (pitch class) list placed in the given octave, c -> 0'''
+        return cls(np.fromiter((Note(n).rep for n in notes), dtype=np.int32,
+                               count=len(notes)) + 12 * octave)
+
+    @classmethod
+    def from_lily(cls, notes):
+        '''LilyPond absolute note names, eg. ["c'", "fis", "bes,", "r"]'''
+        return cls(encode(notes))
+
+    def to_notes(self):
+        return [_NOTE_TABLE[pc] for pc in (self.rep % 12).ravel().tolist()]
+
+    def to_lily(self):
+        return decode(self.rep.ravel())
+
+    def __len__(self):
+        return len(self.rep)
+
+    @property
+    def shape(self):
+        return self.rep.shape
+
+    def __getitem__(self, idx):
+        rep = self.rep[idx]
+        if rep.ndim == 0:
+            return _NOTE_TABLE[int(rep) % 12]
+        return NoteArray(rep)
+
+    def __repr__(self):
+        return 'NoteArray({})'.format(self.rep)
+
+    def transpose(self, interval):
+        '''
+        interval: semitones, Interval or IntervalArray (broadcast)
+        rests stay rests
+        '''
+        return NoteArray(np.where(self.rep == REST, REST,
+                                  self.rep + _as_reps(interval)))
+
+    def __add__(self, interval):
+        assert not isinstance(interval, (NoteArray, Note)),\
+            "can only add intervals to notes"
+        return self.transpose(interval)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        '''NoteArray - NoteArray is IntervalArray, otherwise transpose down'''
+        if isinstance(other, NoteArray):
+            return IntervalArray(self.rep - other.rep)
+        return self.transpose(-_as_reps(other))
+
+    def intervals(self):
+        '''melodic intervals between consecutive notes'''
+        return IntervalArray(np.diff(self.rep))
+
+    def pairwise(self, other=None):
+        '''
+        interval matrix, res[i, j] is from self[i] up to other[j]
+        other defaults to self
+        '''
+        other = self if other is None else NoteArray(other)
+        return IntervalArray(other.rep[None, :] - self.rep[:, None])
+
+    def pitch_classes(self):
+        '''reduce into the lowest octave, i.e. 0..11 like Note'''
+        return NoteArray(self.rep % 12)
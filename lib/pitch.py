@@ -0,0 +1,102 @@
+'''
+LilyPond pitch codec: note names <-> absolute numbers
+
+numbers follow absolute mode: c -> 0, c' -> 12, c, -> -12, fis'' -> 30
+rests ('r', also 'R' and 's' spacers) encode to REST
+
+single tokens go through precomputed tables and a bounded cache,
+encode/decode work on whole note sequences as numpy arrays; the one
+codec for lib.notes.NoteArray and the composition scripts
+
+example usage:
+encode("c'4 e' r8 g'".split()) # array([12, 16, REST, 19])
+decode([12, 16, REST, 19]) # ["c'", "e'", 'r', "g'"]
+'''
+from functools import lru_cache
+import re
+import numpy as np
+
+STEPS = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+ACCIDENTALS = {'': 0, 'is': 1, 'es': -1, 'isis': 2, 'eses': -2,
+               's': -1} # as in 'as' and 'es'
+NAMES = ['c', 'cis', 'd', 'ees', 'e', 'f', 'fis', 'g', 'gis', 'a', 'bes', 'b']
+RESTS = ('r', 'R', 's')
+REST = np.iinfo(np.int16).min # also fits the int16 pitch of score events
+MAX_OCTAVE = 5 # octave marks covered by the tables
+
+# pitch, then whatever follows it (duration, tie, articulation)
+TOKEN = re.compile(r"([a-g](?:isis|eses|is|es|s)?|[rRs])([',]*)(.*)")
+
+def _octave(marks):
+    return 12 * (marks.count("'") - marks.count(","))
+
+# every note name with up to MAX_OCTAVE octave marks, and the rests
+PITCH_TABLE = dict(
+    [(step + acc + mark * k, n + a + (12 if mark == "'" else -12) * k)
+     for step, n in STEPS.items()
+     for acc, a in ACCIDENTALS.items()
+     if not (acc == 's' and step not in 'ae') # only as, es
+     for mark in "',"
+     for k in range(MAX_OCTAVE + 1)] +
+    [(r, REST) for r in RESTS]
+)
+
+_DECODE_LOW = -12 * MAX_OCTAVE
+DECODE_TABLE = np.array(
+    [NAMES[n % 12] + ("," if n < 0 else "'") * abs(n // 12)
+     for n in range(_DECODE_LOW, 12 * (MAX_OCTAVE + 1))], dtype=object)
+
+@lru_cache(maxsize=4096)
+def split_token(token):
+    '''"fis''8.~" -> (30, "8.~"), "r4" -> (REST, "4")'''
+    m = TOKEN.fullmatch(token)
+    assert m is not None, "have unparsed note {}".format(token)
+    pitch, marks, rest = m.groups()
+    if pitch in RESTS:
+        assert marks == '', "rest with octave marks {}".format(token)
+        return REST, rest
+    acc = pitch[1:]
+    assert acc != 's' or pitch[0] in 'ae', "have unparsed note {}".format(token)
+    return STEPS[pitch[0]] + ACCIDENTALS[acc] + _octave(marks), rest
+
+def note2number(note):
+    '''a bare note name or rest, eg. "fis''" -> 30'''
+    n = PITCH_TABLE.get(note)
+    if n is None:
+        n, rest = split_token(note)
+        assert rest == '', "have unparsed note {}".format(rest)
+    return n
+
+def number2note(n):
+    '''
+    inverse of note2number, spelled like NAMES
+    but this is still ambiguous: e.g., fes = e = disis,
+    need to be given scale to determine what is, now not supported
+    '''
+    if n == REST:
+        return 'r'
+    if _DECODE_LOW <= n < 12 * (MAX_OCTAVE + 1):
+        return DECODE_TABLE[n - _DECODE_LOW]
+    note, pitch = NAMES[n % 12], n // 12
+    return note + ("," if pitch < 0 else "'") * abs(pitch)
+
+def encode(tokens):
+    '''
+    note tokens (durations and ties allowed) -> int32 array, REST for rests
+    '''
+    table = PITCH_TABLE
+    def pitch(token):
+        n = table.get(token)
+        return split_token(token)[0] if n is None else n
+    return np.fromiter(map(pitch, tokens), dtype=np.int32)
+
+def decode(numbers):
+    '''int array -> list of note names, 'r' for REST'''
+    numbers = np.asarray(numbers, dtype=np.int64)
+    idx = numbers - _DECODE_LOW
+    inside = (idx >= 0) & (idx < len(DECODE_TABLE))
+    notes = DECODE_TABLE[np.where(inside, idx, 0)]
+    if not inside.all():
+        outside = np.flatnonzero(~inside)
+        notes[outside] = [number2note(n) for n in numbers[outside].tolist()]
+    return notes.tolist()
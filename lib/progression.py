@@ -0,0 +1,123 @@
+'''
+diatonic harmony as a markov chain over scale degrees 1..7
+
+- method 1
+[[https://www.artofcomposing.com/08-diatonic-harmony][art of composing]]
+tonic pre-dominant dominant
+(1 6) (4 2) (7 5)
+
+rules, can go to the right, but must follow arrows when moving left
+left edges: (6, 1), (5, 6), (5, 1), (7, 1), (5, 4)
+
+- method 2
+https://www.youtube.com/watch?v=fXIEmMDwc7E
+(1, any), (2, 5), (3, 6), (4, 1), (4, 5), (5, 1), (6, 2)
+different from method 1 in (3, 6) and (4, 1) and (1, 3)
+
+a progression starts from 1 and is sampled until it hits 1 again
+
+example usage:
+sampler = ProgressionSampler(EDGES)
+for progression in sampler.sample(get_scale('C'), 10000, seed=0):
+    print(progression) # [(1, M[C, E, G]), (4, M[F, A, C]), ...]
+'''
+import numpy as np
+
+EDGES = { # method 1
+    1: [2, 3, 4, 5, 6], # (1,3) may not work
+    2: [7, 5],
+    3: [6], # 6 may not work
+    4: [2, 7, 5, 1], # 1 may not work
+    5: [6, 1, 4],
+    6: [4, 2, 7, 5, 1],
+    7: [5, 1]
+}
+
+EDGES_METHOD2 = {
+    1: [2, 3, 4, 5, 6, 7],
+    2: [5],
+    3: [6],
+    4: [1, 5],
+    5: [1],
+    6: [2],
+    7: [1] # not in the video, the leading tone resolves home
+}
+
+def transition_matrix(edges, weights=None, start=1):
+    '''
+    (7, 7) row stochastic matrix, entry [i, j] is the probability of
+    going from degree i+1 to degree j+1
+    weights: same shape as edges, uniform (like np.random.choice) if None
+    start: every degree reachable from it must lead somewhere, rows of
+           unreachable degrees may be all 0
+    '''
+    P = np.zeros((7, 7))
+    for degree, nexts in edges.items():
+        w = np.ones(len(nexts)) if weights is None else \
+            np.asarray(weights[degree], dtype=np.float64)
+        for n, p in zip(nexts, w):
+            P[degree - 1, n - 1] += p
+    totals = P.sum(axis=1, keepdims=True)
+    P = np.divide(P, totals, out=np.zeros_like(P), where=totals > 0)
+
+    reached, todo = set(), [start - 1]
+    while todo:
+        i = todo.pop()
+        if i not in reached:
+            reached.add(i)
+            todo.extend(np.flatnonzero(P[i]).tolist())
+    for i in sorted(reached):
+        assert np.isclose(P[i].sum(), 1), \
+            "degree {} is reachable but leads nowhere".format(i + 1)
+    return P
+
+class ProgressionSampler:
+    '''
+    samples many progressions at once, one vectorized step for all of them
+
+    edges: rule graph, eg. EDGES or EDGES_METHOD2
+    start: degree a progression starts from and ends on
+    max_len: progressions still going after max_len chords are closed
+             by a forced return to start
+    '''
+    def __init__(self, edges=EDGES, weights=None, start=1, max_len=64):
+        self.P = transition_matrix(edges, weights, start)
+        self.cdf = np.cumsum(self.P, axis=1)
+        self.cdf[:, -1] = 1 # guard against rounding
+        self.start = start
+        self.max_len = max_len
+
+    def sample_degrees(self, n, rng=None):
+        '''
+        returns (degrees, lengths): degrees is an (n, max_len + 1) int8
+        array padded with 0, row i is degrees[i, :lengths[i]]
+        '''
+        rng = np.random.default_rng() if rng is None else rng
+        degrees = np.zeros((n, self.max_len + 1), dtype=np.int8)
+        lengths = np.full(n, self.max_len + 1)
+        degrees[:, 0] = self.start
+        state = np.full(n, self.start - 1)
+        alive = np.arange(n)
+        for t in range(1, self.max_len):
+            u = rng.random(len(alive))
+            state = (u[:, None] >= self.cdf[state]).sum(axis=1)
+            degrees[alive, t] = state + 1
+            done = state == self.start - 1
+            lengths[alive[done]] = t + 1
+            alive, state = alive[~done], state[~done]
+            if len(alive) == 0:
+                break
+        degrees[alive, self.max_len] = self.start
+        return degrees, lengths
+
+    def sample(self, scale, n, rng=None, seed=None):
+        '''
+        generator of n progressions, each a list of (degree, Chord)
+        scale: lib.notes.Scale, rng: np.random.Generator (or give seed)
+        '''
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        chords = [None] + [scale.chord(d) for d in range(1, 8)]
+        degrees, lengths = self.sample_degrees(n, rng)
+        for row, length in zip(degrees.tolist(), lengths.tolist()):
+            yield [(d, chords[d]) for d in row[:length]]